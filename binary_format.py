@@ -0,0 +1,197 @@
+"""
+Module: Binary (.npz) position/force files written alongside the .csv files
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import numpy
+import numpy as np
+
+# Import modules for dealing with files
+from zipfile import ZipFile, ZIP_STORED
+import struct
+import json
+import re
+import os
+
+# The extension of binary files
+BINARY_EXTENSION = ".npz"
+# The version of the binary format (stored in the schema)
+BINARY_VERSION = 1
+# The name of the schema inside a binary file
+SCHEMA_NAME = "schema.json"
+
+
+def binary_location(file_location):
+    """takes a .csv file location
+    - returns the location of the binary file written alongside it"""
+    return os.path.splitext(file_location)[0] + BINARY_EXTENSION
+
+
+def column_unit(col_name):
+    """takes a column name
+    - returns the unit in square brackets e.g. "x Force [µN]" -> "µN"
+    - returns an empty string if there is none"""
+    unit = re.search(r"\[([^\]]*)\]\s*$", col_name)
+    return "" if unit is None else unit.group(1)
+
+
+def full_schema(col_names, schema=None):
+    """takes the column names and any extra schema
+    - returns the schema to store in a binary file (with the version and units)"""
+    schema = dict(schema or {})
+    schema["version"] = BINARY_VERSION
+    schema["columns"] = list(col_names)
+    schema["units"] = [column_unit(col_name) for col_name in col_names]
+    return schema
+
+
+def write_binary_file(file_location, col_names, columns, schema=None):
+    """takes a file location, the column names, the columns and any extra schema
+    (e.g. pixel/micron ratio, force parameters, source folder)
+    - writes an uncompressed .npz file with one float64 array per column
+    - the schema (column names, units, ...) is stored as JSON in the same file
+    - the file is written to a temporary file first so it is never half written"""
+    schema = full_schema(col_names, schema)
+    temp_location = file_location + ".tmp"
+    # Stored (not compressed) so the columns can be read straight from the file
+    with ZipFile(temp_location, "w", compression=ZIP_STORED) as archive:
+        archive.writestr(SCHEMA_NAME, json.dumps(schema, ensure_ascii=False))
+        for index, column in enumerate(columns):
+            column = np.ascontiguousarray(column, dtype=np.float64)
+            with archive.open("col_" + str(index) + ".npy", "w") as npy_file:
+                np.lib.format.write_array(npy_file, column, allow_pickle=False)
+    os.replace(temp_location, file_location)
+
+
+class BinaryColumnWriter:
+    """writes a binary file a block of rows at a time (see write_binary_file)
+    - each column is kept in a temporary memory mapped .npy file until the end,
+    so the columns are never all in memory at once"""
+
+    def __init__(self, file_location, col_names, num_rows):
+        """init method for BinaryColumnWriter"""
+        self.file_location = file_location
+        self.col_names = list(col_names)
+        # The temporary .npy file for each column
+        self.column_locations = [
+            file_location + ".col_" + str(index) + ".tmp"
+            for index in range(len(self.col_names))
+        ]
+        self.columns = [
+            np.lib.format.open_memmap(
+                location, mode="w+", dtype=np.float64, shape=(num_rows,)
+            )
+            for location in self.column_locations
+        ]
+
+    def write(self, start, columns):
+        """takes the index of the first row and a block of columns
+        - writes the block's rows into each column"""
+        for column, block in zip(self.columns, columns):
+            column[start : start + len(block)] = block
+
+    def finish(self, schema=None):
+        """takes any extra schema
+        - writes the binary file from the temporary columns (then removes them)"""
+        schema = full_schema(self.col_names, schema)
+        # Close the memory maps (so the files can be copied and removed)
+        for column in self.columns:
+            column.flush()
+        self.columns = []
+        temp_location = self.file_location + ".tmp"
+        try:
+            with ZipFile(temp_location, "w", compression=ZIP_STORED) as archive:
+                archive.writestr(SCHEMA_NAME, json.dumps(schema, ensure_ascii=False))
+                for index, location in enumerate(self.column_locations):
+                    archive.write(location, "col_" + str(index) + ".npy")
+            os.replace(temp_location, self.file_location)
+        finally:
+            self.discard()
+
+    def discard(self):
+        """removes the temporary columns (without writing the binary file)"""
+        self.columns = []
+        for location in self.column_locations + [self.file_location + ".tmp"]:
+            if os.path.exists(location):
+                os.remove(location)
+
+
+def read_schema(file_location):
+    """takes the location of a binary file
+    - returns its schema (dict)
+    - returns None if it isn't a valid binary file"""
+    try:
+        with ZipFile(file_location) as archive:
+            schema = json.loads(archive.read(SCHEMA_NAME).decode("UTF-8"))
+    except (OSError, KeyError, ValueError):
+        return None
+    # If it is from a newer version of the app
+    if schema.get("version") != BINARY_VERSION:
+        return None
+    return schema
+
+
+def fresh_binary_location(file_location):
+    """takes the location of a .csv or .npz file
+    - returns the location of the binary file holding the same data
+    - a .csv file only has one if it was written alongside it (and the .csv
+    hasn't been changed since)
+    - returns None if there is none"""
+    if file_location[-4:] == BINARY_EXTENSION:
+        return file_location
+    if file_location[-4:] != ".csv":
+        return None
+    binary_loc = binary_location(file_location)
+    # If there is no binary file or the .csv is newer
+    if not os.path.exists(binary_loc) or not os.path.exists(file_location):
+        return None
+    if os.path.getmtime(binary_loc) < os.path.getmtime(file_location):
+        return None
+    # If the .csv has been changed since the binary file was written
+    schema = read_schema(binary_loc)
+    if schema is None or schema.get("csv_size") != os.path.getsize(file_location):
+        return None
+    return binary_loc
+
+
+def read_binary_columns(file_location):
+    """takes the location of a binary file
+    - returns (schema, columns) where each column is a float64 array
+    - each column is read straight from its place in the file (nothing is left
+    open, so the file can be replaced while the columns are still used)
+    - returns (None, []) if it isn't a valid binary file"""
+    schema = read_schema(file_location)
+    if schema is None:
+        return None, []
+    with open(file_location, "rb") as binary_file:
+        with ZipFile(binary_file) as archive:
+            infos = {info.filename: info for info in archive.infolist()}
+        columns = []
+        for index in range(len(schema["columns"])):
+            info = infos.get("col_" + str(index) + ".npy")
+            if info is None or info.compress_type != ZIP_STORED:
+                return None, []
+            # Skip the zip entry's local header (its name and extra field)
+            binary_file.seek(info.header_offset + 26)
+            name_length, extra_length = struct.unpack("<HH", binary_file.read(4))
+            binary_file.seek(info.header_offset + 30 + name_length + extra_length)
+            # Read the .npy header to find the shape and type of the array
+            version = np.lib.format.read_magic(binary_file)
+            if version == (1, 0):
+                header = np.lib.format.read_array_header_1_0(binary_file)
+            else:
+                header = np.lib.format.read_array_header_2_0(binary_file)
+            shape, _, dtype = header
+            # Read the array data
+            columns.append(
+                np.fromfile(binary_file, dtype=dtype, count=int(np.prod(shape)))
+            )
+    return schema, columns
+
+
+def binary_schema(file_location):
+    """takes the location of a .csv or .npz file
+    - returns the schema of its binary file (None if there is none)"""
+    binary_loc = fresh_binary_location(file_location)
+    return None if binary_loc is None else read_schema(binary_loc)
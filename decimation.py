@@ -0,0 +1,89 @@
+"""
+Module: Reducing the number of points drawn in long graphs
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Mathematical imports
+import numpy as np
+
+
+def lttb_indices(x_vals, y_vals, num_points):
+    """takes x and y arrays and the number of points to keep
+    - returns the indices of the points kept (Largest-Triangle-Three-Buckets)
+    - the first and last points are kept, and from each bucket in between
+    the point making the largest triangle with the last point kept and the
+    average of the next bucket
+    - the buckets are looped over (each is vectorised), so this is O(n)"""
+    num_vals = len(x_vals)
+    if num_points >= num_vals or num_points < 3:
+        return np.arange(num_vals)
+    x_vals = np.asarray(x_vals, dtype=np.float64)
+    y_vals = np.asarray(y_vals, dtype=np.float64)
+    # The edges of the num_points - 2 buckets (between the first and last points)
+    edges = np.linspace(1, num_vals - 1, num_points - 1).astype(np.int64)
+    counts = np.diff(edges)
+    # The average of each bucket, and the last point after the last bucket
+    next_x = np.append(np.add.reduceat(x_vals[:-1], edges[:-1]) / counts, 0)
+    next_y = np.append(np.add.reduceat(y_vals[:-1], edges[:-1]) / counts, 0)
+    next_x[-1], next_y[-1] = x_vals[-1], y_vals[-1]
+    indices = np.empty(num_points, dtype=np.int64)
+    indices[0], indices[-1] = 0, num_vals - 1
+    last = 0
+    for bucket in range(num_points - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        # Twice the area of each triangle (last point, this point, next average)
+        areas = np.abs(
+            (x_vals[last] - next_x[bucket + 1]) * (y_vals[start:stop] - y_vals[last])
+            - (x_vals[last] - x_vals[start:stop]) * (next_y[bucket + 1] - y_vals[last])
+        )
+        last = start + int(np.argmax(areas))
+        indices[bucket + 1] = last
+    return indices
+
+
+def min_max_indices(y_vals, num_points):
+    """takes a y array and the (rough) number of points to keep
+    - returns the indices of the points kept (sorted)
+    - the values are split into num_points // 2 buckets and the smallest and
+    largest value in each is kept (so a line keeps its peaks)"""
+    num_vals = len(y_vals)
+    if num_points >= num_vals or num_points < 2:
+        return np.arange(num_vals)
+    y_vals = np.asarray(y_vals, dtype=np.float64)
+    # Equal sized buckets (the last is padded with NaN)
+    size = -(-num_vals // (num_points // 2))
+    num_buckets = -(-num_vals // size)
+    padded = np.full(num_buckets * size, np.nan)
+    padded[:num_vals] = y_vals
+    buckets = padded.reshape(num_buckets, size)
+    offsets = np.arange(num_buckets) * size
+    mins = offsets + np.nanargmin(buckets, axis=1)
+    maxs = offsets + np.nanargmax(buckets, axis=1)
+    return np.unique(np.concatenate([[0], mins, maxs, [num_vals - 1]]))
+
+
+def decimate_spec(spec, max_points):
+    """takes a graph spec (see graph_export.graph_spec) and the most points to draw
+    - returns a copy with (about) max_points points in each list of data
+    - lines use the min/max of each bucket, scatter/bar plots use LTTB
+    - if there are two lists, the points kept from either are kept from both"""
+    spec = dict(spec)
+    x_list = spec["x_list"]
+    y_lists = [spec["y_list"]]
+    if spec["y_list2"] is not None:
+        y_lists.append(spec["y_list2"])
+    if len(x_list) <= max_points:
+        return spec
+    indices = None
+    for y_list in y_lists:
+        if spec["plot_type"] == "Line":
+            kept = min_max_indices(y_list, max_points // len(y_lists))
+        else:
+            kept = lttb_indices(x_list, y_list, max_points // len(y_lists))
+        indices = kept if indices is None else np.union1d(indices, kept)
+    spec["x_list"] = np.asarray(x_list)[indices]
+    spec["y_list"] = np.asarray(spec["y_list"])[indices]
+    if spec["y_list2"] is not None:
+        spec["y_list2"] = np.asarray(spec["y_list2"])[indices]
+    return spec
@@ -0,0 +1,128 @@
+"""
+Module: Downsampled display previews for the image viewers (IP2 & PS2)
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from frame_source import read_frame
+
+# Import modules for computer vision
+from cv2 import resize, INTER_AREA
+
+# Import modules for threading and caching
+from concurrent.futures import ThreadPoolExecutor
+from collections import OrderedDict
+from threading import Lock
+
+# The number of previews and full resolution frames kept in memory
+PREVIEW_CACHE_SIZE = 64
+FULL_CACHE_SIZE = 4
+
+
+class DisplayPyramid:
+    """holds downsampled previews of image frames for displaying
+    - a preview is sized to fit within the widget it is displayed in
+    - previews are generated on a worker thread ahead of time (prefetch)
+    - full resolution frames are only read when needed (e.g. zooming)"""
+
+    def __init__(self):
+        """init method for DisplayPyramid"""
+        # Cached previews: (image_loc, max_size) -> (preview, scale)
+        self.previews = OrderedDict()
+        # Cached full resolution frames: image_loc -> image
+        self.full_frames = OrderedDict()
+        # Previews currently being made on the worker: key -> future
+        self.pending = {}
+        # The lock protects the caches from the worker thread
+        self.lock = Lock()
+        # The worker thread which makes the previews
+        self.executor = ThreadPoolExecutor(max_workers=1)
+
+    def full(self, image_loc):
+        """takes an image location
+        - returns the full resolution image (read only once if possible)
+        - the returned image should not be drawn on (copy it first)"""
+        with self.lock:
+            # If it is already in memory
+            if image_loc in self.full_frames:
+                # Mark it as recently used and return it
+                self.full_frames.move_to_end(image_loc)
+                return self.full_frames[image_loc]
+        # Read the image
+        image = read_frame(image_loc)
+        # Don't remember images which couldn't be read (they may be being written)
+        if image is None:
+            return None
+        with self.lock:
+            # Remember it (forgetting the oldest if there are too many)
+            self.full_frames[image_loc] = image
+            while len(self.full_frames) > FULL_CACHE_SIZE:
+                self.full_frames.popitem(last=False)
+        return image
+
+    def preview(self, image_loc, max_size):
+        """takes an image location and a (width, height) to fit within
+        - returns the preview image and its scale (preview pixels per image pixel)
+        - the returned image should not be drawn on (copy it first)"""
+        key = (image_loc, tuple(int(side) for side in max_size))
+        with self.lock:
+            # If it is already in memory
+            if key in self.previews:
+                # Mark it as recently used and return it
+                self.previews.move_to_end(key)
+                return self.previews[key]
+            # Check if the worker is already making it
+            future = self.pending.get(key)
+        # If the worker is making it, wait for it
+        if future is not None:
+            return future.result()
+        # Otherwise make it now
+        return self.make_preview(key)
+
+    def prefetch(self, image_locs, max_size):
+        """takes a list of image locations and a (width, height) to fit within
+        - makes the previews on the worker thread so they are ready later"""
+        for image_loc in image_locs:
+            key = (image_loc, tuple(int(side) for side in max_size))
+            with self.lock:
+                # Skip if already made or being made
+                if key in self.previews or key in self.pending:
+                    continue
+                # Make it on the worker thread
+                self.pending[key] = self.executor.submit(self.make_preview, key)
+
+    def make_preview(self, key):
+        """takes a key (image_loc, max_size)
+        - reads the image, downsamples it and caches the result
+        - returns the preview image and its scale"""
+        image_loc, (max_width, max_height) = key
+        image = read_frame(image_loc)
+        # If the image can't be read there is nothing to show
+        if image is None:
+            result = (None, 1)
+        else:
+            height, width = image.shape[0:2]
+            # Only ever shrink the image (never enlarge it)
+            scale = min(max_width / width, max_height / height, 1.0)
+            if scale < 1.0:
+                new_size = (max(1, int(width * scale)), max(1, int(height * scale)))
+                image = resize(image, new_size, interpolation=INTER_AREA)
+                # Use the actual scale after rounding the size
+                scale = new_size[0] / width
+            else:
+                scale = 1
+            result = (image, scale)
+        with self.lock:
+            # Remember it (forgetting the oldest if there are too many)
+            self.previews[key] = result
+            while len(self.previews) > PREVIEW_CACHE_SIZE:
+                self.previews.popitem(last=False)
+            self.pending.pop(key, None)
+        return result
+
+    def clear(self):
+        """forgets all previews and full resolution frames"""
+        with self.lock:
+            self.previews.clear()
+            self.full_frames.clear()
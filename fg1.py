@@ -10,9 +10,9 @@ from file_management import (
     file_header,
     file_name,
     is_csv_xml,
-    detect_encoding,
     unlabel_columns,
 )
+from table_loader import load_table, first_invalid_value
 
 # Kivy imports
 from kivy.app import App
@@ -25,8 +25,6 @@ from plyer import filechooser
 from os.path import getctime
 from datetime import datetime
 from re import match
-from csv import reader as csv_reader
-import xml.etree.ElementTree as et
 import os
 from subprocess import Popen as p_open
 
@@ -134,16 +132,14 @@ class FG1Window(Screen):
                     # Invalid column lengths
                     errors.append(" • invlaid column length(s)\n")
                 # Check for invalid column values
-                for pos in (
-                    x_col + y_col + t_col + tf_col + xf_col + yf_col + dfx_col + dfy_col
-                ):
-                    try:
-                        # Try convert to float
-                        float(pos)
-                    except ValueError:
-                        # Invalid float
-                        errors.append(" • invalid column value (" + str(pos) + ")\n")
-                        break
+                invalid_value = first_invalid_value(
+                    x_col, y_col, t_col, tf_col, xf_col, yf_col, dfx_col, dfy_col
+                )
+                if invalid_value is not None:
+                    # Invalid float
+                    errors.append(
+                        " • invalid column value (" + str(invalid_value) + ")\n"
+                    )
             # Add this job's name to list (to check for duplicates)
             name_list.append(job.name)
         # Check for duplicate names
@@ -587,8 +583,12 @@ class FG1Window(Screen):
         """called when [select file(s)] button is pressed
         - opens the file select window
         - selection is sent to self.selected()"""
-        # Only allow selection of csv or xml
-        filters = [("CSV files", "*.csv"), ("XML files", "*.xml")]
+        # Only allow selection of csv, xml or binary (npz)
+        filters = [
+            ("CSV files", "*.csv"),
+            ("XML files", "*.xml"),
+            ("Binary files", "*.npz"),
+        ]
         # Open file selector window - send selection to self.selected
         filechooser.open_file(
             on_selection=self.selected,
@@ -890,8 +890,9 @@ class FG1JobListBox(Button):
             self.dfx_vals = []
 
     def column_values(self):
-        """read the file and returns a value list for each column"""
-        # Set empty lists
+        """returns the values of the selected columns (from the loaded file)"""
+        # Get the file's columns (only read once)
+        table = load_table(self.file_location)
         (
             x_col_list,
             y_col_list,
@@ -901,52 +902,28 @@ class FG1JobListBox(Button):
             yf_col_list,
             dfx_col_list,
             dfy_col_list,
-        ) = ([], [], [], [], [], [], [], [])
-        # If a csv file
-        if self.file_location[-4:] == ".csv":
-            # If this file exists
-            if os.path.exists(self.file_location):
-                # Read the csv file and extract the values
-                encoding = detect_encoding(self.file_location)
-                with open(self.file_location, "r", encoding=encoding) as csv_file:
-                    reader = csv_reader(csv_file)
-                    next(reader)  # Skip header row
-                    # Read the rows
-                    for row in reader:
-                        x_col_list.append(row[self.x_column[0]])
-                        y_col_list.append(row[self.y_column[0]])
-                        t_col_list.append(row[self.t_column[0]])
-                        tf_col_list.append(row[self.tf_column[0]])
-                        xf_col_list.append(row[self.xf_column[0]])
-                        yf_col_list.append(row[self.yf_column[0]])
-                        dfx_col_list.append(row[self.dfx_column[0]])
-                        dfy_col_list.append(row[self.dfy_column[0]])
-        # If an xml file
-        elif self.file_location[-4:] == ".xml":
-            # If this file exists
-            if os.path.exists(self.file_location):
-                # Read the xml file and extract the values
-                tree = et.parse(self.file_location)
-                root = tree.getroot()
-                # Read the 'rows'
-                for detection in root.findall(".//detection"):
-                    x_col_list.append(detection.get(self.x_column[1]))
-                    y_col_list.append(detection.get(self.y_column[1]))
-                    t_col_list.append(detection.get(self.t_column[1]))
-                    tf_col_list.append(detection.get(self.tf_column[1]))
-                    xf_col_list.append(detection.get(self.xf_column[1]))
-                    yf_col_list.append(detection.get(self.yf_column[1]))
-                    dfx_col_list.append(detection.get(self.dfx_column[1]))
-                    dfy_col_list.append(detection.get(self.dfy_column[1]))
+        ) = [
+            table.column(column[0])
+            for column in [
+                self.x_column,
+                self.y_column,
+                self.t_column,
+                self.tf_column,
+                self.xf_column,
+                self.yf_column,
+                self.dfx_column,
+                self.dfy_column,
+            ]
+        ]
         # Save col values as attributes :)
-        self.x_vals = x_col_list[:]
-        self.y_vals = y_col_list[:]
-        self.t_vals = t_col_list[:]
-        self.tf_vals = tf_col_list[:]
-        self.xf_vals = xf_col_list[:]
-        self.yf_vals = yf_col_list[:]
-        self.dfx_vals = dfx_col_list[:]
-        self.dfy_vals = dfy_col_list[:]
+        self.x_vals = x_col_list.copy()
+        self.y_vals = y_col_list.copy()
+        self.t_vals = t_col_list.copy()
+        self.tf_vals = tf_col_list.copy()
+        self.xf_vals = xf_col_list.copy()
+        self.yf_vals = yf_col_list.copy()
+        self.dfx_vals = dfx_col_list.copy()
+        self.dfy_vals = dfy_col_list.copy()
         return (
             x_col_list,
             y_col_list,
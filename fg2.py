@@ -7,6 +7,17 @@ Author: Haig Bishop (hbi34@uclive.ac.nz)
 # Import local modules
 from popup_elements import BackPopup, ErrorPopup, FG2SuccessPopup
 from file_management import rename_file_graph
+from graph_drawing import FIGURE_SIZE
+from graph_export import (
+    BatchExporter,
+    GraphPreview,
+    RenderCache,
+    PREVIEW_DPI,
+    PREVIEW_MAX_POINTS,
+    graph_spec,
+    points_text,
+    render_key,
+)
 
 # Kivy imports
 from kivy.app import App
@@ -24,13 +35,9 @@ import re
 import os
 from subprocess import Popen as p_open
 
-# Import modules for dealing with images and graphs
-from PIL import Image as PilImage
-import numpy as np
-import imageio
+# Import modules for dealing with graphs
 import matplotlib
 import matplotlib.pyplot as plt
-from io import BytesIO
 
 # Set the plot font to Arial and turn off debug logging
 matplotlib.use("Agg")
@@ -47,6 +54,8 @@ class FG2Window(Screen):
         super(FG2Window, self).__init__(**kwargs)
         # Set current job
         self.current_job = None
+        # The graph exporter (None if not exporting)
+        self.exporter = None
         # Save app as an attribute
         self.app = App.get_running_app()
 
@@ -73,132 +82,62 @@ class FG2Window(Screen):
         errors = self.check_data()
         # If there are errors
         if errors != []:
+            # Remove the loading screen
+            self.end_loading()
             # Make pop up - alerts of invalid data
             popup = ErrorPopup()
             popup.error_label.text = "Invalid Data:\n" + "".join(errors)
             popup.open()
         # If there are no errors
         else:
+            # Get the graphs to export
+            specs = []
             # For each job
             for job in self.fg2_scroll.grid_layout.children:
-                # Set this job as the current job
-                self.current_job = job
-                # Get dpi to use (inches are set in place)
-                plot_dpi = 300
-                # If this graph is ticked
-                if job.making_t_for_graph:
-                    # Generate a file name for the graph
-                    new_file_loc = rename_file_graph(
-                        job.file_location, job.name, graph_num=1
-                    )
-                    # Export this plot
-                    self.graph_widget.current_graph = 1
-                    self.graph_widget.export_current_plot(
-                        plot_dpi=plot_dpi,
-                        new_file_loc=new_file_loc,
-                        svg=job.making_svg_graph,
-                        png=job.making_png_graph,
-                    )
-                # If this graph is ticked
-                if job.making_xy_for_graph:
-                    # Generate a file name for the graph
-                    new_file_loc = rename_file_graph(
-                        job.file_location, job.name, graph_num=2
-                    )
-                    # Export this plot
-                    self.graph_widget.current_graph = 2
-                    self.graph_widget.export_current_plot(
-                        plot_dpi=plot_dpi,
-                        new_file_loc=new_file_loc,
-                        svg=job.making_svg_graph,
-                        png=job.making_png_graph,
-                    )
-                # If this graph is ticked
-                if job.making_x_for_graph:
-                    # Generate a file name for the graph
-                    new_file_loc = rename_file_graph(
-                        job.file_location, job.name, graph_num=3
-                    )
-                    # Export this plot
-                    self.graph_widget.current_graph = 3
-                    self.graph_widget.export_current_plot(
-                        plot_dpi=plot_dpi,
-                        new_file_loc=new_file_loc,
-                        svg=job.making_svg_graph,
-                        png=job.making_png_graph,
-                    )
-                # If this graph is ticked
-                if job.making_y_for_graph:
-                    # Generate a file name for the graph
-                    new_file_loc = rename_file_graph(
-                        job.file_location, job.name, graph_num=4
-                    )
-                    # Export this plot
-                    self.graph_widget.current_graph = 4
-                    self.graph_widget.export_current_plot(
-                        plot_dpi=plot_dpi,
-                        new_file_loc=new_file_loc,
-                        svg=job.making_svg_graph,
-                        png=job.making_png_graph,
-                    )
-                # If this graph is ticked
-                if job.making_x_pos_graph:
-                    # Generate a file name for the graph
-                    new_file_loc = rename_file_graph(
-                        job.file_location, job.name, graph_num=5
-                    )
-                    # Export this plot
-                    self.graph_widget.current_graph = 5
-                    self.graph_widget.export_current_plot(
-                        plot_dpi=plot_dpi,
-                        new_file_loc=new_file_loc,
-                        svg=job.making_svg_graph,
-                        png=job.making_png_graph,
-                    )
-                # If this graph is ticked
-                if job.making_y_pos_graph:
-                    # Generate a file name for the graph
-                    new_file_loc = rename_file_graph(
-                        job.file_location, job.name, graph_num=6
-                    )
-                    # Export this plot
-                    self.graph_widget.current_graph = 6
-                    self.graph_widget.export_current_plot(
-                        plot_dpi=plot_dpi,
-                        new_file_loc=new_file_loc,
-                        svg=job.making_svg_graph,
-                        png=job.making_png_graph,
-                    )
-                # If this graph is ticked
-                if job.making_dfx_graph:
-                    # Generate a file name for the graph
-                    new_file_loc = rename_file_graph(
-                        job.file_location, job.name, graph_num=7
-                    )
-                    # Export this plot
-                    self.graph_widget.current_graph = 7
-                    self.graph_widget.export_current_plot(
-                        plot_dpi=plot_dpi,
-                        new_file_loc=new_file_loc,
-                        svg=job.making_svg_graph,
-                        png=job.making_png_graph,
-                    )
-                # If this graph is ticked
-                if job.making_dfy_graph:
-                    # Generate a file name for the graph
-                    new_file_loc = rename_file_graph(
-                        job.file_location, job.name, graph_num=8
-                    )
-                    # Export this plot
-                    self.graph_widget.current_graph = 8
-                    self.graph_widget.export_current_plot(
-                        plot_dpi=plot_dpi,
-                        new_file_loc=new_file_loc,
-                        svg=job.making_svg_graph,
-                        png=job.making_png_graph,
-                    )
-            # Remove the loading screen
-            self.end_loading()
+                # For each graph which is ticked
+                for graph_num, making_graph in enumerate(job.making_graphs(), 1):
+                    if making_graph:
+                        # Generate a file name for the graph
+                        new_file_loc = rename_file_graph(
+                            job.file_location, job.name, graph_num=graph_num
+                        )
+                        specs.append(
+                            graph_spec(
+                                job,
+                                graph_num,
+                                file_location=new_file_loc,
+                                svg=job.making_svg_graph,
+                                png=job.making_png_graph,
+                                svg_policy=job.svg_policy,
+                            )
+                        )
+            # Export them (in other processes if possible)
+            self.exporter = BatchExporter(
+                specs, self.on_export_progress, self.on_export_finished
+            )
+            self.exporter.start()
+
+    def on_export_progress(self, num_done, num_graphs):
+        """takes the number of graphs exported and the number being exported
+        - shows the progress on the loading screen"""
+        self.animation_widget.text = (
+            "Exporting... (" + str(num_done) + "/" + str(num_graphs) + ")"
+        )
+
+    def on_export_finished(self, errors):
+        """takes a list of errors (one for each graph which couldn't be exported)
+        - called once every graph has been exported"""
+        self.exporter = None
+        # Remove the loading screen
+        self.end_loading()
+        self.animation_widget.text = "Loading..."
+        # If any graphs couldn't be exported
+        if errors != []:
+            # Make pop up - alerts of the graphs which failed
+            popup = ErrorPopup()
+            popup.error_label.text = "Graphs not saved:\n" + "".join(errors)
+            popup.open()
+        else:
             # Make pop up - alerts of files saved
             popup = FG2SuccessPopup(
                 None,
@@ -381,6 +320,7 @@ class FG2Window(Screen):
             self.png_checkbox.state = (
                 "down" if self.current_job.making_png_graph else "normal"
             )
+            self.svg_policy_spinner.text = self.current_job.svg_policy
         else:
             # Set all as default/empty values
             self.location_label.text = "No file(s) selected"
@@ -399,8 +339,10 @@ class FG2Window(Screen):
             self.gt8_checkbox.state = "normal"
             self.svg_checkbox.state = "normal"
             self.png_checkbox.state = "normal"
+            self.svg_policy_spinner.text = "Full"
             self.y_axis_min_input.text = ""
             self.y_axis_max_input.text = ""
+            self.graph_widget.points_label.text = ""
 
     def update_job_selected(self):
         """updates every job's is_selected boolean
@@ -752,6 +694,18 @@ class FG2Window(Screen):
             # Upadte the job's title
             self.current_job.making_svg_graph = self.svg_checkbox.state == "down"
 
+    def on_svg_policy(self, text):
+        """called when the svg detail spinner is changed"""
+        # If bulk checkboc is ticked
+        if self.my_checkbox.active:
+            # Update all jobs
+            for job in self.fg2_scroll.grid_layout.children:
+                job.svg_policy = text
+        # If a job is selected
+        if self.current_job is not None:
+            # Upadte the job's svg policy
+            self.current_job.svg_policy = text
+
     def on_png_checkbox(self):
         """called when check box png is changed"""
         # If bulk checkboc is ticked
@@ -809,8 +763,9 @@ class FG2ScrollView(ScrollView):
         # Disabled layouts
         self.fg2_window.param_grid_layout.disabled = True
         self.fg2_window.name_grid_layout.disabled = True
-        # Remove that job
+        # Remove that job (and its graph previews)
         self.grid_layout.remove_widget(box)
+        self.fg2_window.graph_widget.render_cache.discard_job(box)
         # Update current job to none
         self.fg2_window.current_job = None
         # Update visual stuff
@@ -852,6 +807,8 @@ class FG2JobListBox(Button):
             self.dfx_col,
             self.dfy_col,
         ) = [[float(v) for v in l] for l in col_vals]
+        # The columns rounded for the graphs (see rounded_column)
+        self.rounded_cols = {}
         # All the parameters
         self.graph_1 = {
             "title": self.app.DEFAULT_TITLES[("t", 1)],
@@ -921,11 +878,26 @@ class FG2JobListBox(Button):
         # Set booleans for which file types
         self.making_svg_graph = True
         self.making_png_graph = False
+        # How much detail goes in an svg (see graph_drawing.SVG_POLICIES)
+        self.svg_policy = "Full"
         # Set the default plot type
         self.plot_type = "Scatter"
         # This job should be selected at creation
         self.is_selected = True
 
+    def making_graphs(self):
+        """returns a list of 8 booleans, True for each graph (1-8) being made"""
+        return [
+            self.making_t_for_graph,
+            self.making_xy_for_graph,
+            self.making_x_for_graph,
+            self.making_y_for_graph,
+            self.making_x_pos_graph,
+            self.making_y_pos_graph,
+            self.making_dfx_graph,
+            self.making_dfy_graph,
+        ]
+
     def on_press(self):
         """called when the job box is pressed
         - sets this job to be current
@@ -986,6 +958,10 @@ class GraphWidget(Widget):
         self.current_graph = 1
         # Initialise the plot
         self.create_plot()
+        # The graph previews which have been rendered
+        self.render_cache = RenderCache()
+        # The texture the previews are shown on (reused while the size is the same)
+        self.texture = None
         # Save app as an attribute
         self.app = App.get_running_app()
 
@@ -1017,7 +993,12 @@ class GraphWidget(Widget):
 
     def create_plot(self):
         """initialises the matplotlib plot"""
-        self.fig, self.ax = plt.subplots(figsize=(6, 4.5))
+        # The tight layout keeps the labels inside the figure (like bbox_inches)
+        self.fig, self.ax = plt.subplots(
+            figsize=FIGURE_SIZE, dpi=PREVIEW_DPI, layout="tight"
+        )
+        # Keeps the plot's artists between updates
+        self.preview = GraphPreview(self.fig, self.ax)
 
     def update_widget(self, focus=None):
         """updates the graph widget
@@ -1028,190 +1009,53 @@ class GraphWidget(Widget):
         we have stopped typing"""
         # If there is a current job and the input is not in focus
         if self.fg2_window.current_job is not None and focus != True:
-            # Update the plot
-            self.update_plot()
-            self.display_plot()
+            # Grab the current graph's features (long data is decimated)
+            spec = self.preview_spec()
+            # Show how many points are drawn
+            self.points_label.text = points_text(spec)
+            # If this graph has been rendered like this before, show it again
+            key = render_key(
+                self.fg2_window.current_job, self.current_graph, self.image_widget.size
+            )
+            image = self.render_cache.get(key)
+            if image is None:
+                # Update the plot
+                image = self.update_plot(spec)
+                self.render_cache.put(key, image)
+            self.display_plot(*image)
 
-    def update_plot(self):
-        """gets the current graph's features and updates the plot"""
-        # Grab the current graph's features
-        y_list2 = None  # There may or may not be a second list of data
-        if self.current_graph == 1:
-            x_list = [round(float(num), 2) for num in self.fg2_window.current_job.t_col]
-            y_list = [
-                round(float(num), 1) for num in self.fg2_window.current_job.tf_col
-            ]
-            x_label = self.fg2_window.current_job.graph_1["x_title"]
-            y_label = self.fg2_window.current_job.graph_1["y_title"]
-            title_label = self.fg2_window.current_job.graph_1["title"]
-            y_min = self.fg2_window.current_job.graph_1["y_min"]
-            y_max = self.fg2_window.current_job.graph_1["y_max"]
-        elif self.current_graph == 2:
-            x_list = [round(float(num), 2) for num in self.fg2_window.current_job.t_col]
-            y_list = [
-                round(float(num), 1) for num in self.fg2_window.current_job.xf_col
-            ]
-            y_list2 = [
-                round(float(num), 1) for num in self.fg2_window.current_job.yf_col
-            ]
-            x_label = self.fg2_window.current_job.graph_2["x_title"]
-            y_label = self.fg2_window.current_job.graph_2["y_title"]
-            title_label = self.fg2_window.current_job.graph_2["title"]
-            y_min = self.fg2_window.current_job.graph_2["y_min"]
-            y_max = self.fg2_window.current_job.graph_2["y_max"]
-        elif self.current_graph == 3:
-            x_list = [round(float(num), 2) for num in self.fg2_window.current_job.t_col]
-            y_list = [
-                round(float(num), 1) for num in self.fg2_window.current_job.xf_col
-            ]
-            x_label = self.fg2_window.current_job.graph_3["x_title"]
-            y_label = self.fg2_window.current_job.graph_3["y_title"]
-            title_label = self.fg2_window.current_job.graph_3["title"]
-            y_min = self.fg2_window.current_job.graph_3["y_min"]
-            y_max = self.fg2_window.current_job.graph_3["y_max"]
-        elif self.current_graph == 4:
-            x_list = [round(float(num), 2) for num in self.fg2_window.current_job.t_col]
-            y_list = [
-                round(float(num), 1) for num in self.fg2_window.current_job.yf_col
-            ]
-            x_label = self.fg2_window.current_job.graph_4["x_title"]
-            y_label = self.fg2_window.current_job.graph_4["y_title"]
-            title_label = self.fg2_window.current_job.graph_4["title"]
-            y_min = self.fg2_window.current_job.graph_4["y_min"]
-            y_max = self.fg2_window.current_job.graph_4["y_max"]
-        elif self.current_graph == 5:
-            x_list = [round(float(num), 2) for num in self.fg2_window.current_job.t_col]
-            y_list = [round(float(num), 2) for num in self.fg2_window.current_job.x_col]
-            x_label = self.fg2_window.current_job.graph_5["x_title"]
-            y_label = self.fg2_window.current_job.graph_5["y_title"]
-            title_label = self.fg2_window.current_job.graph_5["title"]
-            y_min = self.fg2_window.current_job.graph_5["y_min"]
-            y_max = self.fg2_window.current_job.graph_5["y_max"]
-        elif self.current_graph == 6:
-            x_list = [round(float(num), 2) for num in self.fg2_window.current_job.t_col]
-            y_list = [round(float(num), 2) for num in self.fg2_window.current_job.y_col]
-            x_label = self.fg2_window.current_job.graph_6["x_title"]
-            y_label = self.fg2_window.current_job.graph_6["y_title"]
-            title_label = self.fg2_window.current_job.graph_6["title"]
-            y_min = self.fg2_window.current_job.graph_6["y_min"]
-            y_max = self.fg2_window.current_job.graph_6["y_max"]
-        elif self.current_graph == 7:
-            x_list = [round(float(num), 2) for num in self.fg2_window.current_job.t_col]
-            y_list = [
-                round(float(num), 1) for num in self.fg2_window.current_job.dfx_col
-            ]
-            x_label = self.fg2_window.current_job.graph_7["x_title"]
-            y_label = self.fg2_window.current_job.graph_7["y_title"]
-            title_label = self.fg2_window.current_job.graph_7["title"]
-            y_min = self.fg2_window.current_job.graph_7["y_min"]
-            y_max = self.fg2_window.current_job.graph_7["y_max"]
-        elif self.current_graph == 8:
-            x_list = [round(float(num), 2) for num in self.fg2_window.current_job.t_col]
-            y_list = [
-                round(float(num), 1) for num in self.fg2_window.current_job.dfy_col
-            ]
-            x_label = self.fg2_window.current_job.graph_8["x_title"]
-            y_label = self.fg2_window.current_job.graph_8["y_title"]
-            title_label = self.fg2_window.current_job.graph_8["title"]
-            y_min = self.fg2_window.current_job.graph_8["y_min"]
-            y_max = self.fg2_window.current_job.graph_8["y_max"]
-        # Clear the plot
-        plt.cla()
-        # Set data ranges
-        self.ax.set_ylim(
-            [
-                float(y_min) - 0.05 * (float(y_max) - float(y_min)),
-                float(y_max) + 0.05 * (float(y_max) - float(y_min)),
-            ]
-        )
-        # If line plot
-        if self.fg2_window.current_job.plot_type == "Line":
-            # If two lists of data points
-            if y_list2 is not None:
-                # Label the two lists
-                self.ax.plot(x_list, y_list, label="x-direction", clip_on=False)
-                self.ax.plot(x_list, y_list2, label="y-direction", clip_on=False)
-                # Add the legend
-                self.ax.legend()
-            # If only one list of data points
-            else:
-                self.ax.plot(x_list, y_list)
-        # If dot plot
-        elif self.fg2_window.current_job.plot_type == "Scatter":
-            # If two lists of data points
-            if y_list2 is not None:
-                # Label the two lists
-                self.ax.scatter(x_list, y_list, label="x-direction")
-                self.ax.scatter(x_list, y_list2, label="y-direction")
-                # Add the legend
-                self.ax.legend()
-            # If only one list of data points
-            else:
-                self.ax.scatter(x_list, y_list)
-        # If bar plot
-        elif self.fg2_window.current_job.plot_type == "Bar":
-            # If two lists of data points
-            if y_list2 is not None:
-                # Label the two lists
-                self.ax.bar(x_list, y_list, label="x-direction")
-                self.ax.bar(x_list, y_list2, label="y-direction")
-                # Add the legend
-                self.ax.legend()
-            # If only one list of data points
-            else:
-                self.ax.bar(x_list, y_list)
-        # Add labels to the x and y axis
-        self.ax.set_xlabel(x_label)
-        self.ax.set_ylabel(y_label)
-        # Add a title to the graph
-        self.ax.set_title(title_label)
+    def update_titles(self, focus):
+        """called as a title is typed (with the input's focus attribute)
+        - shows the new title straight away (only the titles are redrawn)
+        - these aren't cached, the final title is when the input loses focus"""
+        # If there is a current job and the user is typing
+        if self.fg2_window.current_job is not None and focus:
+            self.display_plot(*self.update_plot(self.preview_spec()))
 
-    def grab_figure(self, plot_dpi=150):
-        """converts the plot into a png image
-        - returns a np array containing the image"""
-        # Convert the figure to a PNG image
-        buf = BytesIO()
-        self.fig.savefig(
-            buf, format="png", facecolor="white", dpi=plot_dpi, bbox_inches="tight"
+    def preview_spec(self):
+        """returns the current graph's features (see graph_spec)
+        - with at most PREVIEW_MAX_POINTS points in each list of data"""
+        return graph_spec(
+            self.fg2_window.current_job,
+            self.current_graph,
+            max_points=PREVIEW_MAX_POINTS,
         )
-        buf.seek(0)
-        image_data = buf.read()
-        # Close the buffer
-        buf.close()
-        # Use PIL to read the image data and convert it to a Kivy-compatible format
-        pil_image = PilImage.open(BytesIO(image_data))
-        # Convert the PIL image to a numpy array
-        np_image = np.array(pil_image)
-        return np_image
 
-    def display_plot(self):
-        """grad the png of the plot and display it as a Kivy texture"""
-        # Get fig as numpy png
-        np_image = self.grab_figure()
-        # Flip upside down because Kivy uses a reversed y axis
-        np_image = np.flipud(np_image)
-        # Create a Kivy texture from the numpy array
-        kivy_texture = Texture.create(
-            size=(np_image.shape[1], np_image.shape[0]), colorfmt="rgba"
-        )
-        kivy_texture.blit_buffer(np_image.flatten(), colorfmt="rgba", bufferfmt="ubyte")
-        # Update the Kivy Image widget to display the graph image
-        self.image_widget.texture = kivy_texture
+    def update_plot(self, spec):
+        """takes the current graph's features (see preview_spec) and updates the plot
+        - returns the RGBA pixels (bytes, from the top row down) and the size"""
+        # Draw them on the plot (only what has changed)
+        return self.preview.render(spec)
 
-    def export_current_plot(self, plot_dpi, new_file_loc, svg, png):
-        """takes a file location and file types
-        - exports the current graph at that location in those file types"""
-        # If exporting a png file
-        if png:
-            # Update the plot
-            self.update_plot()
-            # Get fig as numpy png
-            np_image = self.grab_figure(plot_dpi=plot_dpi)
-            # Export the graph image to the given filename
-            imageio.imwrite(new_file_loc + ".png", np_image)
-        # If exporting a svg file
-        if svg:
-            # Update the plot
-            self.update_plot()
-            # Save the fig as an svg file to the given filename
-            self.fig.savefig(new_file_loc + ".svg", bbox_inches="tight", format="svg")
+    def display_plot(self, pixels, size):
+        """takes RGBA pixels and their size (see update_plot)
+        - copies them straight into the texture on the image widget"""
+        # Only make a new texture if the size has changed
+        if self.texture is None or tuple(self.texture.size) != tuple(size):
+            self.texture = Texture.create(size=size, colorfmt="rgba")
+            # Flip the texture coordinates because Kivy uses a reversed y axis
+            self.texture.flip_vertical()
+        self.texture.blit_buffer(pixels, colorfmt="rgba", bufferfmt="ubyte")
+        # Update the Kivy Image widget to display the graph image
+        self.image_widget.texture = self.texture
+        self.image_widget.canvas.ask_update()
@@ -9,9 +9,31 @@ Author: Haig Bishop (hbi34@uclive.ac.nz)
 from datetime import datetime
 import re
 import csv
-from cv2 import imread
+from frame_source import (
+    is_container,
+    open_source,
+    frame_locations,
+    read_frame,
+    split_frame_location,
+)
+import numpy as np
 import xml.etree.ElementTree as et
+from binary_format import (
+    BINARY_EXTENSION,
+    binary_location,
+    write_binary_file,
+    read_schema,
+    BinaryColumnWriter,
+)
 from chardet import detect
+from codecs import (
+    getincrementaldecoder,
+    BOM_UTF8,
+    BOM_UTF16_LE,
+    BOM_UTF16_BE,
+    BOM_UTF32_LE,
+    BOM_UTF32_BE,
+)
 import os
 import sys
 import re
@@ -20,6 +42,29 @@ import re
 # This is important for when using executable files
 APPLICATION_PATH = os.path.abspath(".")
 
+# Byte order marks and their encodings (UTF-32 first as it starts like UTF-16)
+BOMS = (
+    (BOM_UTF32_LE, "utf-32"),
+    (BOM_UTF32_BE, "utf-32"),
+    (BOM_UTF8, "utf-8-sig"),
+    (BOM_UTF16_LE, "utf-16"),
+    (BOM_UTF16_BE, "utf-16"),
+)
+# The number of bytes checked for UTF-8 (at the start and end of a file)
+UTF8_SAMPLE_SIZE = 64 * 1024
+# The number of bytes given to chardet (if not UTF-8)
+CHARDET_SAMPLE_SIZE = 1024 * 1024
+# Detected encodings: file location -> ((modified time, size), encoding)
+ENCODING_CACHE = {}
+# The valid image file extensions
+VALID_IMAGE_TYPES = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
+# Scanned folders: folder location -> FolderIndex
+FOLDER_INDEXES = {}
+# The headers of position files
+POS_FILE_HEADERS = ["Frame number", "x Position [pixels]", "y Position [pixels]"]
+# The number of rows written to a csv file at a time
+CSV_CHUNK_ROWS = 65536
+
 
 def natural_sort(file_list):
     """Takes a list of files and returns the sorted
@@ -75,28 +120,97 @@ def class_resource_path(self, relative_path):
     return new_path
 
 
+class FolderIndex:
+    """the image files in a folder (from a single scan of the folder)
+    - the files of each valid image type are counted and listed
+    - the sorted file names and file stats are worked out when first needed
+    - it is out of date once the folder is modified (see folder_index)"""
+
+    def __init__(self, folder_location):
+        """init method for FolderIndex"""
+        self.folder_location = folder_location
+        # The folder's modified time (it changes when files are added/removed)
+        self.modified_time = os.stat(folder_location).st_mtime_ns
+        # The files of each valid type: type -> file names
+        self.files = {type_tag: [] for type_tag in VALID_IMAGE_TYPES}
+        # The stats of image files: file name -> os.stat_result
+        self.entries = {}
+        self.stats = {}
+        # The naturally sorted files of each type: type -> file names
+        self.sorted_files = {}
+        # For each file (one pass over the folder)
+        with os.scandir(folder_location) as entries:
+            for entry in entries:
+                # Get the file type
+                type_tag = entry.name[entry.name.rfind(".") :].lower()
+                # If a valid type
+                if type_tag in self.files:
+                    self.files[type_tag].append(entry.name)
+                    self.entries[entry.name] = entry
+        # Count each type
+        self.counts = {type_tag: len(files) for type_tag, files in self.files.items()}
+
+    def is_current(self):
+        """returns True if the folder hasn't been modified since it was scanned"""
+        try:
+            return os.stat(self.folder_location).st_mtime_ns == self.modified_time
+        except OSError:
+            return False
+
+    def top_type(self):
+        """returns the most common image type (the first type if tied)"""
+        return max(VALID_IMAGE_TYPES, key=lambda type_tag: self.counts[type_tag])
+
+    def sorted_names(self, type_tag):
+        """takes an image type
+        - returns the files of that type in natural order (sorted once)"""
+        if type_tag not in self.sorted_files:
+            self.sorted_files[type_tag] = natural_sort(self.files[type_tag])
+        return self.sorted_files[type_tag]
+
+    def image_locations(self, type_tag):
+        """takes an image type
+        - returns the locations of the files of that type in natural order"""
+        return [
+            self.folder_location + "\\" + file for file in self.sorted_names(type_tag)
+        ]
+
+    def stat(self, file):
+        """takes a file name in the folder
+        - returns its os.stat_result (only looked up once)"""
+        if file not in self.stats:
+            self.stats[file] = self.entries[file].stat()
+        return self.stats[file]
+
+
+def folder_index(folder_location):
+    """takes the location of an existing folder
+    - returns its FolderIndex
+    - the folder is only scanned again if it was modified since the last scan"""
+    index = FOLDER_INDEXES.get(folder_location)
+    if index is None or not index.is_current():
+        index = FolderIndex(folder_location)
+        FOLDER_INDEXES[folder_location] = index
+    return index
+
+
 def is_valid_folder(folder_loc):
     """takes a folder location
     - returns a boolean which is True if...
     - the folder exists
     - AND
-    - the folder contains at least 2 images of the same type"""
+    - the folder contains at least 2 images of the same type
+    - (or it is a TIFF stack/video with at least 2 frames)"""
+    # If it is a TIFF stack/video
+    if is_container(folder_loc):
+        valid_contents = num_valid_images(folder_loc) >= 2
     # If the folder doesn't exist
-    if not os.path.isdir(folder_loc):
+    elif not os.path.isdir(folder_loc):
         valid_contents = False
     # If the folder exists
     else:
-        # The valid file extensions
-        valid_types = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
-        type_counts = [0, 0, 0, 0, 0]
-        # For each file
-        for file in os.listdir(folder_loc):
-            # Get the file type
-            type_tag = file[file.rfind(".") :].lower()
-            # If a valid type
-            if type_tag in valid_types:
-                # Count that file type
-                type_counts[valid_types.index(type_tag)] += 1
+        # Count each image type
+        type_counts = folder_index(folder_loc).counts.values()
         # If there are at least 2 image files of the same type
         valid_contents = any([count >= 2 for count in type_counts])
     return valid_contents
@@ -105,24 +219,19 @@ def is_valid_folder(folder_loc):
 def num_valid_images(folder_loc):
     """takes a folder location
     - looks at how many images of the same type the folder contains
-    - returns the count of most common type type"""
+    - returns the count of most common type type
+    - (or the number of frames in a TIFF stack/video)"""
+    # If it is a TIFF stack/video
+    if is_container(folder_loc):
+        try:
+            return open_source(folder_loc).count
+        except OSError:
+            return 0
     # Check if the folder exists
     if not os.path.isdir(folder_loc):
-        type_counts = 0
-    else:
-        # Valid file extensions
-        valid_types = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
-        type_counts = [0, 0, 0, 0, 0]
-        # For each file
-        for file in os.listdir(folder_loc):
-            # Get the file type
-            type_tag = file[file.rfind(".") :].lower()
-            # If a valid type
-            if type_tag in valid_types:
-                # Count that file type
-                type_counts[valid_types.index(type_tag)] += 1
+        return 0
     # Returns the highest count
-    return max(type_counts)
+    return max(folder_index(folder_loc).counts.values())
 
 
 def valid_image_dims(image_locations):
@@ -130,13 +239,16 @@ def valid_image_dims(image_locations):
     - checks if all images are the same dimensions
     - returns True if they are all the same"""
     # Get the first images dimensions
-    first_image = imread(image_locations[0])
+    first_image = read_frame(image_locations[0])
     if first_image is not None:
         first_height, first_width, _ = first_image.shape
+        # The frames of a TIFF stack/video are all the same dimensions
+        if split_frame_location(image_locations[0])[1] is not None:
+            return True
         # Iterate over the rest of the images
         for image_location in image_locations[1:]:
             # Get its dimensions
-            image = imread(image_location)
+            image = read_frame(image_location)
             height, width, _ = image.shape
             # If the dimensions don't match up
             if height != first_height or width != first_width:
@@ -151,7 +263,7 @@ def positions_in_image_dim(image_loc, pos_list):
     - checks if all positions are within the image dimensions
     - returns True if all within image"""
     # Get the first images dimensions
-    image = imread(image_loc)
+    image = read_frame(image_loc)
     height, width, _ = image.shape
     # For each position
     for pos in pos_list:
@@ -165,38 +277,23 @@ def positions_in_image_dim(image_loc, pos_list):
 def images_from_folder(folder_location):
     """takes a folder location
     - returns the most common image type and the file
-    locations of that type"""
-    # Valid file extensions
-    valid_types = (".jpg", ".jpeg", ".png", ".tif", ".tiff", ".bmp")
-    image_files = [[], [], [], [], [], []]
-    type_counts = [0, 0, 0, 0, 0, 0]
-    # For each file
-    for file in os.listdir(folder_location):
-        # Get the file type
-        type_tag = file[file.rfind(".") :].lower()
-        # If is a valid type
-        if type_tag in valid_types:
-            # +1 count for this type
-            type_counts[valid_types.index(type_tag)] += 1
-            # Add the list of file types
-            image_files[valid_types.index(type_tag)].append(file)
-    # Get the most numerous image type's index
-    top_type_index = type_counts.index(max(type_counts))
-    # Use the index to get the extension
-    top_image_type = valid_types[top_type_index]
-    # Use the index to get the list of files at that type
-    top_image_files = image_files[top_type_index]
-    # Sort the files (in order of name)
-    top_image_files = natural_sort(top_image_files)
-    # Join to the folder locations
-    top_image_file_locs = [folder_location + "\\" + file for file in top_image_files]
+    locations of that type
+    - (or the file type and frame locations of a TIFF stack/video)"""
+    # If it is a TIFF stack/video
+    if is_container(folder_location):
+        return frame_locations(folder_location)
+    index = folder_index(folder_location)
+    # Get the most numerous image type
+    top_image_type = index.top_type()
+    # Get the (naturally sorted) locations of the files of that type
+    top_image_file_locs = index.image_locations(top_image_type)
     return top_image_file_locs, top_image_type
 
 
 def is_csv_xml(file_loc):
     """takes a file
-    - returns True is the file is csv or xml"""
-    return file_loc[-4:] == ".csv" or file_loc[-4:] == ".xml"
+    - returns True is the file is csv, xml or binary (npz)"""
+    return file_loc[-4:] in (".csv", ".xml", BINARY_EXTENSION)
 
 
 def file_name(file_location):
@@ -249,6 +346,9 @@ def folder_name(folder_location):
     - e.g. "folder1/folder/filename.txt" -> folder"""
     s = str(folder_location).rfind("\\") + 1
     folder_name = str(folder_location)[s:]
+    # A TIFF stack/video is named without its extension
+    if is_container(folder_location):
+        folder_name = os.path.splitext(folder_name)[0]
     # Remove space characters
     folder_name = folder_name.replace(" ", "")
     return folder_name
@@ -276,28 +376,110 @@ def file_header(file_location):
         elif str(file_location)[-4:] == ".xml":
             # If this file exists
             if os.path.exists(file_location):
-                # Load the XML file
-                tree = et.parse(file_location)
-                root = tree.getroot()
-                # Find the <particle> element
-                particle_elem = root.find("particle")
-                try:
-                    # Get the names of the <detection> element attributes
-                    detection_attrs = particle_elem.find("detection").attrib.keys()
-                except AttributeError:
-                    # No tracking data! - same as empty csv file
-                    detection_attrs = []
-                header = list(detection_attrs)
+                # Get the names of the first <detection> element attributes
+                # (no tracking data is the same as an empty csv file)
+                header = xml_detection_names(file_location)
+        # If it is a binary file
+        elif str(file_location)[-4:] == BINARY_EXTENSION:
+            # If this file exists
+            if os.path.exists(file_location):
+                # The column names are stored in its schema
+                schema = read_schema(file_location)
+                header = [] if schema is None else schema["columns"]
     # Label the headers (see function) before returning
     return label_columns(header)
 
 
+def xml_detection_names(file_location):
+    """takes the location of a .xml file (TrackMate format)
+    - returns the attribute names of the first <detection> in the first <particle>
+    - stops reading once it is found (or at the end of the first <particle>)
+    - returns an empty list if there are none"""
+    with open(file_location, "rb") as xml_file:
+        for event, elem in et.iterparse(xml_file, events=("end",)):
+            # If the first detection
+            if elem.tag == "detection":
+                return list(elem.attrib.keys())
+            # If the first particle ended without any detections
+            elif elem.tag == "particle":
+                return []
+    return []
+
+
+def iter_detections(file_location, names=None):
+    """takes the location of a .xml file (TrackMate format)
+    - yields the attributes (dict) of each <detection> element in order
+    - if names are given only those attributes are yielded
+    - elements are cleared as it goes so the file is never all in memory"""
+    with open(file_location, "rb") as xml_file:
+        context = et.iterparse(xml_file, events=("start", "end"))
+        # Get the root element (so finished elements can be removed from it)
+        _, root = next(context)
+        parent = root
+        for event, elem in context:
+            if event == "start":
+                # Detections are removed from their particle once read
+                if elem.tag == "particle":
+                    parent = elem
+            elif elem.tag == "detection":
+                if names is None:
+                    yield dict(elem.attrib)
+                else:
+                    yield {name: elem.get(name, "") for name in names}
+                # Forget the detections read so far
+                parent.clear()
+            elif elem.tag == "particle":
+                # Forget the finished particles
+                root.clear()
+                parent = root
+
+
 def detect_encoding(file_location):
     """takes a file location
-    - returns the type of encoding used for the file"""
+    - returns the type of encoding used for the file
+    - each file is only checked once (unless it is modified)"""
+    stat = os.stat(file_location)
+    file_key = (stat.st_mtime, stat.st_size)
+    # If this file has already been checked
+    cached = ENCODING_CACHE.get(file_location)
+    if cached is not None and cached[0] == file_key:
+        return cached[1]
     with open(file_location, "rb") as file:
-        result = detect(file.read())
-    return result["encoding"]
+        head = file.read(UTF8_SAMPLE_SIZE)
+        # Get the end of the file too (if not already read)
+        tail = b""
+        if stat.st_size > UTF8_SAMPLE_SIZE:
+            file.seek(max(UTF8_SAMPLE_SIZE, stat.st_size - UTF8_SAMPLE_SIZE))
+            tail = file.read()
+        encoding = sniff_encoding(head, tail)
+        # If not obvious, let chardet guess from a sample
+        if encoding is None:
+            file.seek(0)
+            encoding = detect(file.read(CHARDET_SAMPLE_SIZE))["encoding"]
+    # Remember it for next time
+    ENCODING_CACHE[file_location] = (file_key, encoding)
+    return encoding
+
+
+def sniff_encoding(head, tail=b""):
+    """takes bytes from the start (and optionally the end) of a file
+    - returns the encoding if there is a byte order mark or it is valid UTF-8
+    - returns None otherwise"""
+    # Check for a byte order mark
+    for bom, encoding in BOMS:
+        if head.startswith(bom):
+            return encoding
+    # Check both samples are valid UTF-8 (they may cut a character in half)
+    for sample in (head, tail):
+        decoder = getincrementaldecoder("utf-8")(errors="strict")
+        try:
+            # Skip continuation bytes at the start of the tail sample
+            if sample is tail:
+                sample = sample.lstrip(bytes(range(0x80, 0xC0)))
+            decoder.decode(sample, final=False)
+        except UnicodeDecodeError:
+            return None
+    return "utf-8"
 
 
 def write_pos_force_file(
@@ -314,48 +496,161 @@ def write_pos_force_file(
     force_y,
     delta_Fx,
     delta_Fy,
+    schema=None,
 ):
     """takes all the data needed to write a force file
-    - writes a csv force file"""
-    # Transpose the lists into rows
-    rows = list(
-        zip(
-            frame_nums,
-            t_vals,
-            x_vals,
-            y_vals,
-            xum_vals,
-            yum_vals,
-            force_total,
-            force_x,
-            force_y,
-            delta_Fx,
-            delta_Fy,
-        )
-    )
+    - writes a csv force file
+    - also writes a binary (npz) file alongside it (see write_binary_copy)"""
+    columns = [
+        frame_nums,
+        t_vals,
+        x_vals,
+        y_vals,
+        xum_vals,
+        yum_vals,
+        force_total,
+        force_x,
+        force_y,
+        delta_Fx,
+        delta_Fy,
+    ]
     # Write the CSV file
-    with open(
-        file_location, "w", newline="", errors="replace", encoding="UTF-8"
-    ) as csvfile:
-        csv_writer = csv.writer(csvfile)
-        csv_writer.writerow(col_names)  # Write the headers
-        csv_writer.writerows(rows)  # Write the data
+    write_csv_columns(file_location, col_names, columns)
+    # Write the same data in binary
+    write_binary_copy(file_location, col_names, columns, schema)
+
+
+def write_pos_force_blocks(file_location, col_names, num_rows, blocks, schema=None):
+    """takes a file location, the column names, the number of rows,
+    the blocks of rows to write (see write_csv_blocks) and any extra schema
+    - writes a csv force file and its binary (npz) copy one block at a time
+    - used for very long files, so the whole file is never in memory"""
+    binary_writer = BinaryColumnWriter(
+        binary_location(file_location), col_names, num_rows
+    )
 
+    def binary_blocks():
+        """passes each block on to the csv, after adding it to the binary file"""
+        start = 0
+        for block in blocks:
+            binary_writer.write(start, block)
+            start += len(block[0])
+            yield block
 
-def write_pos_file(file_location, position_data):
+    try:
+        # Write the CSV file
+        write_csv_blocks(file_location, col_names, binary_blocks())
+    except BaseException:
+        binary_writer.discard()
+        raise
+    # Write the binary file (with the csv's size, see write_binary_copy)
+    schema = dict(schema or {})
+    schema["csv_size"] = os.path.getsize(file_location)
+    binary_writer.finish(schema)
+
+
+def write_pos_file(file_location, position_data, schema=None):
     """takes a file location and posiiton data
-    - writes a position csv file"""
-    # Transpose the lists into rows
-    frame_nums, x_vals, y_vals = position_data
-    rows = list(zip(frame_nums, x_vals, y_vals))
+    - writes a position csv file
+    - also writes a binary (npz) file alongside it (see write_binary_copy)"""
     # Write the CSV file
+    write_csv_columns(file_location, POS_FILE_HEADERS, position_data)
+    # Write the same data in binary
+    write_binary_copy(file_location, POS_FILE_HEADERS, position_data, schema)
+
+
+def is_pos_file(file_location):
+    """takes a file location
+    - returns True if it is a position csv file written by this app"""
+    if file_location[-4:] != ".csv" or not os.path.exists(file_location):
+        return False
+    return file_header(file_location) == label_columns(POS_FILE_HEADERS)
+
+
+def append_pos_file(file_location, position_data):
+    """takes the location of a position csv file and posiiton data
+    - adds the positions onto the end of the file (see is_pos_file)"""
+    # Turn each column into text
+    text_columns = [column_text(column) for column in position_data]
+    rows = zip(*text_columns)
+    with open(
+        file_location, "a", newline="", errors="replace", encoding="UTF-8"
+    ) as csvfile:
+        csvfile.write("".join(",".join(row) + "\r\n" for row in rows))
+
+
+def write_csv_columns(file_location, col_names, columns):
+    """takes a file location, the column names and the columns
+    - writes a csv file exactly as csv.writer would (same text for every value)
+    - each column is turned into text in one go, and the rows are written in large
+    chunks rather than one at a time"""
+    # Turn each column into text
+    text_columns = [column_text(column) for column in columns]
+    # Like zip, stop at the end of the shortest column
+    num_rows = min((len(column) for column in text_columns), default=0)
+    with open(
+        file_location, "w", newline="", errors="replace", encoding="UTF-8"
+    ) as csvfile:
+        csv.writer(csvfile).writerow(col_names)  # Write the headers
+        # Write the data (a chunk of rows at a time)
+        for start in range(0, num_rows, CSV_CHUNK_ROWS):
+            stop = min(start + CSV_CHUNK_ROWS, num_rows)
+            rows = zip(*(column[start:stop] for column in text_columns))
+            csvfile.write("\r\n".join(map(",".join, rows)) + "\r\n")
+
+
+def write_csv_blocks(file_location, col_names, blocks):
+    """takes a file location, the column names and the blocks of rows to write
+    (each block is a list of columns, e.g. from a generator)
+    - writes a csv file one block at a time (like write_csv_columns)
+    - only one block needs to be in memory at a time"""
     with open(
         file_location, "w", newline="", errors="replace", encoding="UTF-8"
     ) as csvfile:
-        csv_writer = csv.writer(csvfile)
-        headers = ["Frame number", "x Position [pixels]", "y Position [pixels]"]
-        csv_writer.writerow(headers)  # Write the headers
-        csv_writer.writerows(rows)  # Write the data
+        csv.writer(csvfile).writerow(col_names)  # Write the headers
+        # Write the data (a block of rows at a time)
+        for block in blocks:
+            rows = list(zip(*(column_text(column) for column in block)))
+            if rows:
+                csvfile.write("\r\n".join(map(",".join, rows)) + "\r\n")
+
+
+def column_text(column):
+    """takes a column (list or numpy array)
+    - returns a list of each value as text, the same as csv.writer writes it"""
+    # Whole numpy columns of numbers (same text as their Python numbers)
+    if isinstance(column, np.ndarray) and (
+        column.dtype.kind in "iub" or column.dtype == np.float64
+    ):
+        return list(map(str, column.tolist()))
+    # Any other numbers are written as str(value) by csv.writer
+    value_types = set(map(type, column))
+    if str not in value_types and type(None) not in value_types:
+        return list(map(str, column))
+    # Text is quoted where needed (like csv.writer)
+    return [csv_field(value) for value in column]
+
+
+def csv_field(value):
+    """takes any value
+    - returns it as text in a csv row (like csv.writer)"""
+    if value is None:
+        return ""
+    text = str(value)
+    # Quote fields containing special characters
+    if any(char in text for char in ',"\r\n'):
+        text = '"' + text.replace('"', '""') + '"'
+    return text
+
+
+def write_binary_copy(file_location, col_names, columns, schema=None):
+    """takes the location of a csv file just written, its column names and columns
+    and any extra schema (e.g. pixel/micron ratio, force parameters, source folder)
+    - writes the same data to a binary (npz) file alongside the csv
+    - the csv's size is stored so a changed csv won't be read from the binary"""
+    schema = dict(schema or {})
+    schema["csv_size"] = os.path.getsize(file_location)
+    write_binary_file(binary_location(file_location), col_names, columns, schema)
 
 
 def rename_file_pos(folder_location, name, updated=False):
@@ -368,6 +663,10 @@ def rename_file_pos(folder_location, name, updated=False):
     date_and_time = str(now.strftime("%d-%m-%y_%H-%M"))
     # If this is a new posiiton file, use the _newpos_ tag :)
     tag = "_newpos_" if updated else "_pos_"
+    # The file for a TIFF stack/video goes alongside it
+    if is_container(folder_location):
+        s = max([folder_location.rfind("\\"), folder_location.rfind("/")])
+        folder_location = folder_location[:s]
     # Join everything together
     return str(folder_location) + "\\" + str(name) + tag + date_and_time + ".csv"
 
@@ -384,6 +683,21 @@ def rename_file_force(file_location, name):
     return str(file_location)[:s] + str(name) + "_forces_" + date_and_time + ".csv"
 
 
+def rename_file_sweep(file_location, name, combination=None):
+    """takes a file location, a name and maybe a sweep combination number
+    - returns a new file location name for a parameter sweep summary
+    (or for the force file of one combination)
+    - includes the time"""
+    # Format the date and time as text
+    now = datetime.now()
+    date_and_time = str(now.strftime("%d-%m-%y_%H-%M"))
+    s = str(file_location).rfind("\\") + 1
+    # Add the combination number (if given)
+    sweep = "_sweep_" if combination is None else "_sweep_" + str(combination) + "_"
+    # Join everything together
+    return str(file_location)[:s] + str(name) + sweep + date_and_time + ".csv"
+
+
 def rename_file_graph(file_location, name, graph_num):
     """takes a folder a job name and a graph number
     - returns a new file location name
@@ -0,0 +1,129 @@
+"""
+Module: Watching a folder for new image files (live acquisition)
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from file_management import folder_index
+
+# Import modules for dealing with files
+import ctypes
+import ctypes.util
+import struct
+import sys
+import os
+
+# inotify flags (see 'man inotify')
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_TO = 0x00000080
+IN_Q_OVERFLOW = 0x00004000
+# The size of an inotify event (without its name)
+EVENT_SIZE = struct.calcsize("iIII")
+
+
+class InotifyWatcher:
+    """watches a folder using inotify (Linux only)
+    - a file is new once it has been written and closed (or moved in)
+    so frames which are still being written are never seen"""
+
+    def __init__(self, folder_location):
+        """init method for InotifyWatcher"""
+        self.folder_location = folder_location
+        libc = ctypes.CDLL(ctypes.util.find_library("c"), use_errno=True)
+        # Start inotify (without blocking when there are no events)
+        self.fd = libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        # Watch the folder for files being written or moved in
+        watch = libc.inotify_add_watch(
+            self.fd, os.fsencode(folder_location), IN_CLOSE_WRITE | IN_MOVED_TO
+        )
+        if watch < 0:
+            os.close(self.fd)
+            raise OSError(ctypes.get_errno(), "inotify_add_watch failed")
+
+    def new_files(self):
+        """returns the names of the files written since it was last called"""
+        names = []
+        while True:
+            try:
+                buffer = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                # No more events
+                break
+            offset = 0
+            while offset + EVENT_SIZE <= len(buffer):
+                _, mask, _, length = struct.unpack_from("iIII", buffer, offset)
+                name = buffer[offset + EVENT_SIZE : offset + EVENT_SIZE + length]
+                offset += EVENT_SIZE + length
+                # If events were lost, every file might be new
+                if mask & IN_Q_OVERFLOW:
+                    index = folder_index(self.folder_location)
+                    names.extend(
+                        file for files in index.files.values() for file in files
+                    )
+                elif name:
+                    names.append(os.fsdecode(name.rstrip(b"\0")))
+        return names
+
+    def close(self):
+        """stops watching the folder"""
+        if self.fd is not None:
+            os.close(self.fd)
+            self.fd = None
+
+
+class PollingWatcher:
+    """watches a folder by checking its image files every time it is asked
+    - a file is new once its size is the same for two checks in a row
+    so frames which are still being written are (usually) not seen"""
+
+    def __init__(self, folder_location):
+        """init method for PollingWatcher"""
+        self.folder_location = folder_location
+        # The image files already in the folder aren't new
+        index = folder_index(folder_location)
+        self.seen = {name for files in index.files.values() for name in files}
+        # The sizes of new files at the last check: name -> size
+        self.sizes = {}
+
+    def new_files(self):
+        """returns the names of the image files finished since it was last called"""
+        names = []
+        # The folder is only scanned again if files were added/removed
+        index = folder_index(self.folder_location)
+        for files in index.files.values():
+            for name in files:
+                if name in self.seen:
+                    continue
+                try:
+                    size = os.stat(os.path.join(self.folder_location, name)).st_size
+                except OSError:
+                    continue
+                # If it hasn't grown since the last check, it is finished
+                if size > 0 and self.sizes.get(name) == size:
+                    names.append(name)
+                    self.seen.add(name)
+                    del self.sizes[name]
+                else:
+                    self.sizes[name] = size
+        return names
+
+    def close(self):
+        """stops watching the folder"""
+        self.sizes = {}
+
+
+def make_watcher(folder_location):
+    """takes a folder location
+    - returns a watcher for the folder (inotify on Linux, otherwise polling)"""
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher(folder_location)
+        except (OSError, AttributeError, TypeError):
+            # inotify isn't available, so check the folder instead
+            pass
+    return PollingWatcher(folder_location)
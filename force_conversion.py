@@ -4,32 +4,169 @@ Program: Pillar Centroid Tracker
 Author: Haig Bishop (hbi34@uclive.ac.nz)
 """
 
+# Import local modules
+from position_filters import FilterStream, filter_positions
+
 # Mathematical/graph imports
-from math import pi, pow
+from math import pi
 import numpy as np
-from statistics import mean
 
+# The parameters which can be swept (in the order of the sweep table's columns)
+SWEEP_PARAMETERS = (
+    "pillar_diameter",
+    "pillar_height",
+    "pillar_contact",
+    "pdms_E",
+    "pdms_gama",
+)
+# The number of values each swept parameter takes (from -spread to +spread)
+SWEEP_STEPS = 3
+# The most (combinations x frames) force values calculated at once
+SWEEP_BLOCK_SIZE = 4_000_000
+# The number of frames converted (and written) at a time when streaming
+FORCE_BLOCK_SIZE = 65536
+# How close (after scaling) a value must be to a half to be rounded by Python
+HALF_TOLERANCE = 1e-6
+
+
+def round_values(values, places):
+    """takes an array of values and a number of decimal places
+    - returns them rounded like Python's round as a float64 array
+    - np.round scales the values first, so one just below/above a half can round
+    the other way (e.g. 1/40 s is really 0.02500000000000000139, so round gives
+    0.03 but np.round gives 0.02)
+    - the values near a half are rounded by Python, the rest by np.round"""
+    values = np.asarray(values, dtype=np.float64)
+    rounded = np.round(values, places)
+    scaled = values * 10.0**places
+    near_half = np.abs(np.abs(scaled - np.trunc(scaled)) - 0.5) < HALF_TOLERANCE
+    for index in np.flatnonzero(near_half):
+        rounded[index] = round(float(values[index]), places)
+    return rounded
 
-def force_convert_job(job):
+
+def force_convert_job(job, parameters=None):
     """takes a PF1 window job and processes the needed parameters for force conversion
+    - parameters is a dict of values to use instead of the job's (e.g. for a sweep)
     - returns the force converted values"""
     # Make all attributes floats
     job.floaterise()
+    # Get the parameters to use
+    params = {name: getattr(job, name) for name in SWEEP_PARAMETERS}
+    if parameters is not None:
+        params.update(parameters)
     # Uses the fps to calculate the time values for each frame
     frame_nums = list(range(1, len(job.x_vals) + 1))
-    t_vals = [(f - 1) / job.time_base for f in frame_nums]
+    t_vals = np.arange(len(job.x_vals)) / job.time_base
     # Use the force convert function to get all force values
     return force_convert(
         frame_nums,
-        job.pillar_diameter,
-        job.pillar_height,
-        job.pillar_contact,
+        params["pillar_diameter"],
+        params["pillar_height"],
+        params["pillar_contact"],
         job.x_vals,
         job.y_vals,
         t_vals,
         job.pixel_micron_ratio,
-        job.pdms_E,
-        job.pdms_gama,
+        params["pdms_E"],
+        params["pdms_gama"],
+    )
+
+
+def pillar_compliance(
+    pillar_diameter, pillar_height, pillar_contact, pdms_E, pdms_gama
+):
+    """Takes the pillar's dimensions and material properties
+    - returns the pillar's compliance (deflection per unit force)
+    - this is the same for every frame so it is only calculated once"""
+    # Calculate moment of inertia
+    pillar_I = pi * pow(pillar_diameter, 4) / 64
+    # Calculate pillar area
+    pillar_area = pi * pow(pillar_diameter, 2) / 4
+    # Calculate this for force calculations
+    a = pow(pillar_contact, 3) / (3 * pdms_E * pillar_I)
+    b = 20 * (1 + pdms_gama) * pillar_contact / (9 * pillar_area * pdms_E)
+    c = (
+        pow(pillar_contact, 2)
+        * (pillar_height - pillar_contact)
+        / (2 * pdms_E * pillar_I)
+    )
+    return a + b + c
+
+
+def nonzero_abs_mean(values):
+    """Takes an array
+    - returns the average of its absolute non-zero values (0 if they are all zero)"""
+    abs_values = np.abs(values)
+    abs_values = abs_values[abs_values != 0]
+    return float(abs_values.mean()) if len(abs_values) > 0 else 0
+
+
+def nonzero_abs_means(values):
+    """Takes a 2D array
+    - returns the average of each row's absolute non-zero values (0 for rows
+    which are all zero)"""
+    abs_values = np.abs(values)
+    counts = np.count_nonzero(abs_values, axis=1)
+    sums = abs_values.sum(axis=1)
+    return np.where(counts > 0, sums / np.maximum(counts, 1), 0)
+
+
+def force_convert_arrays(
+    x_vals,
+    y_vals,
+    pillar_diameter,
+    pillar_height,
+    pillar_contact,
+    pixel_micron_ratio,
+    pdms_E,
+    pdms_gama,
+):
+    """Takes the pillar positions (arrays) and all other values for force calculation
+    - performs the force conversion on whole arrays (nothing is rounded)
+    - returns the following...
+        - force component in x-direction (force_x)
+        - force component in y-direction (force_y)
+        - total force (force_total)
+        - average force component in x-direction (averageF_x)
+        - average force component in y-direction (averageF_y)
+        - total average force (averageF_total)
+        - delta force in x-direction (delta_Fx)
+        - delta force in y-direction (delta_Fy)
+        - total delta force (delta_totalF)"""
+    x_vals = np.asarray(x_vals, dtype=np.float64)
+    y_vals = np.asarray(y_vals, dtype=np.float64)
+    # Calculate deflections relative to initial pillar centre in um
+    delta_x = pixel_micron_ratio * (x_vals - x_vals[0])
+    delta_y = pixel_micron_ratio * (y_vals - y_vals[0])
+    # Calculate total deflection relative to initial pillar centre in um
+    delta_total = np.hypot(delta_x, delta_y)
+    # Calculate force in each direction
+    abc = pillar_compliance(
+        pillar_diameter, pillar_height, pillar_contact, pdms_E, pdms_gama
+    )
+    force_x = delta_x / abc
+    force_y = delta_y / abc
+    force_total = delta_total / abc
+    # Get average abs values of force arrays (non-zero elements only)
+    averageF_x = nonzero_abs_mean(force_x)
+    averageF_y = nonzero_abs_mean(force_y)
+    averageF_total = nonzero_abs_mean(force_total)
+    # Get change of force between frames (0 for the first frame to match frames)
+    delta_totalF = np.diff(force_total, prepend=force_total[:1])
+    delta_Fx = np.diff(np.abs(force_x), prepend=np.abs(force_x[:1]))
+    delta_Fy = np.diff(np.abs(force_y), prepend=np.abs(force_y[:1]))
+    # Return the values!
+    return (
+        force_x,
+        force_y,
+        force_total,
+        averageF_x,
+        averageF_y,
+        averageF_total,
+        delta_Fx,
+        delta_Fy,
+        delta_totalF,
     )
 
 
@@ -46,8 +183,8 @@ def force_convert(
     pdms_gama,
 ):
     """Takes all necessary values for force calculation
-    - performs the force conversion
-    - returns lists of the following...
+    - performs the force conversion (see force_convert_arrays)
+    - returns lists of the following (rounded)...
         - frame numbers (frame_nums)
         - time values in seconds (t_vals)
         - force component in x-direction (force_x)
@@ -59,85 +196,37 @@ def force_convert(
         - delta force in x-direction (delta_Fx)
         - delta force in y-direction (delta_Fy)
         - total delta force (delta_totalF)"""
-
-    # Calculate moment of inertia
-    pillar_I = pi * pow(pillar_diameter, 4) / 64
-    # Calculate pillar area
-    pillar_area = pi * pow(pillar_diameter, 2) / 4
-    # Start Positions
-    pillar_xstart = x_vals[0]
-    pillar_ystart = y_vals[0]
-    # Empty lists for displacement delta and forces
-    delta_x, delta_y, delta_total, force_x, force_y, force_total = (
-        [],
-        [],
-        [],
-        [],
-        [],
-        [],
-    )
-    # Perfom displacement and force calculation across all elements
-    for i in range(len(x_vals)):
-        # Current pillar centre
-        x_increment = x_vals[i]
-        y_increment = y_vals[i]
-        # Calculate deflections relative to initial pillar centre in um
-        delta_x.append(pixel_micron_ratio * (x_increment - pillar_xstart))
-        delta_y.append(pixel_micron_ratio * (y_increment - pillar_ystart))
-        # Calculate total deflection relative to initial pillar centre in um
-        delta_total.append(pow(pow(delta_x[i], 2) + pow(delta_y[i], 2), 0.5))
-        # Calculate this for force calculations
-        a = pow(pillar_contact, 3) / (3 * pdms_E * pillar_I)
-        b = 20 * (1 + pdms_gama) * pillar_contact / (9 * pillar_area * pdms_E)
-        c = (
-            pow(pillar_contact, 2)
-            * (pillar_height - pillar_contact)
-            / (2 * pdms_E * pillar_I)
-        )
-        abc = a + b + c
-        # Calculate force in each direction
-        force_x.append(delta_x[i] / abc)
-        force_y.append(delta_y[i] / abc)
-        force_total.append(delta_total[i] / abc)
-
-    # Get average abs values of force lists (non-zero elements only)
-    all_are_zero = all([val == 0 for val in force_x])
-    averageF_x = (
-        0 if all_are_zero else mean(list(filter(lambda x: x != 0, map(abs, force_x))))
-    )
-    all_are_zero = all([val == 0 for val in force_y])
-    averageF_y = (
-        0 if all_are_zero else mean(list(filter(lambda x: x != 0, map(abs, force_y))))
-    )
-    all_are_zero = all([val == 0 for val in force_total])
-    averageF_total = (
-        0
-        if all_are_zero
-        else mean(list(filter(lambda x: x != 0, map(abs, force_total))))
+    (
+        force_x,
+        force_y,
+        force_total,
+        averageF_x,
+        averageF_y,
+        averageF_total,
+        delta_Fx,
+        delta_Fy,
+        delta_totalF,
+    ) = force_convert_arrays(
+        x_vals,
+        y_vals,
+        pillar_diameter,
+        pillar_height,
+        pillar_contact,
+        pixel_micron_ratio,
+        pdms_E,
+        pdms_gama,
     )
-    # Get change of force between frames
-    delta_totalF = np.concatenate(
-        ([0], np.diff(force_total))
-    )  # Subtract previous element from next list element and prepend 0 to match frames
-    delta_Fx = np.concatenate(
-        ([0], np.diff(list(map(abs, force_x))))
-    )  # Subtract previous element from next list element and prepend 0 to match frames
-    delta_Fy = np.concatenate(
-        ([0], np.diff(list(map(abs, force_y))))
-    )  # Subtract previous element from next list element and prepend 0 to match frames
     # Round numbers
-    x_vals = [round(t) for t in x_vals]
-    y_vals = [round(t) for t in y_vals]
-    t_vals = [round(t, 2) for t in t_vals]
-    force_x = [round(t, 1) for t in force_x]
-    force_y = [round(t, 1) for t in force_y]
-    force_total = [round(t, 1) for t in force_total]
+    t_vals = round_values(t_vals, 2).tolist()
+    force_x = round_values(force_x, 1).tolist()
+    force_y = round_values(force_y, 1).tolist()
+    force_total = round_values(force_total, 1).tolist()
     averageF_x = round(averageF_x, 1)
     averageF_y = round(averageF_y, 1)
     averageF_total = round(averageF_total, 1)
-    delta_Fx = [round(t, 1) for t in delta_Fx]
-    delta_Fy = [round(t, 1) for t in delta_Fy]
-    delta_totalF = [round(t, 1) for t in delta_totalF]
+    delta_Fx = round_values(delta_Fx, 1).tolist()
+    delta_Fy = round_values(delta_Fy, 1).tolist()
+    delta_totalF = round_values(delta_totalF, 1).tolist()
     # Return the values!
     return (
         frame_nums,
@@ -152,3 +241,208 @@ def force_convert(
         delta_Fy,
         delta_totalF,
     )
+
+
+class ForceStream:
+    """converts positions to forces one block of frames at a time
+    - the start position and the last frame's forces are carried between blocks
+    (so the results are the same as force_convert_arrays)
+    - the non-zero averages are accumulated as each block is converted"""
+
+    def __init__(
+        self,
+        pillar_diameter,
+        pillar_height,
+        pillar_contact,
+        pixel_micron_ratio,
+        pdms_E,
+        pdms_gama,
+    ):
+        """init method for ForceStream"""
+        self.pixel_micron_ratio = pixel_micron_ratio
+        # Calculate the compliance once
+        self.abc = pillar_compliance(
+            pillar_diameter, pillar_height, pillar_contact, pdms_E, pdms_gama
+        )
+        # The position in the first frame (None until the first block)
+        self.start = None
+        # |force_x|, |force_y| and force_total in the last frame converted
+        self.previous = None
+        # The sum and number of non-zero |force_x|, |force_y| and force_total
+        self.sums = np.zeros(3)
+        self.counts = np.zeros(3, dtype=np.int64)
+
+    def convert(self, x_vals, y_vals):
+        """takes the positions in the next block of frames (arrays)
+        - returns force_x, force_y, force_total, delta_Fx, delta_Fy and
+        delta_totalF for the block (nothing is rounded)"""
+        x_vals = np.asarray(x_vals, dtype=np.float64)
+        y_vals = np.asarray(y_vals, dtype=np.float64)
+        if len(x_vals) == 0:
+            empty = np.zeros(0)
+            return empty, empty, empty, empty, empty, empty
+        # The first frame of the first block is the start position
+        if self.start is None:
+            self.start = (x_vals[0], y_vals[0])
+        # Calculate deflections relative to initial pillar centre in um
+        delta_x = self.pixel_micron_ratio * (x_vals - self.start[0])
+        delta_y = self.pixel_micron_ratio * (y_vals - self.start[1])
+        # Calculate force in each direction
+        force_x = delta_x / self.abc
+        force_y = delta_y / self.abc
+        force_total = np.hypot(delta_x, delta_y) / self.abc
+        # Accumulate the non-zero averages
+        abs_x, abs_y = np.abs(force_x), np.abs(force_y)
+        for index, values in enumerate([abs_x, abs_y, force_total]):
+            self.sums[index] += values.sum()
+            self.counts[index] += np.count_nonzero(values)
+        # Get change of force between frames (from the last block's last frame)
+        if self.previous is None:
+            self.previous = (abs_x[0], abs_y[0], force_total[0])
+        delta_Fx = np.diff(abs_x, prepend=self.previous[0])
+        delta_Fy = np.diff(abs_y, prepend=self.previous[1])
+        delta_totalF = np.diff(force_total, prepend=self.previous[2])
+        self.previous = (abs_x[-1], abs_y[-1], force_total[-1])
+        return force_x, force_y, force_total, delta_Fx, delta_Fy, delta_totalF
+
+    def averages(self):
+        """returns averageF_x, averageF_y and averageF_total so far
+        (the average absolute non-zero forces)"""
+        return tuple(
+            float(total / count) if count > 0 else 0
+            for total, count in zip(self.sums, self.counts)
+        )
+
+
+def force_file_blocks(job, parameters=None, block_size=FORCE_BLOCK_SIZE):
+    """takes a PF1 window job (and maybe some parameters to use instead of its own)
+    - yields the columns of a position & force file one block of frames at a time
+    (in the order of the app's COL_NAMES, rounded like force_convert)
+    - if the job has a position filter, the filtered x and y positions follow the
+    raw ones (see FILTERED_COL_NAMES) and the forces use the filtered positions
+    - the positions are never converted to lists, so memory use stays flat"""
+    # Get the parameters to use
+    params = {name: float(getattr(job, name)) for name in SWEEP_PARAMETERS}
+    if parameters is not None:
+        params.update(parameters)
+    pixel_micron_ratio = float(job.pixel_micron_ratio)
+    time_base = float(job.time_base)
+    stream = ForceStream(
+        params["pillar_diameter"],
+        params["pillar_height"],
+        params["pillar_contact"],
+        pixel_micron_ratio,
+        params["pdms_E"],
+        params["pdms_gama"],
+    )
+    # The filters may hold frames back until the next block
+    filter_type, filter_size = job.filter_type, float(job.filter_size)
+    x_filter = FilterStream(filter_type, filter_size)
+    y_filter = FilterStream(filter_type, filter_size)
+    x_vals = np.asarray(job.x_vals, dtype=np.float64)
+    y_vals = np.asarray(job.y_vals, dtype=np.float64)
+    num_done = 0
+    for start in range(0, len(x_vals), block_size):
+        stop = start + block_size
+        final = stop >= len(x_vals)
+        x_filtered = x_filter.filter(x_vals[start:stop], final)
+        y_filtered = y_filter.filter(y_vals[start:stop], final)
+        if len(x_filtered) == 0:
+            continue
+        # The frames which have been filtered
+        frames = slice(num_done, num_done + len(x_filtered))
+        num_done += len(x_filtered)
+        force_x, force_y, force_total, delta_Fx, delta_Fy, _ = stream.convert(
+            x_filtered, y_filtered
+        )
+        # Frame numbers and time values (in seconds)
+        frame_nums = np.arange(frames.start + 1, frames.stop + 1)
+        t_vals = round_values((frame_nums - 1) / time_base, 2)
+        columns = [frame_nums, t_vals, x_vals[frames], y_vals[frames]]
+        # The filtered positions go alongside the raw ones
+        if filter_type != "None":
+            columns += [round_values(x_filtered, 2), round_values(y_filtered, 2)]
+        yield columns + [
+            round_values(x_filtered / pixel_micron_ratio, 1),
+            round_values(y_filtered / pixel_micron_ratio, 1),
+            round_values(force_total, 1),
+            round_values(force_x, 1),
+            round_values(force_y, 1),
+            round_values(delta_Fx, 1),
+            round_values(delta_Fy, 1),
+        ]
+
+
+def parameter_grid(base_values, spread, steps=SWEEP_STEPS):
+    """Takes a dict of parameter values, a spread (e.g. 0.1 for ±10%)
+    and the number of values for each parameter
+    - returns a dict of 1D arrays with one value for every combination
+    - each parameter in SWEEP_PARAMETERS takes values from -spread to +spread"""
+    factors = np.linspace(1 - spread, 1 + spread, steps)
+    axes = [float(base_values[name]) * factors for name in SWEEP_PARAMETERS]
+    grids = np.meshgrid(*axes, indexing="ij")
+    return {name: grid.ravel() for name, grid in zip(SWEEP_PARAMETERS, grids)}
+
+
+def force_sweep(x_vals, y_vals, pixel_micron_ratio, params):
+    """Takes the pillar positions, the pixel to micron ratio
+    and a dict of parameter arrays (see parameter_grid)
+    - calculates the forces for every combination at once (broadcasting)
+    - returns force_x, force_y and force_total, each (combinations x frames)"""
+    x_vals = np.asarray(x_vals, dtype=np.float64)
+    y_vals = np.asarray(y_vals, dtype=np.float64)
+    # Calculate deflections relative to initial pillar centre in um (1 row)
+    delta_x = pixel_micron_ratio * (x_vals - x_vals[0])
+    delta_y = pixel_micron_ratio * (y_vals - y_vals[0])
+    delta_total = np.hypot(delta_x, delta_y)
+    # Calculate the compliance of every combination (1 column)
+    abc = pillar_compliance(**{name: params[name] for name in SWEEP_PARAMETERS})
+    inverse_abc = (1 / np.asarray(abc, dtype=np.float64))[:, np.newaxis]
+    # Calculate force in each direction (combinations x frames)
+    return delta_x * inverse_abc, delta_y * inverse_abc, delta_total * inverse_abc
+
+
+def sweep_summary(x_vals, y_vals, pixel_micron_ratio, params):
+    """Takes the pillar positions, the pixel to micron ratio
+    and a dict of parameter arrays (see parameter_grid)
+    - returns a dict of arrays (one value per combination) of the average
+    x, y and total forces and the maximum total force
+    - combinations are done in blocks so large files don't use too much memory"""
+    num_combinations = len(params[SWEEP_PARAMETERS[0]])
+    block_size = max(1, SWEEP_BLOCK_SIZE // max(1, len(x_vals)))
+    summary = {
+        "averageF_x": np.zeros(num_combinations),
+        "averageF_y": np.zeros(num_combinations),
+        "averageF_total": np.zeros(num_combinations),
+        "maxF_total": np.zeros(num_combinations),
+    }
+    for start in range(0, num_combinations, block_size):
+        block = slice(start, start + block_size)
+        force_x, force_y, force_total = force_sweep(
+            x_vals,
+            y_vals,
+            pixel_micron_ratio,
+            {name: values[block] for name, values in params.items()},
+        )
+        summary["averageF_x"][block] = nonzero_abs_means(force_x)
+        summary["averageF_y"][block] = nonzero_abs_means(force_y)
+        summary["averageF_total"][block] = nonzero_abs_means(force_total)
+        summary["maxF_total"][block] = force_total.max(axis=1)
+    return summary
+
+
+def force_sweep_job(job, spread):
+    """takes a PF1 window job and a spread (e.g. 0.1 for ±10%)
+    - returns the parameter grid and the sweep summary (see sweep_summary)"""
+    params = parameter_grid(
+        {name: float(getattr(job, name)) for name in SWEEP_PARAMETERS}, spread
+    )
+    # Use the same (filtered) positions as the force file
+    filter_type, filter_size = job.filter_type, float(job.filter_size)
+    summary = sweep_summary(
+        filter_positions(job.x_vals, filter_type, filter_size),
+        filter_positions(job.y_vals, filter_type, filter_size),
+        float(job.pixel_micron_ratio),
+        params,
+    )
+    return params, summary
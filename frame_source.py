@@ -0,0 +1,216 @@
+"""
+Module: Reading frames from image files, multi-page TIFF stacks and videos
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import modules for computer vision
+from cv2 import (
+    imread,
+    imcount,
+    imreadmulti,
+    VideoCapture,
+    CAP_PROP_FRAME_COUNT,
+    CAP_PROP_POS_FRAMES,
+    IMREAD_COLOR,
+    IMREAD_GRAYSCALE,
+    IMREAD_ANYDEPTH,
+    cvtColor,
+    COLOR_BGR2GRAY,
+)
+
+# Import modules for dealing with files
+from collections import OrderedDict
+import os
+
+# Import modules for threading
+from threading import Lock
+
+# Separates a stack/video location from a frame index in a frame location
+# e.g. 'C:\Desktop\stack.tif::12' is the 13th page of stack.tif
+FRAME_SEPARATOR = "::"
+# Files which can hold many frames
+STACK_TYPES = (".tif", ".tiff")
+VIDEO_TYPES = (".avi", ".mp4", ".mov", ".mkv")
+# Reads a single channel image at its own bit depth (e.g. 16-bit TIFFs stay 16-bit)
+GRAY_FLAGS = IMREAD_GRAYSCALE | IMREAD_ANYDEPTH
+# The number of TIFF pages read at a time (so reading in order is fast)
+STACK_CHUNK_SIZE = 16
+# The number of stacks/videos kept open
+SOURCE_CACHE_SIZE = 4
+# Open stacks/videos: location -> source
+SOURCES = OrderedDict()
+SOURCES_LOCK = Lock()
+
+
+class StackSource:
+    """the pages of a multi-page TIFF file
+    - pages are read a chunk at a time, so reading them in order only opens the
+    file once per chunk"""
+
+    def __init__(self, location):
+        """init method for StackSource"""
+        self.location = location
+        self.count = imcount(location)
+        self.lock = Lock()
+        # The last chunk read: (first page index, imread flags, pages)
+        self.chunk = (0, IMREAD_COLOR, [])
+
+    def read(self, index, flags=IMREAD_COLOR):
+        """takes a page index and imread flags
+        - returns that page (None if it can't be read)"""
+        with self.lock:
+            start, chunk_flags, pages = self.chunk
+            # If the page isn't in the last chunk, read the chunk starting at it
+            if chunk_flags != flags or not start <= index < start + len(pages):
+                count = min(STACK_CHUNK_SIZE, self.count - index)
+                if index < 0 or count <= 0:
+                    return None
+                ok, pages = imreadmulti(
+                    self.location, start=index, count=count, flags=flags
+                )
+                if not ok:
+                    return None
+                start, pages = index, list(pages)
+                self.chunk = (start, flags, pages)
+            return pages[index - start]
+
+
+class VideoSource:
+    """the frames of a video file
+    - the video is kept open, so reading frames in order doesn't seek"""
+
+    def __init__(self, location):
+        """init method for VideoSource"""
+        self.location = location
+        self.capture = VideoCapture(location)
+        if not self.capture.isOpened():
+            raise OSError("Can't open video: " + location)
+        self.count = int(self.capture.get(CAP_PROP_FRAME_COUNT))
+        self.lock = Lock()
+        # The index of the frame the video will read next
+        self.next_index = 0
+
+    def read(self, index, flags=IMREAD_COLOR):
+        """takes a frame index and imread flags
+        - returns that frame (None if it can't be read)
+        - video frames are always 8-bit, so only the colour flag is used"""
+        with self.lock:
+            # Only seek if not reading the next frame
+            if index != self.next_index:
+                self.capture.set(CAP_PROP_POS_FRAMES, index)
+            ok, frame = self.capture.read()
+            self.next_index = index + 1 if ok else -1
+        if not ok:
+            return None
+        # Convert to grayscale if asked
+        if not flags & IMREAD_COLOR:
+            frame = cvtColor(frame, COLOR_BGR2GRAY)
+        return frame
+
+
+def is_container(location):
+    """takes a file/folder location
+    - returns True if it is a TIFF stack (more than one page) or a video"""
+    extension = os.path.splitext(location)[1].lower()
+    if not os.path.isfile(location):
+        return False
+    if extension in VIDEO_TYPES:
+        return True
+    if extension in STACK_TYPES:
+        try:
+            return imcount(location) > 1
+        except Exception:
+            return False
+    return False
+
+
+def open_source(location):
+    """takes the location of a TIFF stack or video
+    - returns its source (only opened once if possible)"""
+    with SOURCES_LOCK:
+        source = SOURCES.get(location)
+        if source is not None:
+            SOURCES.move_to_end(location)
+            return source
+    if os.path.splitext(location)[1].lower() in VIDEO_TYPES:
+        source = VideoSource(location)
+    else:
+        source = StackSource(location)
+    with SOURCES_LOCK:
+        # Remember it (forgetting the oldest if there are too many)
+        SOURCES[location] = source
+        while len(SOURCES) > SOURCE_CACHE_SIZE:
+            SOURCES.popitem(last=False)
+    return source
+
+
+def frame_location(location, index):
+    """takes the location of a TIFF stack or video and a frame index
+    - returns the location of that frame"""
+    return location + FRAME_SEPARATOR + str(index)
+
+
+def split_frame_location(image_loc):
+    """takes an image location
+    - returns (stack/video location, frame index) for a frame in a stack/video
+    - returns (image location, None) for an image file"""
+    location, separator, index = image_loc.rpartition(FRAME_SEPARATOR)
+    if separator and index.isdigit():
+        return location, int(index)
+    return image_loc, None
+
+
+def frame_locations(location):
+    """takes the location of a TIFF stack or video
+    - returns the locations of all of its frames and its file type"""
+    source = open_source(location)
+    extension = os.path.splitext(location)[1].lower()
+    return [frame_location(location, index) for index in range(source.count)], extension
+
+
+def read_frame(image_loc, flags=IMREAD_COLOR):
+    """takes an image location (an image file or a frame in a stack/video)
+    - returns the image (BGR by default) or None if it can't be read"""
+    location, index = split_frame_location(image_loc)
+    if index is None:
+        return imread(image_loc, flags)
+    try:
+        return open_source(location).read(index, flags)
+    except OSError:
+        return None
+
+
+def read_gray_frame(image_loc):
+    """takes an image location (an image file or a frame in a stack/video)
+    - returns the image as a single channel at its own bit depth
+    (uint8, uint16 or float32) or None if it can't be read"""
+    return read_frame(image_loc, GRAY_FLAGS)
+
+
+def frame_modified_time(image_loc):
+    """takes an image location
+    - returns when its file was last modified"""
+    return os.path.getmtime(split_frame_location(image_loc)[0])
+
+
+def split_image_location(image_loc):
+    """takes an image location
+    - returns (folder, file name, extension) for naming files made from it
+    e.g. 'C:/folder/image.jpg' -> ('C:/folder/', 'image', '.jpg')
+    - frames in a stack/video are named after the frame and use .png
+    e.g. 'C:/folder/stack.tif::12' -> ('C:/folder/', 'stack_00013', '.png')"""
+    location, index = split_frame_location(image_loc)
+    # Find indicies for the last slash and the last dot
+    slash_index = max([location.rfind("\\"), location.rfind("/")])
+    dot_index = location.rfind(".")
+    # Get the folder location
+    folder = location[: slash_index + 1]  # 'C:/Desktop/folder/'
+    # Get the file name
+    filename = location[slash_index + 1 : dot_index]  # 'filename'
+    # Get the image extension
+    extension = location[dot_index:]  #'.jpg'
+    if index is not None:
+        filename += "_" + str(index + 1).zfill(5)
+        extension = ".png"
+    return folder, filename, extension
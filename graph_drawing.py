@@ -0,0 +1,134 @@
+"""
+Module: Drawing graphs and exporting them as .png/.svg files (force -> graph screen 2)
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from decimation import decimate_spec
+
+# Import modules for dealing with graphs
+import matplotlib
+import matplotlib.pyplot as plt
+
+# Set the plot font to Arial and turn off debug logging
+matplotlib.use("Agg")
+plt.rcParams["font.family"] = "Arial"
+plt.set_loglevel("error")
+
+# The size (inches) and resolution of exported graphs
+FIGURE_SIZE = (6, 4.5)
+EXPORT_DPI = 300
+# The most points drawn in each list of data in a decimated svg
+SVG_MAX_POINTS = 4000
+# How svg graphs are exported (png graphs always have every point)
+# Full: every point, Decimated: SVG_MAX_POINTS, Rasterised: the data as an image
+SVG_POLICIES = ("Full", "Decimated", "Rasterised")
+
+
+def y_limits(spec):
+    """takes a graph spec (see graph_export.graph_spec)
+    - returns the y axis limits (the y range with a 5% margin)"""
+    y_min, y_max = float(spec["y_min"]), float(spec["y_max"])
+    return (y_min - 0.05 * (y_max - y_min), y_max + 0.05 * (y_max - y_min))
+
+
+def plot_data(ax, spec):
+    """takes a matplotlib axes and a graph spec (see graph_export.graph_spec)
+    - plots the data as the spec's plot type (and a legend if there are two lists)
+    - returns the artists for each list of data"""
+    x_list, y_list, y_list2 = spec["x_list"], spec["y_list"], spec["y_list2"]
+    artists = []
+    # If line plot
+    if spec["plot_type"] == "Line":
+        # If two lists of data points
+        if y_list2 is not None:
+            # Label the two lists
+            artists += ax.plot(x_list, y_list, label="x-direction", clip_on=False)
+            artists += ax.plot(x_list, y_list2, label="y-direction", clip_on=False)
+        # If only one list of data points
+        else:
+            artists += ax.plot(x_list, y_list)
+    # If dot plot
+    elif spec["plot_type"] == "Scatter":
+        # If two lists of data points
+        if y_list2 is not None:
+            # Label the two lists
+            artists.append(ax.scatter(x_list, y_list, label="x-direction"))
+            artists.append(ax.scatter(x_list, y_list2, label="y-direction"))
+        # If only one list of data points
+        else:
+            artists.append(ax.scatter(x_list, y_list))
+    # If bar plot
+    elif spec["plot_type"] == "Bar":
+        # If two lists of data points
+        if y_list2 is not None:
+            # Label the two lists
+            artists.append(ax.bar(x_list, y_list, label="x-direction"))
+            artists.append(ax.bar(x_list, y_list2, label="y-direction"))
+        # If only one list of data points
+        else:
+            artists.append(ax.bar(x_list, y_list))
+    # Add the legend (if two lists)
+    if y_list2 is not None and artists:
+        ax.legend()
+    return artists
+
+
+def draw_graph(ax, spec):
+    """takes a matplotlib axes and a graph spec (see graph_export.graph_spec)
+    - clears the axes and draws the graph on it
+    - returns the artists for each list of data"""
+    # Clear the plot
+    ax.cla()
+    # Set data ranges
+    ax.set_ylim(y_limits(spec))
+    # Plot the data
+    artists = plot_data(ax, spec)
+    # Add labels to the x and y axis
+    ax.set_xlabel(spec["x_label"])
+    ax.set_ylabel(spec["y_label"])
+    # Add a title to the graph
+    ax.set_title(spec["title_label"])
+    return artists
+
+
+def export_graph(spec):
+    """takes a graph spec with a file location (see graph_export.graph_spec)
+    - draws the graph and saves it as .png (every point) and/or .svg
+    (following the spec's svg policy, see SVG_POLICIES)
+    - runs in an export process (see BatchExporter) or on the main thread
+    - returns the file location"""
+    fig, ax = plt.subplots(figsize=FIGURE_SIZE)
+    try:
+        # A decimated svg on its own doesn't need every point drawn
+        svg_decimated = spec["svg"] and spec["svg_policy"] == "Decimated"
+        if spec["png"] or not svg_decimated:
+            artists = draw_graph(ax, spec)
+        # Save the png straight from the figure
+        if spec["png"]:
+            fig.savefig(
+                spec["file_location"] + ".png",
+                format="png",
+                facecolor="white",
+                dpi=EXPORT_DPI,
+                bbox_inches="tight",
+            )
+        # Save the svg (with fewer points or the data as an image if chosen)
+        if spec["svg"]:
+            if svg_decimated:
+                draw_graph(ax, decimate_spec(spec, SVG_MAX_POINTS))
+            elif spec["svg_policy"] == "Rasterised":
+                for artist in artists:
+                    # Bar plots are containers of patches
+                    for part in getattr(artist, "patches", [artist]):
+                        part.set_rasterized(True)
+            fig.savefig(
+                spec["file_location"] + ".svg",
+                bbox_inches="tight",
+                format="svg",
+                dpi=EXPORT_DPI,
+            )
+    finally:
+        plt.close(fig)
+    return spec["file_location"]
@@ -0,0 +1,367 @@
+"""
+Module: Graph previews and exporting graphs in parallel (force -> graph screen 2)
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Kivy imports
+from kivy.clock import Clock
+from kivy.logger import Logger
+
+# Import modules for multiprocessing
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import multiprocessing
+import sys
+import os
+
+# Import local modules
+from decimation import decimate_spec
+from graph_drawing import y_limits, plot_data, export_graph
+import graph_drawing
+
+# Import modules for caching
+from collections import OrderedDict
+
+# Import numpy
+import numpy as np
+
+# The resolution of graph previews
+PREVIEW_DPI = 150
+# The number of processes exporting graphs (one CPU is left for the app)
+EXPORT_PROCESSES = max(1, min(4, (os.cpu_count() or 1) - 1))
+# How often (in seconds) the export is checked on
+CHECK_INTERVAL = 0.1
+# The number of rendered graph previews which are kept (see RenderCache)
+RENDER_CACHE_SIZE = 24
+# The most points drawn in each list of data in a preview
+PREVIEW_MAX_POINTS = 2000
+# The data columns and the decimal places they are rounded to for each graph
+# graph number -> (x column, (y column, decimal places), second y column or None)
+GRAPH_COLUMNS = {
+    1: ("t_col", ("tf_col", 1), None),
+    2: ("t_col", ("xf_col", 1), ("yf_col", 1)),
+    3: ("t_col", ("xf_col", 1), None),
+    4: ("t_col", ("yf_col", 1), None),
+    5: ("t_col", ("x_col", 2), None),
+    6: ("t_col", ("y_col", 2), None),
+    7: ("t_col", ("dfx_col", 1), None),
+    8: ("t_col", ("dfy_col", 1), None),
+}
+
+
+def rounded_column(job, col_name, places):
+    """takes an FG2 job, the name of one of its columns and the decimal places
+    - returns the column rounded as an array
+    - each column is only rounded once per job (they are kept in job.rounded_cols)"""
+    key = (col_name, places)
+    if key not in job.rounded_cols:
+        values = np.asarray(getattr(job, col_name), dtype=np.float64)
+        job.rounded_cols[key] = np.round(values, places)
+    return job.rounded_cols[key]
+
+
+def graph_spec(
+    job,
+    graph_num,
+    file_location=None,
+    svg=False,
+    png=False,
+    svg_policy="Full",
+    max_points=None,
+):
+    """takes an FG2 job, a graph number and maybe where/how to export it
+    - returns everything needed to draw the graph as a dict
+    - it only holds arrays, strings and numbers so it can be sent to another process
+    - with max_points the data is decimated (see decimate_spec), which is only
+    done once per graph and plot type (kept in job.rounded_cols)"""
+    x_col, (y_col, y_places), y_col2 = GRAPH_COLUMNS[graph_num]
+    graph = getattr(job, "graph_" + str(graph_num))
+    spec = {
+        "x_list": rounded_column(job, x_col, 2),
+        "y_list": rounded_column(job, y_col, y_places),
+        "y_list2": None,  # There may or may not be a second list of data
+        "x_label": graph["x_title"],
+        "y_label": graph["y_title"],
+        "title_label": graph["title"],
+        "y_min": graph["y_min"],
+        "y_max": graph["y_max"],
+        "plot_type": job.plot_type,
+        "file_location": file_location,
+        "svg": svg,
+        "png": png,
+        "svg_policy": svg_policy,
+        "total_points": len(getattr(job, x_col)),
+    }
+    if y_col2 is not None:
+        y_col2, y_places2 = y_col2
+        spec["y_list2"] = rounded_column(job, y_col2, y_places2)
+    if max_points is not None:
+        key = ("decimated", graph_num, job.plot_type, max_points)
+        if key not in job.rounded_cols:
+            small_spec = decimate_spec(spec, max_points)
+            job.rounded_cols[key] = (
+                small_spec["x_list"],
+                small_spec["y_list"],
+                small_spec["y_list2"],
+            )
+        spec["x_list"], spec["y_list"], spec["y_list2"] = job.rounded_cols[key]
+    return spec
+
+
+def points_text(spec):
+    """takes a graph spec (see graph_spec)
+    - returns the number of points drawn as text e.g. '2,000 of 50,000 points'"""
+    num_points = len(spec["x_list"])
+    if num_points == spec["total_points"]:
+        return "{:,} points".format(num_points)
+    return "{:,} of {:,} points".format(num_points, spec["total_points"])
+
+
+def render_key(job, graph_num, size):
+    """takes an FG2 job, a graph number and the size it is shown at
+    - returns a key for everything which changes how the graph preview looks
+    (see RenderCache)"""
+    graph = getattr(job, "graph_" + str(graph_num))
+    return (
+        job.uid,
+        graph_num,
+        job.plot_type,
+        graph["title"],
+        graph["x_title"],
+        graph["y_title"],
+        str(graph["y_min"]),
+        str(graph["y_max"]),
+        tuple(size),
+    )
+
+
+class RenderCache:
+    """keeps the most recently used graph previews (e.g. rendered pixels)
+    - they are keyed by render_key, so editing a graph only changes its own key
+    - once there are more than max_items, the least recently used one is dropped"""
+
+    def __init__(self, max_items=RENDER_CACHE_SIZE):
+        """init method for RenderCache"""
+        self.max_items = max_items
+        self.items = OrderedDict()
+
+    def get(self, key):
+        """takes a render key
+        - returns the preview (or None if it isn't kept)"""
+        if key not in self.items:
+            return None
+        self.items.move_to_end(key)
+        return self.items[key]
+
+    def put(self, key, value):
+        """takes a render key and its preview
+        - keeps it (dropping the least recently used if there are too many)"""
+        self.items[key] = value
+        self.items.move_to_end(key)
+        while len(self.items) > self.max_items:
+            self.items.popitem(last=False)
+
+    def discard_job(self, job):
+        """takes an FG2 job
+        - drops all of its previews (e.g. when it is removed)"""
+        for key in [key for key in self.items if key[0] == job.uid]:
+            del self.items[key]
+
+
+class GraphPreview:
+    """draws the graph previews on one figure, keeping its artists between graphs
+    - if the plot type and number of lists are the same, the data is put into the
+    old lines/dots with set_data/set_offsets (bars are always made again)
+    - the titles are animated, so the figure is drawn without them and kept as a
+    background, so editing a title only redraws the titles on top of it (blitting)
+    - anything else (data, y range, a title becoming empty) redraws the figure"""
+
+    def __init__(self, fig, ax):
+        """init method for GraphPreview"""
+        self.fig = fig
+        self.ax = ax
+        # The spec last drawn (None if nothing has been drawn)
+        self.spec = None
+        # The artists for each list of data
+        self.artists = []
+        # The figure without the titles (from the last full draw)
+        self.background = None
+        # The titles are drawn separately from the rest of the figure
+        for text in self.texts():
+            text.set_animated(True)
+
+    def texts(self):
+        """returns the title and axis label artists"""
+        return [self.ax.title, self.ax.xaxis.label, self.ax.yaxis.label]
+
+    def render(self, spec):
+        """takes a graph spec (see graph_spec)
+        - updates the figure, only redrawing what has changed
+        - returns the RGBA pixels (bytes, from the top row down) and the size"""
+        old_spec, self.spec = self.spec, spec
+        canvas = self.fig.canvas
+        redraw = self.background is None
+        # If the data has changed (the columns are the same arrays if not)
+        if old_spec is None or any(
+            old_spec[name] is not spec[name]
+            for name in ["x_list", "y_list", "y_list2", "plot_type"]
+        ):
+            self.update_data(old_spec, spec)
+            redraw = True
+        # If the y range has changed
+        if self.ax.get_ylim() != y_limits(spec):
+            self.ax.set_ylim(y_limits(spec))
+            redraw = True
+        # Update the titles (a title becoming empty/not changes the layout)
+        titles = [spec["title_label"], spec["x_label"], spec["y_label"]]
+        for text, title in zip(self.texts(), titles):
+            if bool(text.get_text()) != bool(title):
+                redraw = True
+            text.set_text(title)
+        if redraw:
+            # Draw everything but the titles, and keep that as the background
+            canvas.draw()
+            self.background = canvas.copy_from_bbox(self.fig.bbox)
+        else:
+            # Go back to the background
+            canvas.restore_region(self.background)
+        # Draw the titles on top
+        for text in self.texts():
+            self.ax.draw_artist(text)
+        return bytes(canvas.buffer_rgba()), canvas.get_width_height()
+
+    def update_data(self, old_spec, spec):
+        """takes the spec last drawn (or None) and the new spec
+        - puts the new data into the old artists (or makes new ones)"""
+        x_list = spec["x_list"]
+        y_lists = [spec["y_list"]]
+        if spec["y_list2"] is not None:
+            y_lists.append(spec["y_list2"])
+        # If the same kind of artists can be reused
+        if (
+            old_spec is not None
+            and old_spec["plot_type"] == spec["plot_type"] != "Bar"
+            and (old_spec["y_list2"] is None) == (spec["y_list2"] is None)
+            and len(self.artists) == len(y_lists)
+        ):
+            for artist, y_list in zip(self.artists, y_lists):
+                if spec["plot_type"] == "Line":
+                    artist.set_data(x_list, y_list)
+                else:
+                    artist.set_offsets(np.column_stack([x_list, y_list]))
+        else:
+            # Remove the old artists (and legend) and make new ones
+            for artist in self.artists:
+                artist.remove()
+            if self.ax.get_legend() is not None:
+                self.ax.get_legend().remove()
+            self.ax.set_prop_cycle(None)
+            self.artists = plot_data(self.ax, spec)
+        # Fit the x axis to the data (like autoscaling would)
+        self.ax.relim()
+        self.ax.autoscale(axis="x")
+        if spec["plot_type"] != "Bar" and len(x_list) > 0:
+            x_min, x_max = float(np.min(x_list)), float(np.max(x_list))
+            margin = 0.05 * (x_max - x_min)
+            self.ax.set_xlim(x_min - margin, x_max + margin)
+
+
+@contextmanager
+def worker_main():
+    """makes graph_drawing the main module while export processes are started
+    - spawned processes import the main module before anything else, and the app's
+    main file imports kivy (which would open another window in each process)
+    - graph_drawing doesn't import kivy, so the processes only load what they need
+    - the packaged .exe doesn't import the main module (see freeze_support)"""
+    main_module = sys.modules["__main__"]
+    sys.modules["__main__"] = graph_drawing
+    try:
+        yield
+    finally:
+        sys.modules["__main__"] = main_module
+
+
+class BatchExporter:
+    """exports many graphs without blocking the app
+    - graphs are exported by a pool of spawned processes (forking the running
+    app could deadlock on its threads), a single graph is exported on the main thread
+    - if the processes can't be started, one graph is exported on each clock tick
+    - on_progress(done, total) is called as graphs finish
+    - on_finished(errors) is called at the end with a list of error strings"""
+
+    def __init__(self, specs, on_progress, on_finished):
+        """init method for BatchExporter"""
+        self.specs = specs
+        self.on_progress = on_progress
+        self.on_finished = on_finished
+        self.errors = []
+        self.pool = None
+        self.futures = []
+        self.num_done = 0
+        self.clock_event = None
+
+    def start(self):
+        """starts exporting the graphs"""
+        if len(self.specs) > 1:
+            try:
+                # The processes are started as the graphs are submitted
+                with worker_main():
+                    self.pool = ProcessPoolExecutor(
+                        max_workers=min(EXPORT_PROCESSES, len(self.specs)),
+                        mp_context=multiprocessing.get_context("spawn"),
+                    )
+                    self.futures = [
+                        self.pool.submit(export_graph, spec) for spec in self.specs
+                    ]
+            except (OSError, RuntimeError, ValueError) as error:
+                # Processes can't be started, so export on the main thread
+                Logger.warning(
+                    "GraphExport: export processes failed to start (%s), "
+                    "exporting on the main thread",
+                    error,
+                )
+                self.close_pool()
+        self.on_progress(0, len(self.specs))
+        self.clock_event = Clock.schedule_interval(self.check, CHECK_INTERVAL)
+
+    def check(self, *args):
+        """called by the clock
+        - counts the finished graphs (or exports the next one on the main thread)"""
+        if self.pool is not None:
+            # Collect the graphs finished by the export processes
+            while self.futures and self.futures[0].done():
+                future = self.futures.pop(0)
+                try:
+                    future.result()
+                except Exception as error:
+                    self.add_error(self.specs[self.num_done], error)
+                self.num_done += 1
+        elif self.num_done < len(self.specs):
+            # Export the next graph here
+            spec = self.specs[self.num_done]
+            try:
+                export_graph(spec)
+            except Exception as error:
+                self.add_error(spec, error)
+            self.num_done += 1
+        self.on_progress(self.num_done, len(self.specs))
+        # If every graph has been exported
+        if self.num_done >= len(self.specs):
+            self.clock_event.cancel()
+            self.clock_event = None
+            self.close_pool()
+            self.on_finished(self.errors)
+
+    def add_error(self, spec, error):
+        """takes a graph spec and the error which stopped it exporting
+        - remembers the error"""
+        file_name = os.path.basename(spec["file_location"].replace("\\", "/"))
+        self.errors.append(" • " + file_name + " (" + str(error) + ")\n")
+
+    def close_pool(self):
+        """shuts down the export processes (if any)"""
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+        self.futures = []
@@ -20,6 +20,8 @@ from file_management import (
 )
 from start_point_detector import start_point_detector
 from pillar_tracker import pillar_tracker
+from display_pyramid import DisplayPyramid
+from frame_source import read_frame, split_image_location
 
 # Kivy imports
 from kivy.app import App
@@ -137,7 +139,11 @@ class IP2Window(Screen):
             # Add the radius to a list
             radii.append(job.radius)
             # Write a position .csv file with this data
-            write_pos_file(new_file_loc, position_data)
+            write_pos_file(
+                new_file_loc,
+                position_data,
+                schema={"source_folder": job.folder_location},
+            )
         # Make pop up - alerts of files saved
         popup = IP2SuccessPopup(
             new_file_locs,
@@ -340,7 +346,7 @@ class IP2JobListBox(Button):
         - optional histogram clipping"""
         # Read the first image
         image_loc = self.first_image_location
-        image = imread(image_loc)
+        image = read_frame(image_loc)
         # Convert to grayscale
         gray = cvtColor(image, COLOR_BGR2GRAY)
         # Set histogram clip percentage
@@ -377,7 +383,7 @@ class IP2JobListBox(Button):
         - calculates the optimal scale for the axis overlay"""
         # Read the first image
         image_loc = self.first_image_location
-        image = imread(image_loc)
+        image = read_frame(image_loc)
         # Get the smallest side
         min_image_side = min([image.shape[0], image.shape[1]])
         # Just divide that by 10
@@ -414,6 +420,22 @@ class StartPointImage(Image):
         # Set attributes for zooming
         self.zoomed = False
         self.crop_bbox = None  # Box pixel box that is zoomed in on
+        # Downsampled previews of the first images (sized to fit this widget)
+        self.pyramid = DisplayPyramid()
+        self.image_scale = 1  # Displayed pixels per image pixel
+        # Redraw the image (at the new preview size) when the widget is resized
+        self.resize_trigger = Clock.create_trigger(self.on_resize, 0.1)
+        self.bind(size=self.resize_trigger)
+
+    def on_resize(self, *args):
+        """called shortly after the widget is resized
+        - redraws the image so the preview matches the new size"""
+        if self.ip2_window.current_job is not None:
+            self.update_image()
+
+    def preview_size(self):
+        """returns the size (width, height) which previews should fit within"""
+        return (max(1, int(self.width)), max(1, int(self.height)))
 
     def on_touch_move(self, touch):
         """called when there is a 'touch movement'
@@ -438,7 +460,9 @@ class StartPointImage(Image):
                 radius = self.ip2_window.current_job.radius
                 # Get the shape of the image
                 image_shape = tuple(
-                    imread(self.ip2_window.current_job.first_image_location).shape[0:2]
+                    self.pyramid.full(
+                        self.ip2_window.current_job.first_image_location
+                    ).shape[0:2]
                 )
                 # True if the shortest image dimension is smaller than 6x the radius
                 too_big = radius > min(image_shape) / 6
@@ -498,6 +522,9 @@ class StartPointImage(Image):
                 # If zoomed, correct the coords further
                 if self.zoomed:
                     x, y = x + self.crop_bbox[0], y + self.crop_bbox[1]
+                # If showing a preview, scale back up to the full image
+                else:
+                    x, y = int(x / self.image_scale), int(y / self.image_scale)
                 pos = (x, y)
             # If pos is not in the image
             else:
@@ -622,15 +649,38 @@ class StartPointImage(Image):
         else:
             # Get the current job's first image
             image_loc = self.ip2_window.current_job.first_image_location
-            self.image = imread(image_loc)
-            # Adjust contrast if turned on
-            self.check_clarity()
-            # Add axis if turned on
-            self.check_axis()
+            # Full resolution is only needed for zooming or saving
+            if self.zoomed or save_image:
+                self.image = self.pyramid.full(image_loc)
+                self.image_scale = 1
+            # Otherwise use a preview sized to fit the widget
+            else:
+                self.image, self.image_scale = self.pyramid.preview(
+                    image_loc, self.preview_size()
+                )
+                # Get the neighbouring jobs' first images ready on the worker thread
+                jobs = self.ip2_window.ip2_scroll.grid_layout.children
+                job_index = jobs.index(self.ip2_window.current_job)
+                self.pyramid.prefetch(
+                    [
+                        job.first_image_location
+                        for job in jobs[max(job_index - 2, 0) : job_index + 3]
+                    ],
+                    self.preview_size(),
+                )
+            # If zoomed in
+            if self.zoomed:
+                # Crop the image (contrast is adjusted on the crop only)
+                self.check_zoom()
+            else:
+                # Copy so the cached image isn't drawn on
+                self.image = self.image.copy()
+                # Adjust contrast if turned on
+                self.check_clarity()
+                # Add axis if turned on
+                self.check_axis()
             # Add circle centre & outside if turned on
             self.draw_point()
-            # Zoom image if turned on
-            self.check_zoom()
             # If saving the image
             if save_image:
                 # Write the image as a .png
@@ -647,21 +697,15 @@ class StartPointImage(Image):
         - formats the location to be in a subfolder 'captures'
         - formats the file name to include the time
         - saves as the same file type"""
-        # Find indicies for the last slash and the last dot
-        slash_index = max([image_loc.rfind("\\"), image_loc.rfind("/")])
-        dot_index = image_loc.rfind(".")
-        # Get the folder location
-        folder = image_loc[: slash_index + 1]  # 'C:/Desktop/folder/'
+        # Get the folder, file name and extension
+        # e.g. 'C:/Desktop/folder/', 'filename', '.jpg'
+        folder, filename, extension = split_image_location(image_loc)
         # Add the captures subfolder
         new_folder = folder + "captures/"  # 'C:/Desktop/folder/captures/'
-        # Get the file name
-        filename = image_loc[slash_index + 1 : dot_index]  # 'filename'
         # Format the date and time as text
         now = datetime.now()
         date_and_time = str(now.strftime("%d-%m-%y_%H-%M-%S"))
         date_extension = "_" + date_and_time
-        # Get the image extension
-        extension = image_loc[dot_index:]  #'.jpg'
         # Check if the directory exists
         if not os.path.exists(new_folder):
             # If it doesn't exist, create it
@@ -676,6 +720,16 @@ class StartPointImage(Image):
         - but only if they are enabled"""
         centre = self.ip2_window.current_job.start_point
         radius = self.ip2_window.current_job.radius
+        # If zoomed, move the circle onto the crop
+        if self.zoomed:
+            centre = (centre[0] - self.crop_bbox[0], centre[1] - self.crop_bbox[1])
+        # If showing a preview, scale the circle down to fit
+        else:
+            centre = (
+                int(centre[0] * self.image_scale),
+                int(centre[1] * self.image_scale),
+            )
+            radius = max(1, int(radius * self.image_scale))
         # If the x button is not down
         if not self.x_down:
             # If zoomed in the radius is 0
@@ -699,8 +753,9 @@ class StartPointImage(Image):
             self.image = convertScaleAbs(self.image, alpha=alpha, beta=beta)
 
     def check_zoom(self):
-        """adjust the zoom of the image
-        - but only if it is currently enabled"""
+        """crop the full resolution image around the circle
+        - but only if zoom is currently enabled
+        - the contrast is adjusted on the crop only (not the whole image)"""
         # If zoom option is on
         if self.zoomed:
             # Use pos and size for calculations
@@ -711,31 +766,36 @@ class StartPointImage(Image):
             # Get zoom area
             x1, x2 = centre[0] - radius - extra_room, centre[0] + radius + extra_room
             y1, y2 = centre[1] - radius - extra_room, centre[1] + radius + extra_room
-            # Give black border
-            border_size = radius * 2
+            # Get the part of the zoom area which is within the image
+            height, width = self.image.shape[0:2]
+            in_x1, in_x2 = min(max(x1, 0), width), min(max(x2, 0), width)
+            in_y1, in_y2 = min(max(y1, 0), height), min(max(y2, 0), height)
+            # Crop that
+            self.image = self.image[in_y1:in_y2, in_x1:in_x2]
+            # Adjust contrast if turned on
+            self.check_clarity()
+            # Give black border where the zoom area is outside the image
             self.image = copyMakeBorder(
                 self.image,
-                top=border_size,
-                bottom=border_size,
-                left=border_size,
-                right=border_size,
+                top=in_y1 - y1,
+                bottom=y2 - in_y2,
+                left=in_x1 - x1,
+                right=x2 - in_x2,
                 borderType=BORDER_CONSTANT,
                 value=(0, 0, 0),
             )
-            # Crop that
-            self.image = self.image[
-                y1 + border_size : y2 + border_size, x1 + border_size : x2 + border_size
-            ]
             # Save the crop positions for later if needed
             self.crop_bbox = x1, y1, x2, y2
 
     def check_axis(self):
         """add the axis overlay
         - but only if it is currently enabled"""
-        # If axis overlay option is on and not zoomed in
-        if self.axis_on and not self.zoomed:
-            # Use the pre calculated overlay size
-            axis_pixel_size = self.ip2_window.current_job.axis_pixel_size
+        # Use the pre calculated overlay size (scaled to the preview)
+        axis_pixel_size = int(
+            self.ip2_window.current_job.axis_pixel_size * self.image_scale
+        )
+        # If axis overlay option is on and not zoomed in (and not too small)
+        if self.axis_on and not self.zoomed and axis_pixel_size > 1:
             # Read the overlay image
             overlay = imread(AXIS_OVERLAY_LOC, 0)
             # Calculate the positions
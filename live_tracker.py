@@ -0,0 +1,278 @@
+"""
+Module: Tracking new frames as they are acquired (PS2 watch mode)
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from pillar_tracker import pillar_tracker_iter
+from folder_watcher import make_watcher
+from file_management import natural_sort
+from frame_source import is_container, read_gray_frame
+
+# Kivy imports
+from kivy.clock import Clock
+
+# Import modules for threading
+from threading import Thread, Event
+from queue import Queue, Empty
+
+# Import modules for timing
+from time import perf_counter
+
+# Import modules for dealing with files
+import os
+
+# How often (in seconds) the folder is checked for new frames
+CHECK_INTERVAL = 0.5
+# The acquisition has ended once there are no new frames for this many seconds
+IDLE_TIMEOUT = 30.0
+# A new frame which still can't be read after this many tries is skipped
+MAX_READ_ATTEMPTS = 3
+
+
+class UnreadableFrame(Exception):
+    """raised on the tracker thread when a new frame can't be read
+    (e.g. it is still being written, or it is corrupt)"""
+
+    def __init__(self, image_loc):
+        """init method for UnreadableFrame"""
+        super().__init__(image_loc)
+        self.image_loc = image_loc
+
+
+def read_new_frame(image_loc):
+    """takes an image location
+    - returns the frame as a grayscale image (see read_gray_frame)
+    - raises UnreadableFrame if it can't be read"""
+    image = read_gray_frame(image_loc)
+    if image is None:
+        raise UnreadableFrame(image_loc)
+    return image
+
+
+class LiveTracker:
+    """watches the current job's folder for new frames (live acquisition)
+    - new frames (of the job's image type) are tracked on a background thread
+    from the position in the last frame
+    - the tracked frames are added to the job (and its position file)
+    - a frame which can't be read is tried again, and skipped after
+    MAX_READ_ATTEMPTS tries (so the frames after it are still tracked)
+    - it stops once no new frames have arrived for IDLE_TIMEOUT seconds
+    - progress is shown in the PS2 frame bar"""
+
+    def __init__(self, image_widget):
+        """init method for LiveTracker"""
+        # The PS2 image widget
+        self.image_widget = image_widget
+        # Set default states
+        self.running = False
+        self.job = None  # The job being watched
+        self.watcher = None
+        self.clock_event = None
+        # Image locations which have been found (all of them and those not tracked)
+        self.known = set()
+        self.pending = []
+        # The tracker thread's stop event, queue and frames (None if not tracking)
+        self.stop_event = Event()
+        self.queue = Queue()
+        self.batch = None
+        # When the last new frame was found and how many have been added
+        self.last_new_time = 0
+        self.num_added = 0
+        # The number of tries to read each unreadable frame, and those skipped
+        self.read_attempts = {}
+        self.num_skipped = 0
+
+    def toggle(self):
+        """starts or stops watching the current job"""
+        if self.running:
+            self.stop()
+        else:
+            self.start()
+
+    def start(self):
+        """starts watching the current job's folder"""
+        job = self.image_widget.ps2_window.current_job
+        if job is None:
+            return
+        # A TIFF stack/video can't get new frames
+        if is_container(job.folder_location):
+            self.image_widget.ps2_window.status_label.text = "Can't watch a stack/video"
+            return
+        # Only watch one job at a time
+        self.stop()
+        try:
+            self.watcher = make_watcher(job.folder_location)
+        except OSError:
+            self.image_widget.ps2_window.status_label.text = "Can't watch folder"
+            return
+        self.job = job
+        self.running = True
+        self.known = set(job.image_locations)
+        self.pending = []
+        self.batch = None
+        self.last_new_time = perf_counter()
+        self.num_added = 0
+        self.read_attempts = {}
+        self.num_skipped = 0
+        self.clock_event = Clock.schedule_interval(self.check, CHECK_INTERVAL)
+        self.update_status()
+
+    def stop(self):
+        """stops watching (keeping the frames already added)"""
+        if self.running:
+            # Add whatever is ready
+            self.drain()
+            self.finish("Stopped watching")
+
+    def finish(self, text):
+        """takes the text to show in the frame bar
+        - stops watching the folder and tracking"""
+        self.running = False
+        self.stop_event.set()
+        self.batch = None
+        if self.clock_event is not None:
+            self.clock_event.cancel()
+            self.clock_event = None
+        if self.watcher is not None:
+            self.watcher.close()
+            self.watcher = None
+        self.job.finish_live()
+        self.job = None
+        self.image_widget.ps2_window.status_label.text = text
+
+    def check(self, *args):
+        """called by the clock
+        - finds new frames, adds the tracked frames and starts tracking new ones"""
+        if not self.running:
+            return
+        job = self.job
+        # Find the new frames of the job's type (in natural order)
+        for name in natural_sort(self.watcher.new_files()):
+            if name[name.rfind(".") :].lower() != job.image_type:
+                continue
+            # Skip files which were renamed/removed straight after being written
+            if not os.path.exists(os.path.join(job.folder_location, name)):
+                continue
+            image_loc = job.folder_location + "\\" + name
+            if image_loc not in self.known:
+                self.known.add(image_loc)
+                self.pending.append(image_loc)
+                self.last_new_time = perf_counter()
+        # Add the frames which have been tracked
+        self.drain()
+        # Track the new frames (if not already tracking)
+        if self.batch is None and self.pending:
+            self.track_pending()
+        # If no new frames have arrived for a while, the acquisition has ended
+        if self.batch is None and perf_counter() - self.last_new_time > IDLE_TIMEOUT:
+            text = "Acquisition ended (" + str(self.num_added) + " new frames)"
+            num_unreadable = self.num_skipped + len(self.pending)
+            if num_unreadable:
+                text += ", " + str(num_unreadable) + " unreadable"
+            self.finish(text)
+        else:
+            self.update_status()
+
+    def track_pending(self):
+        """starts tracking the new frames on the tracker thread"""
+        job = self.job
+        self.batch = self.pending
+        self.pending = []
+        # Track from the position in the last frame
+        seed_pos = (int(job.position_data[1][-1]), int(job.position_data[2][-1]))
+        # The tracker looks around the start point the first tracking used (IP2)
+        start_point = (
+            int(job.original_position_data[1][0]),
+            int(job.original_position_data[2][0]),
+        )
+        self.stop_event = Event()
+        self.queue = Queue()
+        Thread(
+            target=self.track,
+            args=(
+                job.image_locations + self.batch,
+                len(job.image_locations) + 1,
+                start_point,
+                seed_pos,
+                job.radius,
+                self.stop_event,
+                self.queue,
+            ),
+            daemon=True,
+        ).start()
+
+    def track(
+        self, image_locs, from_frame, start_point, seed_pos, radius, stop_event, queue
+    ):
+        """runs on the tracker thread
+        - puts each tracked (frame, x, y) into the queue
+        - stops at a frame which can't be read (putting the UnreadableFrame error
+        into the queue)
+        - puts None into the queue when finished"""
+        try:
+            for result in pillar_tracker_iter(
+                image_locs,
+                start_point,
+                radius,
+                from_frame,
+                seed_pos,
+                read_image=read_new_frame,
+            ):
+                if stop_event.is_set():
+                    return
+                queue.put(result)
+        except UnreadableFrame as error:
+            queue.put(error)
+        finally:
+            queue.put(None)
+
+    def drain(self):
+        """adds the tracked frames which are ready to the job
+        - frames which couldn't be tracked are tried again later
+        (an unreadable frame is skipped once it has been tried MAX_READ_ATTEMPTS
+        times)"""
+        if self.batch is None:
+            return
+        x_vals, y_vals = [], []
+        finished = False
+        unreadable = None
+        while True:
+            try:
+                result = self.queue.get_nowait()
+            except Empty:
+                break
+            # None means the tracker has finished
+            if result is None:
+                finished = True
+                break
+            # The tracker stopped at a frame which couldn't be read
+            if isinstance(result, UnreadableFrame):
+                unreadable = result.image_loc
+                continue
+            _, x, y = result
+            x_vals.append(x)
+            y_vals.append(y)
+        # If any frames are ready
+        if x_vals:
+            self.job.add_frames(self.batch[: len(x_vals)], x_vals, y_vals)
+            self.batch = self.batch[len(x_vals) :]
+            self.num_added += len(x_vals)
+        if finished:
+            # Skip the unreadable frame if it has been tried enough times
+            if unreadable is not None and self.batch[:1] == [unreadable]:
+                attempts = self.read_attempts.get(unreadable, 0) + 1
+                self.read_attempts[unreadable] = attempts
+                if attempts >= MAX_READ_ATTEMPTS:
+                    self.batch = self.batch[1:]
+                    self.num_skipped += 1
+            # Try any frames which weren't tracked again
+            self.pending = self.batch + self.pending
+            self.batch = None
+
+    def update_status(self):
+        """shows the number of new frames in the frame bar"""
+        self.image_widget.ps2_window.status_label.text = (
+            "Watching (" + str(self.num_added) + " new frames)"
+        )
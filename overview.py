@@ -0,0 +1,175 @@
+"""
+Module: Trajectory and filmstrip overview for the PS2 image viewer
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from frame_source import read_frame, frame_modified_time, split_image_location
+
+# Import modules for computer vision
+from cv2 import imread, imwrite, resize, polylines, rectangle, INTER_AREA
+
+# Import numpy
+import numpy as np
+
+# Import modules for dealing with files
+from os.path import getmtime
+import os
+
+# Import modules for threading
+from threading import Thread, Event
+
+# The number of thumbnails in a filmstrip
+THUMBNAIL_COUNT = 15
+# The height of the thumbnails cached on disk (in pixels)
+THUMBNAIL_HEIGHT = 64
+# The colour of the trajectory line and the current thumbnail box
+TRAJECTORY_COLOUR = (255, 150, 0)
+
+
+def sample_frames(num_frames, count=THUMBNAIL_COUNT):
+    """takes a number of frames
+    - returns up to 'count' frame numbers evenly spread over all of the frames"""
+    frames = np.linspace(1, num_frames, min(count, num_frames))
+    return [int(frame) for frame in np.unique(np.round(frames))]
+
+
+def thumbnail_location(image_loc):
+    """takes an image location
+    - returns the location of its thumbnail in a subfolder 'thumbnails'"""
+    # Get the folder and file name e.g. 'C:/Desktop/folder/', 'filename'
+    folder, filename, _ = split_image_location(image_loc)
+    return folder + "thumbnails/" + filename + "_thumb.png"
+
+
+def read_thumbnail(image_loc):
+    """takes an image location
+    - returns a small version of the image (THUMBNAIL_HEIGHT pixels tall)
+    - the thumbnail is cached on disk and only remade if the image is newer"""
+    thumb_loc = thumbnail_location(image_loc)
+    # If there is a cached thumbnail which is up to date
+    image_time = frame_modified_time(image_loc)
+    if os.path.exists(thumb_loc) and getmtime(thumb_loc) >= image_time:
+        thumbnail = imread(thumb_loc)
+        if thumbnail is not None:
+            return thumbnail
+    # Otherwise make it
+    image = read_frame(image_loc)
+    if image is None:
+        return None
+    height, width = image.shape[0:2]
+    new_width = max(1, int(width * THUMBNAIL_HEIGHT / height))
+    thumbnail = resize(image, (new_width, THUMBNAIL_HEIGHT), interpolation=INTER_AREA)
+    # Check if the directory exists
+    thumb_folder = os.path.dirname(thumb_loc)
+    if not os.path.exists(thumb_folder):
+        # If it doesn't exist, create it
+        os.makedirs(thumb_folder)
+    # Cache it on disk
+    imwrite(thumb_loc, thumbnail)
+    return thumbnail
+
+
+def draw_trajectory(image, x_vals, y_vals, scale):
+    """takes an image, x and y positions and the image scale
+    - draws the whole trajectory as a line on the image"""
+    points = np.column_stack((x_vals, y_vals)).astype(np.float64) * scale
+    points = np.round(points).astype(np.int32).reshape(-1, 1, 2)
+    polylines(image, [points], False, TRAJECTORY_COLOUR, 1)
+
+
+def nearest_frame(pos, x_vals, y_vals, max_dist):
+    """takes a position, x and y positions and a maximum distance
+    - returns the frame number of the nearest position on the trajectory
+    - returns None if none are within the maximum distance"""
+    x_vals = np.asarray(x_vals, dtype=np.float64)
+    y_vals = np.asarray(y_vals, dtype=np.float64)
+    dists = np.hypot(x_vals - pos[0], y_vals - pos[1])
+    index = int(np.argmin(dists))
+    if dists[index] > max_dist:
+        return None
+    return index + 1
+
+
+class Filmstrip:
+    """a strip of thumbnails evenly spread through a job's frames
+    - the thumbnails are read/made on a background thread (one at a time)
+    - on_update is called (from the thread) whenever a thumbnail is ready"""
+
+    def __init__(self, image_locations, on_update=None):
+        """init method for Filmstrip"""
+        self.image_locations = image_locations
+        self.on_update = on_update
+        # The number of frames when made (live tracking can add more)
+        self.num_frames = len(image_locations)
+        # The frames which get a thumbnail
+        self.frames = sample_frames(len(image_locations))
+        # The thumbnails made so far: frame -> thumbnail
+        self.thumbnails = {}
+        # Stops the background thread early
+        self.stop_event = Event()
+        self.thread = None
+
+    def start(self):
+        """starts making the thumbnails on a background thread"""
+        self.thread = Thread(target=self.build, daemon=True)
+        self.thread.start()
+
+    def cancel(self):
+        """stops making the thumbnails"""
+        self.stop_event.set()
+
+    def build(self):
+        """runs on the background thread
+        - reads/makes each thumbnail"""
+        for frame in self.frames:
+            if self.stop_event.is_set():
+                return
+            self.thumbnails[frame] = read_thumbnail(self.image_locations[frame - 1])
+            if self.on_update is not None:
+                self.on_update()
+
+    def cell_size(self, width, aspect):
+        """takes the width of the strip and the image aspect (height / width)
+        - returns the (width, height) of each thumbnail in the strip"""
+        cell_width = max(1, width // len(self.frames))
+        cell_height = max(1, int(cell_width * aspect))
+        return cell_width, cell_height
+
+    def render(self, width, aspect, current_frame):
+        """takes the width of the strip, the image aspect (height / width) and
+        the current frame
+        - returns the strip as an image (thumbnails not yet made are grey)
+        - the thumbnail nearest the current frame is outlined"""
+        cell_width, cell_height = self.cell_size(width, aspect)
+        strip = np.zeros((cell_height, width, 3), dtype=np.uint8)
+        for index, frame in enumerate(self.frames):
+            x1 = index * cell_width
+            thumbnail = self.thumbnails.get(frame)
+            if thumbnail is None:
+                strip[:, x1 + 1 : x1 + cell_width - 1] = 60
+            else:
+                strip[:, x1 : x1 + cell_width] = resize(
+                    thumbnail, (cell_width, cell_height), interpolation=INTER_AREA
+                )
+        # Outline the thumbnail nearest the current frame
+        index = int(np.argmin(np.abs(np.array(self.frames) - current_frame)))
+        rectangle(
+            strip,
+            (index * cell_width, 0),
+            ((index + 1) * cell_width - 1, cell_height - 1),
+            TRAJECTORY_COLOUR,
+            1,
+        )
+        return strip
+
+    def frame_at(self, x, width):
+        """takes an x position on the strip and the width of the strip
+        - returns the frame number of the thumbnail at that position
+        - returns None if there is no thumbnail there"""
+        cell_width = max(1, width // len(self.frames))
+        index = int(x // cell_width)
+        if 0 <= index < len(self.frames):
+            return int(self.frames[index])
+        return None
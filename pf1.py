@@ -10,9 +10,10 @@ from file_management import (
     file_header,
     is_csv_xml,
     file_name,
-    detect_encoding,
     unlabel_columns,
 )
+from table_loader import load_table, first_invalid_value
+from position_filters import FILTER_SIZE, valid_filter_size
 
 # Kivy imports
 from kivy.app import App
@@ -25,9 +26,7 @@ from os.path import getctime
 from datetime import datetime
 from plyer import filechooser
 import re
-import csv
 import os
-import xml.etree.ElementTree as et
 from subprocess import Popen as p_open
 
 
@@ -78,8 +77,15 @@ class PF1Window(Screen):
             if self.fg1_window == None:
                 # Get fg1_window
                 self.fg1_window = self.manager.get_screen("FG1")
+            # Get the parameter sweep settings (if sweeping)
+            sweep = None
+            if self.sweep_checkbox.active:
+                spread = float(self.sweep_spread_input.text) / 100
+                sweep = (spread, self.sweep_files_checkbox.active)
             # Make pop up - asks if you are sure you want to continue
-            popup = ContinuePopup(self.clear_jobs, self.pf1_scroll, self.fg1_window)
+            popup = ContinuePopup(
+                self.clear_jobs, self.pf1_scroll, self.fg1_window, sweep=sweep
+            )
             popup.open()
 
     def check_data(self):
@@ -125,20 +131,40 @@ class PF1Window(Screen):
                     # Invalid column lengths
                     errors.append(" • invlaid column length(s)\n")
                 # Check for invalid column values
-                for pos in x_col + y_col:
-                    try:
-                        # Try convert to float
-                        float(pos)
-                    except ValueError:
-                        # Invalid float
-                        errors.append(" • invalid column value (" + str(pos) + ")\n")
-                        break
+                invalid_value = first_invalid_value(x_col, y_col)
+                if invalid_value is not None:
+                    # Invalid float
+                    errors.append(
+                        " • invalid column value (" + str(invalid_value) + ")\n"
+                    )
+            # Check for an invalid filter size (for the job's filter)
+            if not valid_filter_size(job.filter_type, job.filter_size):
+                # Invalid filter size
+                errors.append(
+                    " • invalid "
+                    + job.filter_type
+                    + " filter size ("
+                    + str(job.filter_size)
+                    + ")\n"
+                )
             # Add this job's name to list (to check for duplicates)
             name_list.append(job.name)
         # Check for duplicate names
         if len(name_list) != len(set(name_list)):
             # Duplicate names
             errors.append(" • duplicate names\n")
+        # Check the parameter sweep spread (if sweeping)
+        if self.sweep_checkbox.active:
+            try:
+                # Must be a percentage above 0 and below 100
+                spread = float(self.sweep_spread_input.text)
+                if not 0 < spread < 100:
+                    raise ValueError
+            except ValueError:
+                # Invalid spread
+                errors.append(
+                    " • invalid sweep % (" + str(self.sweep_spread_input.text) + ")\n"
+                )
         # Return the errors which have been found
         return list(set(errors))
 
@@ -234,8 +260,12 @@ class PF1Window(Screen):
         """called when [select file(s)] button is pressed
         - opens the file select window
         - selection is sent to self.selected()"""
-        # Only allow selection of csv or xml
-        filters = [("CSV files", "*.csv"), ("XML files", "*.xml")]
+        # Only allow selection of csv, xml or binary (npz)
+        filters = [
+            ("CSV files", "*.csv"),
+            ("XML files", "*.xml"),
+            ("Binary files", "*.npz"),
+        ]
         # Open file selector window - send selection to self.selected
         filechooser.open_file(
             on_selection=self.selected,
@@ -323,6 +353,8 @@ class PF1Window(Screen):
             self.pdms_E_input.text = str(self.current_job.pdms_E)
             self.pdms_gama_input.text = str(self.current_job.pdms_gama)
             self.pill_diam_input.text = str(self.current_job.pillar_diameter)
+            self.filter_spinner.text = self.current_job.filter_type
+            self.filter_size_input.text = str(self.current_job.filter_size)
             self.update_drop_downs()
         # If NO job is currently selected
         else:
@@ -336,6 +368,8 @@ class PF1Window(Screen):
             self.pdms_E_input.text = ""
             self.pdms_gama_input.text = ""
             self.pill_diam_input.text = ""
+            self.filter_spinner.text = "None"
+            self.filter_size_input.text = ""
             self.update_drop_downs()
 
     def update_job_selected(self):
@@ -445,6 +479,32 @@ class PF1Window(Screen):
                 # Upadte the job's pillar_diameter ratio
                 self.current_job.pillar_diameter = text
 
+    def on_filter_type(self, text):
+        """called when a position filter is selected"""
+        # If a job is selected
+        if self.current_job is not None:
+            # If bulk checkboc is ticked
+            if self.my_checkbox.active:
+                # Update all jobs
+                for job in self.pf1_scroll.grid_layout.children:
+                    job.filter_type = text
+            else:
+                # Upadte the job's position filter
+                self.current_job.filter_type = text
+
+    def on_filtersize_text(self, text):
+        """called when filter size text input is changed"""
+        # If a job is selected
+        if self.current_job is not None:
+            # If bulk checkboc is ticked
+            if self.my_checkbox.active:
+                # Update all jobs
+                for job in self.pf1_scroll.grid_layout.children:
+                    job.filter_size = text
+            else:
+                # Upadte the job's filter size
+                self.current_job.filter_size = text
+
     def on_diam_reset_btn(self):
         """called when the reset button by the pillar diam textbox is pressed
         - toggles the pillar diameter between 5.4 and 7.3"""
@@ -545,6 +605,9 @@ class PF1JobListBox(Button):
         self.pdms_E = PDMS_E
         self.pdms_gama = PDMS_GAMA
         self.time_base = TIME_BASE
+        # The filter used to smooth the positions (see position_filters)
+        self.filter_type = "None"
+        self.filter_size = FILTER_SIZE
 
         # Column # And name for x & y  (e.g. (0, 'X'))
         self.x_column = (None, None)
@@ -583,6 +646,7 @@ class PF1JobListBox(Button):
         self.pf1_window.pdms_E_input.scroll_x = 0
         self.pf1_window.pdms_gama_input.scroll_x = 0
         self.pf1_window.pill_diam_input.scroll_x = 0
+        self.pf1_window.filter_size_input.scroll_x = 0
         # Return checkbox to previous state
         self.pf1_window.my_checkbox.active = checkstate
 
@@ -641,36 +705,14 @@ class PF1JobListBox(Button):
             self.y_vals = []
 
     def column_values(self):
-        """read the file and returns a value list for each column"""
-        # Set empty lists
-        x_col_list, y_col_list = [], []
-        # If a csv file
-        if self.file_location[-4:] == ".csv":
-            # If this file exists
-            if os.path.exists(self.file_location):
-                # Read the csv file and extract the values
-                encoding = detect_encoding(self.file_location)
-                # Read the CSV file and extract the header row
-                with open(self.file_location, "r", encoding=encoding) as csv_file:
-                    reader = csv.reader(csv_file)
-                    next(reader)  # Skip header row
-                    # Read the rows
-                    for row in reader:
-                        x_col_list.append(row[self.x_column[0]])
-                        y_col_list.append(row[self.y_column[0]])
-        # If an xml file
-        elif self.file_location[-4:] == ".xml":
-            # If this file exists
-            if os.path.exists(self.file_location):
-                tree = et.parse(self.file_location)
-                root = tree.getroot()
-                # Read the 'rows'
-                for detection in root.findall(".//detection"):
-                    x_col_list.append(detection.get(self.x_column[1]))
-                    y_col_list.append(detection.get(self.y_column[1]))
+        """returns the values of the selected columns (from the loaded file)"""
+        # Get the file's columns (only read once)
+        table = load_table(self.file_location)
+        x_col_list = table.column(self.x_column[0])
+        y_col_list = table.column(self.y_column[0])
         # Save col values as an attribute :)
-        self.x_vals = x_col_list[:]
-        self.y_vals = y_col_list[:]
+        self.x_vals = x_col_list.copy()
+        self.y_vals = y_col_list.copy()
         return x_col_list, y_col_list
 
     def on_open_btn(self, file_or_folder):
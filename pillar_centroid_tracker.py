@@ -15,6 +15,12 @@ Version Description:
 # Import os and sys
 import os
 
+# Lets the packaged .exe start graph export processes (see graph_export.py)
+# this must run before kivy is imported, or each process would open a window
+from multiprocessing import freeze_support
+
+freeze_support()
+
 # Stops debug messages - alsoprevents an error after .exe packaging
 # os.environ["KIVY_NO_CONSOLELOG"] = "1"
 
@@ -81,6 +87,24 @@ COL_NAMES = [
     "DeltaFx [µN]",
     "DeltaFy [µN]",
 ]
+# The column headers when positions are filtered (filtered positions after raw ones)
+FILTERED_COL_NAMES = (
+    COL_NAMES[:4]
+    + ["x Position filtered [pixels]", "y Position filtered [pixels]"]
+    + COL_NAMES[4:]
+)
+SWEEP_COL_NAMES = [
+    "Combination",
+    "Pillar Diameter [µm]",
+    "Pillar Height [µm]",
+    "Contact Height [µm]",
+    "Young's Modulus [MPa]",
+    "Poisson's Ratio",
+    "Average x Force [µN]",
+    "Average y Force [µN]",
+    "Average Total Force [µN]",
+    "Max Total Force [µN]",
+]
 DEFAULT_TITLES = {
     ("t", 1): "Total force as a function of time",
     ("x_t", 1): "Time [sec]",
@@ -194,6 +218,8 @@ class PCTApp(App):
     # Save default titles and column headers
     DEFAULT_TITLES = DEFAULT_TITLES
     COL_NAMES = COL_NAMES
+    FILTERED_COL_NAMES = FILTERED_COL_NAMES
+    SWEEP_COL_NAMES = SWEEP_COL_NAMES
     AUTO_COL_NAMES = AUTO_COL_NAMES
     # This function/method allows files to be accessed in the .exe application
     resource_path = class_resource_path
@@ -4,84 +4,141 @@ Program: Pillar Centroid Tracker
 Author: Haig Bishop (hbi34@uclive.ac.nz)
 """
 
+# Import local modules
+from frame_source import read_gray_frame
+
 # Import modules for math and computer vision
 import numpy as np
 
 # Import modules for math and computer vision
 from cv2 import (
-    imread,
-    cvtColor,
-    COLOR_BGR2GRAY,
-    imread,
     cvtColor,
     calcHist,
     circle,
     convertScaleAbs,
-    bitwise_and,
     subtract,
     COLOR_BGR2GRAY,
 )
 import math
 
 
-def calculate_alpha_beta(image):
+def gray_image(image):
     """Takes an image
-    - returns alpha and beta values to optimally fix contrast/brightness"""
+    - returns it as a single channel image (colour images are converted)"""
+    if image.ndim == 3:
+        return cvtColor(image, COLOR_BGR2GRAY)
+    return image
+
+
+def calculate_alpha_beta(image):
+    """Takes an image (any bit depth)
+    - returns alpha and beta values to optimally fix contrast/brightness
+    - these scale the image's levels to 0 - 255"""
     # Automatic brightness and contrast optimisation with optional histogram clipping
-    gray = cvtColor(image, COLOR_BGR2GRAY)
+    gray = gray_image(image)
     clip_hist_percent = 1
+    # Choose the histogram levels (1 per gray level for 8-bit images)
+    if gray.dtype == np.uint8:
+        hist_size, low, high = 256, 0, 256
+    elif gray.dtype == np.uint16:
+        # Only the levels the image uses (10/12-bit cameras use few of 65536)
+        low, high = int(gray.min()), int(gray.max()) + 1
+        hist_size = max(high - low, 256)
+    else:
+        low, high = float(gray.min()), float(gray.max())
+        hist_size, high = 65536, high + max((high - low) / 65536, 1e-6)
     # Calculate grayscale histogram
-    hist = calcHist([gray], [0], None, [256], [0, 256])
-    hist_size = len(hist)
+    hist = calcHist([gray], [0], None, [hist_size], [low, high])
     # Calculate cumulative distribution from the histogram
-    accumulator = []
-    accumulator.append(float(hist[0]))
-    for index in range(1, hist_size):
-        accumulator.append(accumulator[index - 1] + float(hist[index]))
+    accumulator = np.cumsum(hist.ravel(), dtype=np.float64)
     # Locate points to clip
     maximum = accumulator[-1]
     clip_hist_percent *= maximum / 100.0
     clip_hist_percent /= 2.0
-    # Locate left cut
-    minimum_gray = 0
-    while accumulator[minimum_gray] < clip_hist_percent:
-        minimum_gray += 1
-    # Locate right cut
-    maximum_gray = hist_size - 1
-    while (
-        accumulator[maximum_gray] >= (maximum - clip_hist_percent) and maximum_gray > 10
-    ):
-        maximum_gray -= 1
+    # Locate left cut (the first level which reaches the clip)
+    minimum_gray = int(np.searchsorted(accumulator, clip_hist_percent, "left"))
+    # Locate right cut (the last level below the clip, but not below 10/256 of the
+    # levels)
+    maximum_gray = int(
+        np.searchsorted(accumulator, maximum - clip_hist_percent, "left") - 1
+    )
+    maximum_gray = max(maximum_gray, 10 * hist_size // 256)
+    # Convert from histogram levels to gray levels
+    level_size = (high - low) / hist_size
+    minimum_gray = low + minimum_gray * level_size
+    maximum_gray = low + maximum_gray * level_size
     # Calculate alpha and beta values
     alpha = 255 / (maximum_gray - minimum_gray)
     beta = -minimum_gray * alpha
     return alpha, beta
 
 
-def weighted_average_pos(image, start_pos):
-    """Takes an image and a position on that image
+def stretch_contrast(image, alpha, beta):
+    """Takes a grayscale image and alpha and beta values (see calculate_alpha_beta)
+    - returns the image with its contrast/brightness fixed (0 - 255)
+    - 8-bit images stay 8-bit, deeper images become float32 (so no levels are lost)"""
+    if image.dtype == np.uint8:
+        return convertScaleAbs(image, alpha=alpha, beta=beta)
+    # The same as convertScaleAbs, without rounding to 8-bit
+    stretched = image.astype(np.float32)
+    stretched *= alpha
+    stretched += beta
+    np.abs(stretched, out=stretched)
+    return np.minimum(stretched, 255, out=stretched)
+
+
+def brighter_pixels(image, first_image):
+    """Takes two (contrast stretched) grayscale images
+    - returns how much brighter each pixel is in image (0 if it is darker)"""
+    difference = subtract(image, first_image)
+    # Only 8-bit subtraction stops at 0
+    if difference.dtype != np.uint8:
+        np.maximum(difference, 0, out=difference)
+    return difference
+
+
+def donut_mask(shape, inner_circle, outer_circle):
+    """takes the shape of an image and a donut shape on that image
+    - returns a boolean mask which is True inside the donut"""
+    # Create a blank mask with the same dimensions as the image
+    mask = np.zeros(shape[:2], dtype=np.uint8)
+    # Draw a white outer circle on the mask
+    centre = (outer_circle[0], outer_circle[1])
+    circle(mask, centre, outer_circle[2], 255, -1)
+    # Draw a black inner circle on the mask
+    circle(mask, centre, inner_circle[2], 0, -1)
+    return mask > 0
+
+
+def weighted_average_pos(image, start_pos, mask=None):
+    """Takes an image and a position on that image (and maybe a mask)
     - calculates the average position of pixels on that image
     it is a weighted average by the brightness of the pixels
+    - only pixels inside the mask are used (if given)
     - it also scale how far the position is from start_pos
     this depends on the average brightness of the image"""
     # Make empty array
     num_pixels = image.shape[0] * image.shape[1]
-    # Convert to a grayscale matrix
-    matrix = cvtColor(image, COLOR_BGR2GRAY)
-    matrix = np.array(matrix)
-    # Remove any grey pixels below 60 brightness
-    matrix[matrix < 60] = 0
+    # Convert to a grayscale matrix (if not already)
+    matrix = gray_image(image)
+    # Remove any grey pixels below 60 brightness (and those outside of the mask)
+    keep = matrix >= 60
+    if mask is not None:
+        keep &= mask
+    matrix = np.where(keep, matrix, 0)
     # Calculate the weighted average position for each row and col
-    weighted_rows, weighted_cols = np.indices(matrix.shape) * matrix
-    sum_weighted_rows = np.sum(weighted_rows)
-    sum_weighted_cols = np.sum(weighted_cols)
-    total_sum = np.sum(matrix) if np.sum(matrix) > 1 else 1
+    row_sums = matrix.sum(axis=1, dtype=np.float64)
+    col_sums = matrix.sum(axis=0, dtype=np.float64)
+    sum_weighted_rows = np.dot(np.arange(len(row_sums)), row_sums)
+    sum_weighted_cols = np.dot(np.arange(len(col_sums)), col_sums)
+    brightness_sum = np.sum(row_sums)
+    total_sum = brightness_sum if brightness_sum > 1 else 1
     avg_weighted_row = sum_weighted_rows / total_sum
     avg_weighted_col = sum_weighted_cols / total_sum
     # This gives us the average position (weighted)
     average_pos = (avg_weighted_col, avg_weighted_row)
     # Scale depending on total brightness of the donut
-    average_img_brightness_sq = (np.sum(matrix) / num_pixels) ** 2
+    average_img_brightness_sq = (brightness_sum / num_pixels) ** 2
     average_x = int(
         (average_pos[0] * average_img_brightness_sq + start_pos[0])
         / (1 + average_img_brightness_sq)
@@ -121,67 +178,122 @@ def check_dist_prev(new_pos, prev_pos, radius):
     return (new_x, new_y)
 
 
-def predict_pos(img_substraction, inner_circle, outer_circle, prev_pos, pillar_radius):
+def predict_pos(
+    img_substraction, inner_circle, outer_circle, prev_pos, pillar_radius, mask=None
+):
     """takes an image, a donut shape on that image, the previous position and the pillar radius
-    - blacks out pixels outside the donut
+    - ignores pixels outside the donut (mask is the donut's mask if already made)
     - gets the average pixel position
     - scales the position back if it is too far
     - returns the position"""
-    # Create a blank mask with the same dimensions as the image
-    mask = np.zeros_like(img_substraction)
-    # Draw a white outer circle on the mask
+    # Make the donut mask (if not given)
+    if mask is None:
+        mask = donut_mask(img_substraction.shape, inner_circle, outer_circle)
+    # Get the average pixel position inside the donut, weighted by their brightness
     centre = (outer_circle[0], outer_circle[1])
-    radius = outer_circle[2]
-    circle(mask, centre, radius, (255, 255, 255), -1)
-    # Draw a black inner circle on the mask
-    radius = inner_circle[2]
-    circle(mask, centre, radius, (0, 0, 0), -1)
-    # Apply the mask to the image to black out the pixels outsdie the white donut
-    img_sub_donut = bitwise_and(img_substraction, mask)
-    # Get the average pixel position, weighted by their brightness
-    pos = weighted_average_pos(img_sub_donut, centre)
+    pos = weighted_average_pos(img_substraction, centre, mask=mask)
     # Make sure it didn't do too far from the previous position
     pos = check_dist_prev(pos, prev_pos, pillar_radius)
     return pos
 
 
-def track_object(image_locs, crop_bbox, initial_circle):
+def track_object_iter(
+    image_locs,
+    crop_bbox,
+    initial_circle,
+    start_index=1,
+    seed_pos=None,
+    read_image=read_gray_frame,
+):
     """takes an image sequence, the section of the images to look at,
     and the position of the pillar in the first frame.
-        - returns a list of predicted bboxes for the pillar across the sequence"""
+        - yields (index, circle) for each image from start_index onwards
+        - seed_pos is the (cropped) position in the image before start_index
+        (defaults to the initial circle)
+        - read_image is used to read each image (e.g. from a cache)
+        - images are tracked as single channel images at their own bit depth"""
     # Get the crop box
     crop_x1, crop_y1, crop_x2, crop_y2 = crop_bbox
     # Get the initial circle (adjusted for crop)
     start_x, start_y, start_r = initial_circle
     start_x, start_y, start_r = start_x - crop_x1, start_y - crop_y1, start_r
     # Load the initial image
-    first_image = imread(image_locs[0])  # Read as grayscale
+    first_image = read_image(image_locs[0])
     first_image = first_image[crop_y1:crop_y2, crop_x1:crop_x2]  # Crop image
+    first_image = gray_image(first_image)
     alpha, beta = calculate_alpha_beta(first_image)
-    first_image = convertScaleAbs(first_image, alpha=alpha, beta=beta)
-    # Initialize the list to store object positions
-    predicted_circles = [(start_x, start_y, start_r)]
-    prev_pos = (start_x, start_y)
+    first_image = stretch_contrast(first_image, alpha, beta)
+    # The donut around the initial circle (the same for every image)
+    inner_circle = (start_x, start_y, int(start_r * 0.5))
+    outer_circle = (start_x, start_y, int(start_r * 1.5))
+    mask = donut_mask(first_image.shape, inner_circle, outer_circle)
+    # Start from the seed position (if given)
+    prev_pos = (start_x, start_y) if seed_pos is None else seed_pos
     # Track the object across the sequence of images
-    for image_loc in image_locs[1:]:
-        current_image = imread(image_loc)  # Read
+    for index in range(start_index, len(image_locs)):
+        current_image = read_image(image_locs[index])  # Read
         current_image = current_image[crop_y1:crop_y2, crop_x1:crop_x2]  # Crop image
-        current_image_copy = convertScaleAbs(
-            current_image.copy(), alpha=alpha, beta=beta
-        )
-        img_substraction = subtract(current_image_copy, first_image)
-        inner_circle = (start_x, start_y, int(start_r * 0.5))
-        outer_circle = (start_x, start_y, int(start_r * 1.5))
+        current_image = gray_image(current_image)
+        current_image = stretch_contrast(current_image, alpha, beta)
+        img_substraction = brighter_pixels(current_image, first_image)
         position_x, position_y = predict_pos(
-            img_substraction, inner_circle, outer_circle, prev_pos, start_r
+            img_substraction, inner_circle, outer_circle, prev_pos, start_r, mask
         )
         prev_pos = (position_x, position_y)
-        circle = (position_x, position_y, start_r)
+        # Give the updated object position
+        yield index, (position_x, position_y, start_r)
+
+
+def track_object(image_locs, crop_bbox, initial_circle):
+    """takes an image sequence, the section of the images to look at,
+    and the position of the pillar in the first frame.
+        - returns a list of predicted bboxes for the pillar across the sequence"""
+    # Get the initial circle (adjusted for crop)
+    start_x, start_y, start_r = initial_circle
+    start_x, start_y = start_x - crop_bbox[0], start_y - crop_bbox[1]
+    # Initialize the list to store object positions
+    predicted_circles = [(start_x, start_y, start_r)]
+    # Track the object across the sequence of images
+    for _, circle in track_object_iter(image_locs, crop_bbox, initial_circle):
         # Store the updated object position
         predicted_circles.append(circle)
     return predicted_circles
 
 
+def tracker_crop_bbox(start_point, radius):
+    """takes the starting pillar position and radius
+    - returns the section of the images which the tracker looks at"""
+    x1, x2 = start_point[0] - 4 * radius, start_point[0] + 4 * radius
+    y1, y2 = start_point[1] - 4 * radius, start_point[1] + 4 * radius
+    return [x1, y1, x2, y2]
+
+
+def pillar_tracker_iter(
+    image_locs, start_point, radius, from_frame, seed_pos, read_image=read_gray_frame
+):
+    """takes a list of images, the starting pillar position (in the first frame),
+    a frame number and the (corrected) pillar position in the frame before it
+    - yields (frame number, x, y) of the predicted pillar position for each frame
+    from from_frame onwards
+    - read_image is used to read each image (e.g. from a cache)"""
+    initial_circle = (start_point[0], start_point[1], radius)
+    # Crop image
+    crop_bbox = tracker_crop_bbox(start_point, radius)
+    x1, y1 = crop_bbox[0], crop_bbox[1]
+    # Track pillar from the seed position! yields circles
+    circles = track_object_iter(
+        image_locs,
+        crop_bbox,
+        initial_circle,
+        start_index=from_frame - 1,
+        seed_pos=(seed_pos[0] - x1, seed_pos[1] - y1),
+        read_image=read_image,
+    )
+    for index, (x, y, _) in circles:
+        # Shift position for uncropped image
+        yield index + 1, x + x1, y + y1
+
+
 def pillar_tracker(image_locs, start_point, radius):
     """takes a list of images, and the starting pillar position
     - returns the predicted pillar postion across the images"""
@@ -190,9 +302,8 @@ def pillar_tracker(image_locs, start_point, radius):
     x_vals, y_vals = [], []
     initial_circle = (start_point[0], start_point[1], radius)
     # Crop image
-    x1, x2 = start_point[0] - 4 * radius, start_point[0] + 4 * radius
-    y1, y2 = start_point[1] - 4 * radius, start_point[1] + 4 * radius
-    crop_bbox = [x1, y1, x2, y2]
+    crop_bbox = tracker_crop_bbox(start_point, radius)
+    x1, y1 = crop_bbox[0], crop_bbox[1]
     # Track pillar! returns circles
     circles = track_object(image_locs, crop_bbox, initial_circle)
     # Shift positions for uncropped image
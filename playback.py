@@ -0,0 +1,237 @@
+"""
+Module: Smooth playback of a job's frames for the PS2 image viewer
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Kivy imports
+from kivy.clock import Clock
+
+# Import modules for threading and timing
+from threading import Thread, Event
+from queue import Queue, Empty, Full
+from time import perf_counter
+from math import sqrt
+
+# Default, minimum and maximum playback speeds (frames per second)
+DEFAULT_FPS = 30
+MIN_FPS = 5
+MAX_FPS = 60
+FPS_STEP = 5
+# The number of decoded frames which can wait to be displayed
+QUEUE_SIZE = 8
+
+
+class PlaybackEngine:
+    """plays the current job's frames on the PS2 image widget
+    - frames are decoded (as previews) on a background thread into a queue
+    - a Kivy clock displays whichever frame is due at the time
+    - if decoding falls behind, frames are dropped rather than blocking the UI
+    - pauses on frames where the position jumps suspiciously far"""
+
+    def __init__(self, image_widget, fps=DEFAULT_FPS):
+        """init method for PlaybackEngine"""
+        # The PS2 image widget to play on
+        self.image_widget = image_widget
+        # The target frames per second
+        self.fps = fps
+        # Set default states
+        self.playing = False
+        self.job = None  # The job being played
+        self.clock_event = None
+        self.decoder = None
+        self.stop_event = Event()
+        self.queue = Queue(maxsize=QUEUE_SIZE)
+        self.held = None  # A decoded frame taken from the queue before it is due
+        # The frame currently being displayed
+        self.shown_frame = 0
+        # The time and frame that playback (re)started from
+        self.start_time = 0
+        self.start_frame = 0
+        # The times frames were displayed (for measuring the achieved fps)
+        self.show_times = []
+
+    def toggle(self):
+        """plays if paused, pauses if playing"""
+        if self.playing:
+            self.stop()
+        else:
+            self.play()
+
+    def play(self):
+        """starts playing the current job from its current frame"""
+        job = self.image_widget.ps2_window.current_job
+        # If there is no job or nothing to play
+        if job is None or len(job.image_locations) < 2:
+            return
+        # If at the last frame, play from the start
+        if job.current_frame >= len(job.image_locations):
+            job.current_frame = 1
+            self.image_widget.update_image()
+        self.job = job
+        self.playing = True
+        self.shown_frame = job.current_frame
+        self.show_times = []
+        self.restart_clock()
+        # Start the decoder thread
+        self.stop_event = Event()
+        self.queue = Queue(maxsize=QUEUE_SIZE)
+        self.held = None
+        self.decoder = Thread(
+            target=self.decode_frames,
+            args=(job, self.preview_size(), self.stop_event, self.queue),
+            daemon=True,
+        )
+        self.decoder.start()
+        self.update_status()
+
+    def stop(self):
+        """stops playing (leaving the current frame displayed)"""
+        # If not playing there is nothing to stop
+        if not self.playing:
+            return
+        self.playing = False
+        # Stop the decoder thread and the clock
+        self.stop_event.set()
+        if self.clock_event is not None:
+            self.clock_event.cancel()
+            self.clock_event = None
+        self.job = None
+        self.update_status()
+
+    def change_fps(self, change):
+        """takes a change in frames per second
+        - changes the target playback speed (within the limits)"""
+        self.fps = min(max(self.fps + change, MIN_FPS), MAX_FPS)
+        # If playing, keep going from the current frame at the new speed
+        if self.playing:
+            self.restart_clock()
+        self.update_status()
+
+    def restart_clock(self):
+        """(re)starts the clock from the frame being shown"""
+        if self.clock_event is not None:
+            self.clock_event.cancel()
+        self.start_time = perf_counter()
+        self.start_frame = self.shown_frame
+        self.show_times = []
+        self.clock_event = Clock.schedule_interval(self.tick, 1 / self.fps)
+
+    def preview_size(self):
+        """returns the size which the decoded previews should fit within"""
+        return self.image_widget.preview_size()
+
+    def due_frame(self):
+        """returns the frame number which should be displayed right now"""
+        elapsed = perf_counter() - self.start_time
+        return self.start_frame + int(elapsed * self.fps)
+
+    def decode_frames(self, job, max_size, stop_event, queue):
+        """runs on the decoder thread
+        - decodes previews of the frames after the current frame into the queue
+        - skips frames which are already overdue"""
+        pyramid = self.image_widget.pyramid
+        frame = job.current_frame + 1
+        num_frames = len(job.image_locations)
+        while frame <= num_frames and not stop_event.is_set():
+            # Skip ahead if this frame is already overdue
+            frame = max(frame, self.due_frame())
+            if frame > num_frames:
+                break
+            image, scale = pyramid.preview(job.image_locations[frame - 1], max_size)
+            # Wait for room in the queue (checking if playback has stopped)
+            while not stop_event.is_set():
+                try:
+                    queue.put((frame, image, scale), timeout=0.1)
+                    break
+                except Full:
+                    continue
+            frame += 1
+
+    def tick(self, dt):
+        """called by the clock at the target frame rate
+        - displays the most recent decoded frame which is due
+        - frames which are overdue are dropped"""
+        job = self.image_widget.ps2_window.current_job
+        # Stop if the job has been changed or removed
+        if job is not self.job:
+            self.stop()
+            return
+        num_frames = len(job.image_locations)
+        due_frame = min(self.due_frame(), num_frames)
+        # Take the latest decoded frame which is due (dropping older ones)
+        latest = None
+        while True:
+            # Get the next decoded frame (if there is one)
+            if self.held is None:
+                try:
+                    self.held = self.queue.get_nowait()
+                except Empty:
+                    break
+            # If this frame is not due yet, hold onto it for later
+            if self.held[0] > due_frame:
+                break
+            latest, self.held = self.held, None
+        # If there is a new frame to display
+        if latest is not None and latest[0] > self.shown_frame:
+            frame, image, scale = latest
+            # Check for a suspicious jump up to this frame
+            jump_frame = self.find_jump(job, self.shown_frame, frame)
+            # If there was one, pause on that frame
+            if jump_frame is not None:
+                self.show(job, jump_frame)
+                self.stop()
+                self.image_widget.ps2_window.status_label.text = (
+                    "Paused (jump at " + str(jump_frame) + ")"
+                )
+                return
+            self.show(job, frame, (image, scale))
+        # If the last frame has been displayed, stop
+        if self.shown_frame >= num_frames:
+            self.stop()
+            return
+        self.update_status()
+
+    def find_jump(self, job, first_frame, last_frame):
+        """takes a job and a range of frames
+        - returns the first frame (after first_frame and up to last_frame) which
+        moved (about) a quarter of the radius from the frame before it
+        - returns None if there are none"""
+        x_vals, y_vals = job.position_data[1], job.position_data[2]
+        # The tracker never moves further than this between frames
+        max_dist = job.radius / 4
+        # Moves cut to max_dist are truncated to whole pixels (each axis towards
+        # zero), so they can be up to √2 pixels shorter
+        min_jump = max_dist - sqrt(2)
+        for frame in range(first_frame + 1, last_frame + 1):
+            dx = int(x_vals[frame - 1]) - int(x_vals[frame - 2])
+            dy = int(y_vals[frame - 1]) - int(y_vals[frame - 2])
+            distance = (dx**2 + dy**2) ** 0.5
+            if distance > 0 and distance >= min_jump:
+                return frame
+        return None
+
+    def show(self, job, frame, preview=None):
+        """takes a job, a frame number and optionally a decoded preview
+        - displays that frame on the image widget"""
+        job.current_frame = frame
+        self.shown_frame = frame
+        self.image_widget.update_image(preview=preview)
+        self.image_widget.ps2_window.update_fields()
+        # Remember when it was displayed (only for the last second)
+        now = perf_counter()
+        self.show_times.append(now)
+        self.show_times = [t for t in self.show_times if now - t <= 1]
+
+    def achieved_fps(self):
+        """returns the number of frames displayed in the last second"""
+        now = perf_counter()
+        return len([t for t in self.show_times if now - t <= 1])
+
+    def update_status(self):
+        """updates the playback status label (achieved vs target fps)"""
+        status_label = self.image_widget.ps2_window.status_label
+        if self.playing:
+            status_label.text = str(self.achieved_fps()) + "/" + str(self.fps) + " fps"
+        else:
+            status_label.text = "Paused (" + str(self.fps) + " fps)"
@@ -7,16 +7,28 @@ Author: Haig Bishop (hbi34@uclive.ac.nz)
 # Kivy imports
 from kivy.app import App
 from kivy.uix.popup import Popup
+from kivy.clock import Clock
 
 # Import local modules
-from force_conversion import force_convert_job
+from force_conversion import force_file_blocks, force_sweep_job, SWEEP_PARAMETERS
+from binary_format import binary_schema
 from file_management import (
-    write_pos_force_file,
+    write_pos_force_blocks,
     rename_file_force,
+    rename_file_sweep,
+    write_csv_columns,
     write_pos_file,
     rename_file_pos,
 )
 
+# Import modules for threading
+from concurrent.futures import ThreadPoolExecutor
+
+# The number of jobs converted at once (numpy and file writing release the GIL)
+FORCE_THREADS = 4
+# How often (in seconds) the conversion is checked on
+CHECK_INTERVAL = 0.1
+
 
 class BackPopup(Popup):
     """A custom Popup object for going back a page"""
@@ -206,8 +218,10 @@ class VerifyPopup(Popup):
                 # Write new file if any updates were made or if do_all is true
                 # If the job was updated by the user or we want to do all
                 if job.updated or do_all:
-                    # Get new positions
-                    position_data = job.position_data
+                    # Get new positions (apply the edits to the original positions)
+                    position_data = job.history.materialise(
+                        job.original_position_data
+                    )
                     # Get a file name/location to write a force file
                     new_file_loc = rename_file_pos(
                         job.folder_location, job.name, updated=True
@@ -215,7 +229,13 @@ class VerifyPopup(Popup):
                     print(new_file_loc)
                     new_file_locs.append(new_file_loc)
                     # Write that pos file
-                    write_pos_file(new_file_loc, position_data)
+                    write_pos_file(
+                        new_file_loc,
+                        position_data,
+                        schema={"source_folder": job.folder_location},
+                    )
+                    # The edit journal isn't needed once the file is written
+                    job.history.delete_journal()
                 else:
                     # Get the old file location
                     new_file_locs.append(job.original_position_file_location)
@@ -290,8 +310,9 @@ class PS2SuccessPopup(Popup):
 class ContinuePopup(Popup):
     """A custom Popup object for continuing to the next page for the PF1 window"""
 
-    def __init__(self, clear_jobs, old_scroll, new_window, **kwargs):
-        """init method for ContinuePopup"""
+    def __init__(self, clear_jobs, old_scroll, new_window, sweep=None, **kwargs):
+        """init method for ContinuePopup
+        - sweep is (spread, write files) for a parameter sweep or None"""
         # Call Popup init method
         super(ContinuePopup, self).__init__(**kwargs)
         # Save the clear_jobs method for when user pressed 'yes'
@@ -300,84 +321,192 @@ class ContinuePopup(Popup):
         self.old_scroll = old_scroll
         # Save a reference to the next window
         self.new_window = new_window
+        # Save the parameter sweep settings
+        self.sweep = sweep
         # Get app reference
         self.app = App.get_running_app()
+        # The worker threads, their jobs and the clock event checking on them
+        self.pool = None
+        self.futures = []
+        self.clock_event = None
 
     def on_answer(self, answer):
         """called when user presses 'yes' or 'no'
         - if 'yes', then it will calculate forces and write files"""
         # If they said "yes continue"
         if answer == "yes":
-            new_file_locs = []
+            # Don't answer twice
+            self.buttons_layout.disabled = True
+            self.new_file_locs = []
+            self.errors = []
+            # The sweep files aren't opened in FG1 (they are just counted)
+            self.num_sweep_files = 0
+            # Calculate forces and write the files for each job in the background
+            jobs = list(self.old_scroll.grid_layout.children)
+            self.pool = ThreadPoolExecutor(max(1, min(FORCE_THREADS, len(jobs))))
+            # (job, force file location, future) for each job
+            self.futures = []
             # For each job
-            for job in self.old_scroll.grid_layout.children:
-                # Calculate forces
-                (
-                    frame_nums,
-                    t_vals,
-                    force_x,
-                    force_y,
-                    force_total,
-                    averageF_x,
-                    averageF_y,
-                    averageF_total,
-                    delta_Fx,
-                    delta_Fy,
-                    delta_totalF,
-                ) = force_convert_job(job)
+            for job in jobs:
                 # Get a file name/location to write a force file
                 new_file_loc = rename_file_force(job.file_location, job.name)
-                new_file_locs.append(new_file_loc)
-                # Decide dp to round microns to
-                if job.pixel_micron_ratio < 0.5:
-                    # Round to 10 micron
-                    dp = -1
-                elif job.pixel_micron_ratio < 5.0:
-                    # Round to 1 micron
-                    dp = 0
-                elif job.pixel_micron_ratio < 50.0:
-                    # Round to 0.1 micron
-                    dp = 1
-                else:
-                    # Round to 0.01 micron
-                    dp = 2
-                # Round position values to a particular decimal place
-                xum_vals = [round(x / job.pixel_micron_ratio, 1) for x in job.x_vals]
-                yum_vals = [round(y / job.pixel_micron_ratio, 1) for y in job.y_vals]
-                # Write the position & force file
-                write_pos_force_file(
-                    new_file_loc,
-                    self.app.COL_NAMES,
-                    frame_nums,
-                    t_vals,
-                    job.x_vals,
-                    job.y_vals,
-                    xum_vals,
-                    yum_vals,
-                    force_total,
-                    force_x,
-                    force_y,
-                    delta_Fx,
-                    delta_Fy,
-                )
+                future = self.pool.submit(self.convert, job, new_file_loc)
+                self.futures.append((job, new_file_loc, future))
+            self.update_progress()
+            self.clock_event = Clock.schedule_interval(self.check, CHECK_INTERVAL)
+        # If they said "no cancel"
+        else:
+            # Close popup
+            self.dismiss()
+
+    def convert(self, job, new_file_loc):
+        """takes a PF1 job and a file location to write its force file
+        - runs on a worker thread
+        - calculates the forces and writes the files
+        - returns the number of sweep files written"""
+        # Calculate forces and write the file
+        self.write_force_file(job, new_file_loc)
+        # If doing a parameter sweep
+        if self.sweep is not None:
+            return len(self.write_sweep_files(job))
+        return 0
+
+    def check(self, *args):
+        """called by the clock
+        - shows how many jobs have finished
+        - once every job has finished, the results are collected"""
+        self.update_progress()
+        # If every job has finished
+        if all(future.done() for _, _, future in self.futures):
+            self.clock_event.cancel()
+            self.clock_event = None
+            self.pool.shutdown(wait=False)
+            self.pool = None
+            self.finish()
+
+    def update_progress(self):
+        """shows how many jobs have finished on the popup"""
+        num_done = sum(future.done() for _, _, future in self.futures)
+        self.message_label.text = (
+            "Calculating forces... ("
+            + str(num_done)
+            + "/"
+            + str(len(self.futures))
+            + ")"
+        )
+
+    def finish(self):
+        """called once every job has finished
+        - jobs which failed are left on the job list (the others are removed)
+        - opens the success popup and/or an error popup"""
+        done_jobs = []
+        for job, new_file_loc, future in self.futures:
+            try:
+                self.num_sweep_files += future.result()
+            except Exception as error:
+                # This job failed (the others still finished)
+                self.errors.append(" • " + str(job.name) + " (" + str(error) + ")\n")
+            else:
+                done_jobs.append(job)
+                self.new_file_locs.append(new_file_loc)
+        self.futures = []
+        # If any files were saved
+        if self.new_file_locs:
             # Make pop up - alerts of files saved
             popup = PF1SuccessPopup(
-                new_file_locs,
+                self.new_file_locs,
                 self.new_window,
                 self.new_window.manager.get_screen("FG2"),
             )
             popup.success_label.text = (
-                str(len(new_file_locs))
+                str(len(self.new_file_locs) + self.num_sweep_files)
                 + " Files saved successfully.\nGenerate graphs or exit?"
             )
             popup.open()
+        # If any jobs failed
+        if self.errors != []:
+            # Only remove the jobs which finished
+            for job in done_jobs:
+                self.old_scroll.on_x_btn(job)
+            # Make pop up - alerts of the jobs which failed
+            popup = ErrorPopup()
+            popup.error_label.text = "Forces not saved:\n" + "".join(self.errors)
+            popup.open()
+        else:
             self.clear_jobs()
-            # Close popup
-            self.dismiss()
-        # If they said "no cancel"
+        # Close popup
+        self.dismiss()
+
+    def write_force_file(self, job, new_file_loc, parameters=None):
+        """takes a PF1 job, a file location and maybe some parameters
+        (a dict of values to use instead of the job's, see force_convert_job)
+        - calculates the forces and writes the position & force file
+        - this is done a block of frames at a time (see force_file_blocks)"""
+        # Get the parameters which are used
+        params = {name: float(getattr(job, name)) for name in SWEEP_PARAMETERS}
+        params.update(parameters or {})
+        # The image folder is known if the position file has a binary copy
+        source_schema = binary_schema(job.file_location) or {}
+        # Filtered positions have their own columns
+        if job.filter_type == "None":
+            col_names = self.app.COL_NAMES
         else:
-            # Close popup
-            self.dismiss()
+            col_names = self.app.FILTERED_COL_NAMES
+        # Calculate forces and write the position & force file as it goes
+        write_pos_force_blocks(
+            new_file_loc,
+            col_names,
+            len(job.x_vals),
+            force_file_blocks(job, parameters),
+            schema={
+                "source_folder": source_schema.get("source_folder"),
+                "position_file": job.file_location,
+                "pixel_micron_ratio": float(job.pixel_micron_ratio),
+                "position_filter": {
+                    "type": job.filter_type,
+                    "size": float(job.filter_size),
+                },
+                "force_parameters": {
+                    "time_base": float(job.time_base),
+                    "pillar_diameter": params["pillar_diameter"],
+                    "pillar_height": params["pillar_height"],
+                    "pillar_contact": params["pillar_contact"],
+                    "pdms_E": params["pdms_E"],
+                    "pdms_gama": params["pdms_gama"],
+                },
+            },
+        )
+
+    def write_sweep_files(self, job):
+        """takes a PF1 job
+        - calculates the forces for every combination of parameters in the sweep
+        - writes a summary file (one row per combination)
+        - writes a force file for each combination (if asked)
+        - returns the locations of the files written"""
+        spread, write_files = self.sweep
+        # Calculate every combination at once
+        params, summary = force_sweep_job(job, spread)
+        num_combinations = len(params[SWEEP_PARAMETERS[0]])
+        # Write the summary file
+        sweep_file_loc = rename_file_sweep(job.file_location, job.name)
+        columns = [list(range(1, num_combinations + 1))]
+        columns += [params[name].round(4) for name in SWEEP_PARAMETERS]
+        columns += [
+            summary[name].round(1)
+            for name in ["averageF_x", "averageF_y", "averageF_total", "maxF_total"]
+        ]
+        write_csv_columns(sweep_file_loc, self.app.SWEEP_COL_NAMES, columns)
+        new_file_locs = [sweep_file_loc]
+        # Write a force file for each combination (if asked)
+        if write_files:
+            for index in range(num_combinations):
+                new_file_loc = rename_file_sweep(
+                    job.file_location, job.name, combination=index + 1
+                )
+                parameters = {name: float(params[name][index]) for name in params}
+                self.write_force_file(job, new_file_loc, parameters)
+                new_file_locs.append(new_file_loc)
+        return new_file_locs
 
 
 class FG2SuccessPopup(Popup):
@@ -0,0 +1,305 @@
+"""
+Module: Array based position data with undoable edits (PS2)
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import numpy
+import numpy as np
+
+# Import modules for dealing with files
+import csv
+import os
+
+# Import modules for timing
+from time import perf_counter
+
+# Edits to the same frames within this many seconds are undone together
+MERGE_TIME = 1.0
+# The extension added to a position file for its edit journal
+JOURNAL_EXTENSION = ".edits"
+
+
+def position_arrays(position_data):
+    """takes position data (frame numbers, x values, y values)
+    - returns the same data as int32 numpy arrays"""
+    frame_nums, x_vals, y_vals = position_data
+    return (
+        np.asarray(frame_nums, dtype=np.int32),
+        np.asarray(x_vals, dtype=np.float64).astype(np.int32),
+        np.asarray(y_vals, dtype=np.float64).astype(np.int32),
+    )
+
+
+def journal_location(position_file_location):
+    """takes a position file location
+    - returns the location of its edit journal (a file alongside it)"""
+    return position_file_location + JOURNAL_EXTENSION
+
+
+class EditHistory:
+    """the edits made to a job's positions (for undo/redo)
+    - position_data is a tuple of int32 arrays (frame numbers, x values, y values)
+    - each edit is stored as a frame range and a movement (start, stop, dx, dy)
+    rather than a copy of the positions
+    - the movement is the same for every frame in the range, except for re-tracked
+    frames where dx and dy are arrays (one movement per frame)
+    - if given a journal location, every edit/undo/redo is appended to that file
+    as it happens, and an existing journal is replayed (resuming the session)"""
+
+    def __init__(self, position_data, journal_location=None):
+        """init method for EditHistory"""
+        self.position_data = position_data
+        # Edits which can be undone / redone: (start, stop, dx, dy)
+        self.undo_stack = []
+        self.redo_stack = []
+        # When the last edit was made (for merging edits)
+        self.last_edit_time = None
+        # The undo entry of the re-track being added (None if it has no entry yet)
+        self.track_edit = None
+        # The file the edits are journaled to
+        self.journal_location = journal_location
+        # True while replaying the journal (so it isn't written again)
+        self.replaying = False
+        # Resume from the journal if there is one
+        if journal_location is not None and os.path.exists(journal_location):
+            self.resume()
+
+    @property
+    def updated(self):
+        """True if there are any edits which haven't been undone"""
+        return len(self.undo_stack) > 0
+
+    def shift(self, start, stop, dx, dy):
+        """takes a frame index range and a movement
+        - moves the positions in that range"""
+        self.position_data[1][start:stop] += dx
+        self.position_data[2][start:stop] += dy
+
+    def move(self, frame, new_pos, plus_succeeding=False):
+        """takes a frame number and a new position
+        - moves that frame's position to the new position
+        - if plus_succeeding, all following frames are moved the same amount
+        - returns the edit made (None if nothing moved)"""
+        start = frame - 1
+        stop = len(self.position_data[1]) if plus_succeeding else frame
+        # Get the net movement
+        old_x = int(self.position_data[1][start])
+        old_y = int(self.position_data[2][start])
+        dx, dy = int(new_pos[0]) - old_x, int(new_pos[1]) - old_y
+        if dx == 0 and dy == 0:
+            return None
+        now = perf_counter()
+        # If the last edit was to the same frames just now, merge them
+        merge = (
+            len(self.undo_stack) > 0
+            and self.undo_stack[-1][0:2] == (start, stop)
+            and self.last_edit_time is not None
+            and now - self.last_edit_time < MERGE_TIME
+        )
+        self.last_edit_time = now
+        self.apply_edit(start, stop, dx, dy, merge)
+        # Journal the edit (the frame and positions are just for reference)
+        self.write_journal(
+            ["edit", start, stop, dx, dy, int(merge)]
+            + [frame, old_x, old_y, old_x + dx, old_y + dy]
+        )
+        return (start, stop, dx, dy)
+
+    def track(self, start, x_vals, y_vals, merge=False):
+        """takes a frame index and new (re-tracked) positions from that frame on
+        - moves those frames to the new positions
+        - if merge, it is added onto the same re-track's undo entry (see track_edit)
+        if that is still the last edit, so one re-track is undone as one edit
+        - returns the edit made"""
+        stop = start + len(x_vals)
+        # Get the movement of each frame
+        dx = np.asarray(x_vals, dtype=np.int32) - self.position_data[1][start:stop]
+        dy = np.asarray(y_vals, dtype=np.int32) - self.position_data[2][start:stop]
+        # Only merge into this re-track's own entry (if nothing moved in the
+        # earlier batches there is none, so this batch starts it)
+        merge = (
+            merge
+            and self.track_edit is not None
+            and len(self.undo_stack) > 0
+            and self.undo_stack[-1] is self.track_edit
+        )
+        self.track_edit = self.apply_edit(start, stop, dx, dy, merge)
+        # Never merge a move into re-tracked frames
+        self.last_edit_time = None
+        # Journal the re-tracked movements
+        self.write_journal(
+            ["track", start, stop, int(merge)]
+            + [" ".join(str(value) for value in dx)]
+            + [" ".join(str(value) for value in dy)]
+        )
+        return (start, stop, dx, dy)
+
+    def apply_edit(self, start, stop, dx, dy, merge=False):
+        """takes a frame index range, a movement and whether to merge it with the
+        last edit
+        - moves the positions and remembers the edit for undoing
+        - an edit to the same range is merged by adding the movements
+        - an edit starting where the last edit stopped is merged by joining them
+        - returns the undo entry (None if nothing is remembered)"""
+        self.shift(start, stop, dx, dy)
+        self.redo_stack = []
+        # Merge with the last edit
+        if merge:
+            last_start, last_stop, last_dx, last_dy = self.undo_stack.pop()
+            # If it is the same frames, add the movements
+            if (last_start, last_stop) == (start, stop):
+                dx, dy = last_dx + dx, last_dy + dy
+            # Otherwise join them (one movement per frame)
+            else:
+                dx = np.concatenate(
+                    (
+                        np.broadcast_to(last_dx, last_stop - last_start),
+                        np.broadcast_to(dx, stop - start),
+                    )
+                ).astype(np.int32)
+                dy = np.concatenate(
+                    (
+                        np.broadcast_to(last_dy, last_stop - last_start),
+                        np.broadcast_to(dy, stop - start),
+                    )
+                ).astype(np.int32)
+                start = last_start
+        # If the merged edits cancelled out, there is nothing to remember
+        if np.any(dx != 0) or np.any(dy != 0):
+            self.undo_stack.append((start, stop, dx, dy))
+            return self.undo_stack[-1]
+        return None
+
+    def undo(self):
+        """undoes the last edit
+        - returns the edit undone (None if there were none)"""
+        if not self.undo_stack:
+            return None
+        start, stop, dx, dy = self.undo_stack.pop()
+        self.shift(start, stop, -dx, -dy)
+        self.redo_stack.append((start, stop, dx, dy))
+        # Never merge into an edit after undoing
+        self.last_edit_time = None
+        self.write_journal(["undo"])
+        return (start, stop, dx, dy)
+
+    def redo(self):
+        """redoes the last undone edit
+        - returns the edit redone (None if there were none)"""
+        if not self.redo_stack:
+            return None
+        start, stop, dx, dy = self.redo_stack.pop()
+        self.shift(start, stop, dx, dy)
+        self.undo_stack.append((start, stop, dx, dy))
+        self.last_edit_time = None
+        self.write_journal(["redo"])
+        return (start, stop, dx, dy)
+
+    def extend(self, x_vals, y_vals):
+        """takes the positions of new frames (after the last frame)
+        - adds them onto the end of the positions
+        - returns the new position data (the arrays are replaced)"""
+        num_frames = len(self.position_data[1])
+        frame_nums = np.arange(
+            num_frames + 1, num_frames + len(x_vals) + 1, dtype=np.int32
+        )
+        self.position_data = tuple(
+            np.concatenate((values, np.asarray(new_values, dtype=np.int32)))
+            for values, new_values in zip(
+                self.position_data, (frame_nums, x_vals, y_vals)
+            )
+        )
+        # Journal the new number of frames
+        self.write_journal(["frames", len(self.position_data[1])])
+        return self.position_data
+
+    def materialise(self, original_position_data):
+        """takes the original position data (before any edits)
+        - returns new position data with the edits applied to the original"""
+        frame_nums, x_vals, y_vals = (
+            values.copy() for values in original_position_data
+        )
+        for start, stop, dx, dy in self.undo_stack:
+            x_vals[start:stop] += dx
+            y_vals[start:stop] += dy
+        return frame_nums, x_vals, y_vals
+
+    def write_journal(self, row):
+        """takes a row
+        - appends it to the journal (starting the journal if needed)"""
+        if self.journal_location is None or self.replaying:
+            return
+        # A new journal starts with the number of frames it is for
+        rows = [row]
+        if not os.path.exists(self.journal_location):
+            rows.insert(0, ["frames", len(self.position_data[1])])
+        with open(
+            self.journal_location, "a", newline="", encoding="UTF-8"
+        ) as journal_file:
+            csv.writer(journal_file).writerows(rows)
+
+    def resume(self):
+        """replays the journal onto the positions
+        - a journal which was never for this number of frames is deleted
+        (frames can be added while it is being written, see extend)
+        - anything after a damaged row (e.g. from a crash) is dropped"""
+        with open(self.journal_location, newline="", encoding="UTF-8") as journal_file:
+            lines = journal_file.read().splitlines(keepends=True)
+        num_frames = len(self.position_data[1])
+        # If the journal is not for these positions, forget it
+        frame_counts = [line.strip() for line in lines if line.startswith("frames,")]
+        if not lines or "frames," + str(num_frames) not in frame_counts:
+            self.delete_journal()
+            return
+        self.replaying = True
+        good_lines = 1
+        for line in lines[1:]:
+            row = next(csv.reader([line]), [])
+            try:
+                # Only whole lines are replayed
+                if not line.endswith("\n"):
+                    raise ValueError
+                if row[0] == "edit":
+                    start, stop, dx, dy, merge = (int(value) for value in row[1:6])
+                    if not 0 <= start < stop <= num_frames:
+                        raise ValueError
+                    if merge and not self.undo_stack:
+                        raise ValueError
+                    self.apply_edit(start, stop, dx, dy, merge=bool(merge))
+                elif row[0] == "track":
+                    start, stop, merge = (int(value) for value in row[1:4])
+                    dx = np.array(row[4].split(), dtype=np.int32)
+                    dy = np.array(row[5].split(), dtype=np.int32)
+                    if not 0 <= start < stop <= num_frames:
+                        raise ValueError
+                    if len(dx) != stop - start or len(dy) != stop - start:
+                        raise ValueError
+                    if merge and not self.undo_stack:
+                        raise ValueError
+                    self.apply_edit(start, stop, dx, dy, merge=bool(merge))
+                elif row[0] == "frames":
+                    # Frames were added (which must be in the positions)
+                    if not 0 < int(row[1]) <= num_frames:
+                        raise ValueError
+                elif row[0] == "undo":
+                    self.undo()
+                elif row[0] == "redo":
+                    self.redo()
+                else:
+                    raise ValueError
+            except (ValueError, IndexError):
+                break
+            good_lines += 1
+        self.replaying = False
+        # If any lines were damaged, rewrite the journal without them
+        if good_lines < len(lines):
+            with open(
+                self.journal_location, "w", newline="", encoding="UTF-8"
+            ) as journal_file:
+                journal_file.write("".join(lines[:good_lines]))
+
+    def delete_journal(self):
+        """deletes the journal (if there is one)"""
+        if self.journal_location is not None and os.path.exists(self.journal_location):
+            os.remove(self.journal_location)
@@ -0,0 +1,215 @@
+"""
+Module: Smoothing the tracked positions before force conversion
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Mathematical imports
+import numpy as np
+from numpy.lib.stride_tricks import sliding_window_view
+
+# The filters which can be chosen for a PF1 job (in the order of the drop down)
+FILTERS = ("None", "Savitzky-Golay", "Median", "Kalman")
+# The default filter size (window in frames, or noise ratio for the Kalman filter)
+FILTER_SIZE = 5
+# The order of the polynomial fitted by the Savitzky-Golay filter
+SAVGOL_ORDER = 2
+# The number of frames the Kalman filter does at once (see kalman_part)
+KALMAN_BLOCK_SIZE = 64
+
+
+def valid_filter_size(filter_type, size):
+    """takes a filter type (see FILTERS) and a filter size (maybe a string)
+    - returns True if the size can be used with that filter
+    - windows must be odd whole numbers (above SAVGOL_ORDER for Savitzky-Golay)
+    - the Kalman noise ratio must be above 0"""
+    try:
+        size = float(size)
+    except ValueError:
+        return False
+    if filter_type == "Kalman":
+        return size > 0
+    if filter_type in ("Savitzky-Golay", "Median"):
+        return size == int(size) and size % 2 == 1 and size > SAVGOL_ORDER
+    return True
+
+
+def savgol_matrix(window, order=SAVGOL_ORDER):
+    """takes a window length (odd) and a polynomial order
+    - returns a (window x window) matrix which, multiplied by a window of values,
+    gives the least squares polynomial fitted at each point in the window
+    - the middle row is the Savitzky-Golay convolution kernel"""
+    offsets = np.arange(window) - window // 2
+    vandermonde = offsets[:, np.newaxis] ** np.arange(order + 1)
+    return vandermonde @ np.linalg.pinv(vandermonde)
+
+
+def savgol_part(values, window, first=0, end=True, order=SAVGOL_ORDER):
+    """takes an array of values, a window length (odd), the index of the first
+    value to filter (0 is the start of the data) and whether the data ends here
+    - returns the filtered values from first to the end
+    (or to window // 2 from the end, if more data is still to come)
+    - the ends of the data use the polynomial fitted to the first/last window"""
+    values = np.asarray(values, dtype=np.float64)
+    num_values = len(values)
+    # If all of the data is shorter than the window, shrink the window
+    if first == 0 and end and num_values < window:
+        window = num_values if num_values % 2 == 1 else num_values - 1
+        if window <= order:
+            return values.copy()
+    half = window // 2
+    matrix = savgol_matrix(window, order)
+    parts = []
+    # The start of the data
+    if first == 0:
+        parts.append(matrix[:half] @ values[:window])
+        first = half
+    # The middle (a convolution with the middle row)
+    if num_values - half > first:
+        kernel = matrix[half][::-1]
+        parts.append(np.convolve(values[first - half :], kernel, mode="valid"))
+    # The end of the data
+    if end:
+        parts.append(matrix[half + 1 :] @ values[-window:])
+    return np.concatenate(parts) if parts else np.zeros(0)
+
+
+def median_part(values, window, first=0, end=True):
+    """takes an array of values, a window length (odd), the index of the first
+    value to filter (0 is the start of the data) and whether the data ends here
+    - returns the median filtered values from first to the end
+    (or to window // 2 from the end, if more data is still to come)
+    - the ends of the data are padded with the first/last value"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(0)
+    half = window // 2
+    left = half if first == 0 else 0
+    right = half if end else 0
+    padded = np.concatenate(
+        [np.full(left, values[0]), values, np.full(right, values[-1])]
+    )
+    start = first + left
+    stop = len(padded) - half
+    if stop <= start:
+        return np.zeros(0)
+    return np.median(sliding_window_view(padded[start - half :], window), axis=1)
+
+
+def kalman_gain(noise_ratio):
+    """takes the measurement noise relative to the process noise
+    - returns the steady state gain of a constant velocity Kalman filter
+    (position and velocity, one frame apart)
+    - a larger noise ratio trusts the measurements less (smoother)"""
+    transition = np.array([[1.0, 1.0], [0.0, 1.0]])
+    # White noise acceleration (for one frame)
+    process = np.array([[0.25, 0.5], [0.5, 1.0]])
+    covariance = np.eye(2) * noise_ratio
+    gain = np.zeros(2)
+    # The covariance doesn't depend on the data, so iterate it until it settles
+    for _ in range(10000):
+        predicted = transition @ covariance @ transition.T + process
+        new_gain = predicted[:, 0] / (predicted[0, 0] + noise_ratio)
+        covariance = predicted - np.outer(new_gain, predicted[0])
+        if np.allclose(new_gain, gain, rtol=0, atol=1e-12):
+            break
+        gain = new_gain
+    return new_gain
+
+
+def kalman_part(values, gain, state=None, block_size=KALMAN_BLOCK_SIZE):
+    """takes an array of values, a Kalman gain (see kalman_gain) and the
+    (position, velocity) after the last value filtered (None at the start)
+    - returns the filtered positions and the (position, velocity) after them
+    - the filter is linear, so each block of frames is done with matrices
+    and only the state between blocks is carried in a loop"""
+    values = np.asarray(values, dtype=np.float64)
+    if len(values) == 0:
+        return np.zeros(0), state
+    # The first frame starts the filter (still)
+    first = []
+    if state is None:
+        state = np.array([values[0], 0.0])
+        first = [values[0]]
+        values = values[1:]
+        if len(values) == 0:
+            return np.array(first), state
+    # Each frame: state = update @ transition @ state + gain * value
+    transition = np.array([[1.0, 1.0], [0.0, 1.0]])
+    step = (np.eye(2) - np.outer(gain, [1.0, 0.0])) @ transition
+    powers = np.empty((block_size + 1, 2, 2))
+    powers[0] = np.eye(2)
+    for index in range(1, block_size + 1):
+        powers[index] = step @ powers[index - 1]
+    # The effect of a value on the state after 0 to block_size - 1 frames
+    impulse = powers[:block_size] @ gain
+    lags = np.subtract.outer(np.arange(block_size), np.arange(block_size))
+    toeplitz = np.where(lags >= 0, lags, 0)
+    # Split the values into blocks (the last is padded, which doesn't affect them)
+    num_blocks = -(-len(values) // block_size)
+    blocks = np.zeros(num_blocks * block_size)
+    blocks[: len(values)] = values
+    blocks = blocks.reshape(num_blocks, block_size)
+    # The state each block would reach from nothing (blocks x frames x 2)
+    local = np.stack(
+        [blocks @ np.where(lags >= 0, impulse[toeplitz, c], 0).T for c in range(2)],
+        axis=2,
+    )
+    # Carry the state from block to block
+    starts = np.empty((num_blocks, 2))
+    for index in range(num_blocks):
+        starts[index] = state
+        state = powers[block_size] @ state + local[index, -1]
+    # Add the effect of the state at the start of each block
+    states = local + np.einsum("fij,bj->bfi", powers[1:], starts)
+    states = states.reshape(-1, 2)[: len(values)]
+    return np.concatenate([first, states[:, 0]]), states[-1].copy()
+
+
+class FilterStream:
+    """filters positions one block of frames at a time
+    - Savitzky-Golay and median filters need window // 2 frames after each frame,
+    so they return the frames they can (the rest come with the next block)
+    - the Kalman filter carries its state between blocks
+    - every frame has been returned once a block is given with final=True"""
+
+    def __init__(self, filter_type, size=FILTER_SIZE):
+        """init method for FilterStream"""
+        self.filter_type = filter_type
+        self.window = int(float(size))
+        self.gain = kalman_gain(float(size)) if filter_type == "Kalman" else None
+        # Frames which are still needed (and whether the start has been done)
+        self.buffer = np.zeros(0)
+        self.started = False
+        # The Kalman filter's (position, velocity)
+        self.state = None
+
+    def filter(self, values, final=False):
+        """takes the next block of positions (and whether it is the last)
+        - returns the filtered positions which are ready"""
+        values = np.asarray(values, dtype=np.float64)
+        if self.filter_type == "Kalman":
+            filtered, self.state = kalman_part(values, self.gain, self.state)
+            return filtered
+        if self.filter_type not in ("Savitzky-Golay", "Median"):
+            return values
+        part = savgol_part if self.filter_type == "Savitzky-Golay" else median_part
+        half = self.window // 2
+        values = np.concatenate([self.buffer, values])
+        # Wait for at least a full window (unless this is all of the data)
+        if not final and len(values) < self.window:
+            self.buffer = values
+            return np.zeros(0)
+        # The first frame to filter (the buffer holds a window before it)
+        first = half + 1 if self.started else 0
+        filtered = part(values, self.window, first, final)
+        self.started = True
+        # Keep the last window for the next block
+        self.buffer = values[-self.window :]
+        return filtered
+
+
+def filter_positions(values, filter_type, size=FILTER_SIZE):
+    """takes an array of positions, a filter type (see FILTERS) and size
+    - returns the filtered positions"""
+    return FilterStream(filter_type, size).filter(values, final=True)
@@ -6,16 +6,17 @@ Author: Haig Bishop (hbi34@uclive.ac.nz)
 
 # Import local modules
 from popup_elements import BackPopup, ErrorPopup
+from frame_source import is_container
 from file_management import (
     folder_name,
     is_valid_folder,
     images_from_folder,
     is_csv_xml,
     file_header,
-    detect_encoding,
     valid_image_dims,
     num_valid_images,
 )
+from table_loader import load_table, first_invalid_value
 
 # Kivy imports
 from kivy.app import App
@@ -26,13 +27,14 @@ from kivy.uix.screenmanager import Screen
 # Import modules for dealing with files
 from os.path import getctime
 from datetime import datetime
-import csv
 import os
 import re
-import xml.etree.ElementTree as et
 from subprocess import Popen as p_open
 from plyer import filechooser
 
+# Import numpy
+import numpy as np
+
 
 class PS1Window(Screen):
     """position -> force screen"""
@@ -126,14 +128,12 @@ class PS1Window(Screen):
                         " • invlaid column length(s) (" + str(job.name) + ")\n"
                     )
                 # Check for invalid column values
-                for pos in x_col + y_col:
-                    try:
-                        # Try convert to float
-                        float(pos)
-                    except ValueError:
-                        # Invalid float
-                        errors.append(" • invalid column value (" + str(pos) + ")\n")
-                        break
+                invalid_value = first_invalid_value(x_col, y_col)
+                if invalid_value is not None:
+                    # Invalid float
+                    errors.append(
+                        " • invalid column value (" + str(invalid_value) + ")\n"
+                    )
             # Add this job's name to list (to check for duplicates)
             name_list.append(job.name)
         # Check for duplicate names
@@ -336,8 +336,12 @@ class PS1Window(Screen):
         """called when [select file(s)] button is pressed
         - opens the file select window
         - selection is sent to self.selected_file()"""
-        # Only allow selection of csv or xml
-        filters = [("CSV files", "*.csv"), ("XML files", "*.xml")]
+        # Only allow selection of csv, xml or binary (npz)
+        filters = [
+            ("CSV files", "*.csv"),
+            ("XML files", "*.xml"),
+            ("Binary files", "*.npz"),
+        ]
         # Open file selector window - send selection to self.selected
         filechooser.open_file(
             path=self.current_job.folder_location,
@@ -481,8 +485,11 @@ class PS1Window(Screen):
     def _on_file_drop(self, file_path, x, y):
         """called when a file/folder is dropped on this screen
         - sends the file/folder path to the selected method"""
+        # Is it a TIFF stack/video (used like a folder)
+        if is_container(file_path):
+            self.selected_folder([file_path])
         # Is it a file
-        if os.path.isfile(file_path):
+        elif os.path.isfile(file_path):
             # If there is a job
             if self.current_job is not None:
                 self.selected_file([file_path])
@@ -580,36 +587,19 @@ class PS1JobListBox(Button):
             self.is_selected = False
 
     def column_values(self):
-        """read the file and returns a value list for each column"""
-        # Strip the [1], [2], etc. from the self.header values
-        x_col_list, y_col_list = [], []
-        # If a csv file
-        if self.file_location[-4:] == ".csv":
-            # If this file exists
-            if os.path.exists(self.file_location):
-                # Read the csv file and extract the values
-                encoding = detect_encoding(self.file_location)
-                with open(self.file_location, "r", encoding=encoding) as csv_file:
-                    reader = csv.reader(csv_file)
-                    next(reader)  # Skip header row
-                    # Read the rows
-                    for row in reader:
-                        x_col_list.append(int(float(row[self.x_column[0]])))
-                        y_col_list.append(int(float(row[self.y_column[0]])))
-        # If an xml file
-        elif self.file_location[-4:] == ".xml":
-            # If this file exists
-            if os.path.exists(self.file_location):
-                # Read the xml file and extract the values
-                tree = et.parse(self.file_location)
-                root = tree.getroot()
-                # Read the 'rows'
-                for detection in root.findall(".//detection"):
-                    x_col_list.append(int(float(detection.get(self.x_column[1]))))
-                    y_col_list.append(int(float(detection.get(self.y_column[1]))))
+        """returns the values of the selected columns (from the loaded file)
+        - columns of numbers are made into whole numbers (pixel positions)"""
+        # Get the file's columns (only read once)
+        table = load_table(self.file_location)
+        x_col_list = table.column(self.x_column[0])
+        y_col_list = table.column(self.y_column[0])
+        # Make whole numbers (if they are numbers)
+        if first_invalid_value(x_col_list, y_col_list) is None:
+            x_col_list = x_col_list.astype(np.int64)
+            y_col_list = y_col_list.astype(np.int64)
         # Save col values as an attribute :)
-        self.x_vals = x_col_list[:]
-        self.y_vals = y_col_list[:]
+        self.x_vals = x_col_list.copy()
+        self.y_vals = y_col_list.copy()
         return x_col_list, y_col_list
 
     def on_open_btn(self, file_or_folder):
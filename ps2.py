@@ -6,13 +6,26 @@ Author: Haig Bishop (hbi34@uclive.ac.nz)
 
 # Import local modules
 from popup_elements import BackPopup, ErrorPopup, VerifyPopup
-from file_management import folder_name, images_from_folder, resource_path
+from file_management import folder_name, resource_path
+from file_management import (
+    POS_FILE_HEADERS,
+    is_pos_file,
+    append_pos_file,
+    write_binary_copy,
+)
 from file_management import (
     is_valid_folder,
     images_from_folder,
     valid_image_dims,
     positions_in_image_dim,
 )
+from display_pyramid import DisplayPyramid
+from frame_source import read_frame, split_image_location
+from playback import PlaybackEngine, FPS_STEP
+from overview import Filmstrip, draw_trajectory, nearest_frame
+from position_edits import EditHistory, position_arrays, journal_location
+from retrack import Retracker
+from live_tracker import LiveTracker
 
 # Kivy imports
 from kivy.app import App
@@ -235,6 +248,10 @@ class PS2Window(Screen):
     def clear_jobs(self):
         """simply empties the job list
         - this has to be a while loop, because the list changes size while looping"""
+        # Stop playing, re-tracking and watching (if doing so)
+        self.image_widget.playback.stop()
+        self.image_widget.retracker.stop()
+        self.image_widget.live_tracker.stop()
         # While there are still jobs
         while len(self.ps2_scroll.grid_layout.children) != 0:
             # Remove the first job using on_x_btn
@@ -258,8 +275,16 @@ class PS2ScrollView(ScrollView):
         - disables the layouts because there is nothing selected now
         - removes the jobs
         - updates visuals"""
+        # Stop re-tracking that job (if doing so)
+        if self.ps2_window.image_widget.retracker.job is box:
+            self.ps2_window.image_widget.retracker.stop()
+        # Stop watching that job's folder (if doing so)
+        if self.ps2_window.image_widget.live_tracker.job is box:
+            self.ps2_window.image_widget.live_tracker.stop()
         # Remove that job
         self.grid_layout.remove_widget(box)
+        # Forget its edit journal (the job is finished with)
+        box.history.delete_journal()
         # Update current job to none
         self.ps2_window.current_job = None
         # Update visual stuff
@@ -294,12 +319,20 @@ class PS2JobListBox(Button):
         # Save the original file incase of no changes
         self.original_position_file_location = position_file_location
         # Save position data incase of no changes
-        self.original_position_data = position_data
-        self.position_data = position_data
-        # This variable tracks whether or not the positions have been updated
-        self.updated = False
+        self.position_data = position_arrays(position_data)
+        self.original_position_data = tuple(
+            values.copy() for values in self.position_data
+        )
+        # This tracks the edits to the positions (and whether they were updated)
+        # - they are saved to a journal as they happen (and resumed from it)
+        self.history = EditHistory(
+            self.position_data, journal_location(position_file_location)
+        )
         # The radius of the circle
         self.radius = radius
+        # Frames added while watching the folder (see add_frames)
+        self.appended_to_file = False  # Added to the position file
+        self.unsaved_frames = False  # Not added to the position file
         # Save app as an attribute
         self.app = App.get_running_app()
         # Call Button init method
@@ -320,14 +353,60 @@ class PS2JobListBox(Button):
         # Calculate the size of the axis overlay
         self.calculate_axis_scale()
 
-    def update_pos(self, frame, new_pos):
-        """updates the data!"""
-        # Update x
-        self.position_data[1][frame - 1] = new_pos[0]
-        # Update y
-        self.position_data[2][frame - 1] = new_pos[1]
-        # The positions have been updated
-        self.updated = True
+    @property
+    def updated(self):
+        """True if the positions have been updated (and not undone)
+        - or frames were added which aren't in the position file"""
+        return self.history.updated or self.unsaved_frames
+
+    def add_frames(self, image_locs, x_vals, y_vals):
+        """takes new (tracked) frames and their positions
+        - adds them onto the end of the job
+        - adds them onto the end of the position file (if written by this app)"""
+        num_frames = len(self.image_locations)
+        self.image_locations.extend(image_locs)
+        # Add the positions (the tracked positions are the originals)
+        self.position_data = self.history.extend(x_vals, y_vals)
+        self.original_position_data = tuple(
+            np.concatenate((values, new_values[num_frames:]))
+            for values, new_values in zip(
+                self.original_position_data, self.position_data
+            )
+        )
+        # Add them to the position file
+        if not self.unsaved_frames and is_pos_file(
+            self.original_position_file_location
+        ):
+            append_pos_file(
+                self.original_position_file_location,
+                [values[num_frames:] for values in self.original_position_data],
+            )
+            self.appended_to_file = True
+        # Otherwise they are saved when the positions are verified
+        else:
+            self.unsaved_frames = True
+        # Update the visuals
+        if self.ps2_window.current_job is self:
+            self.ps2_window.update_fields()
+            self.ps2_window.image_widget.update_image()
+
+    def finish_live(self):
+        """called when the folder is no longer being watched
+        - rewrites the binary copy of the position file (if frames were added)"""
+        if self.appended_to_file:
+            write_binary_copy(
+                self.original_position_file_location,
+                POS_FILE_HEADERS,
+                self.original_position_data,
+                schema={"source_folder": self.folder_location},
+            )
+            self.appended_to_file = False
+
+    def update_pos(self, frame, new_pos, plus_succeeding=False):
+        """updates the data!
+        - if plus_succeeding, all following frames are moved the same amount"""
+        # Update x & y (and remember the edit)
+        self.history.move(frame, new_pos, plus_succeeding=plus_succeeding)
         # Update the visuals
         self.ps2_window.image_widget.update_image()
 
@@ -357,7 +436,7 @@ class PS2JobListBox(Button):
         - optional histogram clipping"""
         # Read the first image
         image_loc = self.first_image_location
-        image = imread(image_loc)
+        image = read_frame(image_loc)
         # Convert to grayscale
         gray = cvtColor(image, COLOR_BGR2GRAY)
         # Set histogram clip percentage
@@ -394,7 +473,7 @@ class PS2JobListBox(Button):
         - calculates the optimal scale for the axis overlay"""
         # Read the first image
         image_loc = self.first_image_location
-        image = imread(image_loc)
+        image = read_frame(image_loc)
         # Get the smallest side
         min_image_side = min([image.shape[0], image.shape[1]])
         # Just divide that by 10
@@ -432,12 +511,46 @@ class PillarTrackingImage(Image):
         # Set attributes for zooming
         self.zoomed = False
         self.crop_bbox = None  # Box pixel box that is zoomed in on
+        # Downsampled previews of the frames (sized to fit this widget)
+        self.pyramid = DisplayPyramid()
+        self.image_scale = 1  # Displayed pixels per image pixel
+        # Redraw the image (at the new preview size) when the widget is resized
+        self.resize_trigger = Clock.create_trigger(self.on_resize, 0.1)
+        self.bind(size=self.resize_trigger)
+        # Plays the current job's frames (toggled with 'p')
+        self.playback = PlaybackEngine(self)
+        # Re-tracks the frames after the current frame (started with 'r')
+        self.retracker = Retracker(self)
+        # Tracks new frames as they are acquired (toggled with 'w')
+        self.live_tracker = LiveTracker(self)
+        # Set attributes for the overview (toggled with 'o')
+        self.overview_on = False
+        self.filmstrip = None
+        self.strip_top = 0  # The image row where the filmstrip starts
+        # Redraw the overview as the filmstrip thumbnails are made
+        self.filmstrip_trigger = Clock.create_trigger(self.on_filmstrip_update, 0.2)
+
+    def on_resize(self, *args):
+        """called shortly after the widget is resized
+        - redraws the image so the preview matches the new size"""
+        if self.ps2_window.current_job is not None:
+            self.update_image()
+
+    def preview_size(self):
+        """returns the size (width, height) which previews should fit within"""
+        return (max(1, int(self.width)), max(1, int(self.height)))
+
+    def on_filmstrip_update(self, *args):
+        """called shortly after filmstrip thumbnails are made
+        - redraws the image if the overview is showing"""
+        if self.overview_on and self.ps2_window.current_job is not None:
+            self.update_image()
 
     def on_touch_move(self, touch):
         """called when there is a 'touch movement'
         - this includes things like click/drags and swipes"""
         # If the touch is within the image
-        if self.pos_in_image(touch.pos) and not self.zoomed:
+        if self.pos_in_image(touch.pos) and not self.zoomed and not self.overview_on:
             # Update the circle position
             self.update_pos(touch.pos, touch_pos=True)
         # You have to return this because it is a Kivy method
@@ -447,8 +560,12 @@ class PillarTrackingImage(Image):
         """this is called by all mouse up things. (e.g. left, right, middle scroll)"""
         # If it is a button (Kivy thing) and the touch is within the image
         if "button" in touch.profile and self.pos_in_image(touch.pos):
+            # If a left click on the overview
+            if touch.button == "left" and self.overview_on and not self.zoomed:
+                # Jump to the frame that was clicked
+                self.overview_touch(touch.pos)
             # If a left click
-            if touch.button == "left":
+            elif touch.button == "left":
                 # Update the circle position
                 self.update_pos(touch.pos, touch_pos=True)
             else:
@@ -456,7 +573,9 @@ class PillarTrackingImage(Image):
                 radius = self.ps2_window.current_job.radius
                 # Get the shape of the image
                 image_shape = tuple(
-                    imread(self.ps2_window.current_job.first_image_location).shape[0:2]
+                    self.pyramid.full(
+                        self.ps2_window.current_job.first_image_location
+                    ).shape[0:2]
                 )
                 # True if the shortest image dimension is smaller than 6x the radius
                 too_big = radius > min(image_shape) / 6
@@ -496,6 +615,52 @@ class PillarTrackingImage(Image):
         # If was within the image
         return is_in_image
 
+    def texture_pos(self, pos):
+        """takes a position in reference to the entire app
+        - returns the position on the texture pixel grid (from the top left)"""
+        # Correct pos in regards to image widget
+        norm_image_x = (self.width - self.norm_image_size[0]) / 2
+        norm_image_y = (
+            self.height - self.norm_image_size[1]
+        ) / 2 + self.ps2_window.frame_bar_layout.height
+        x, y = pos[0] - norm_image_x, pos[1] - norm_image_y
+        # Correct pos in regards to texture pixel grid!
+        x, y = int((x / self.norm_image_size[0]) * self.texture_size[0]), int(
+            (y / self.norm_image_size[1]) * self.texture_size[1]
+        )
+        # Flip y coord!
+        y = int((y - self.texture_size[1]) * -1)
+        return x, y
+
+    def overview_touch(self, pos):
+        """takes a position in reference to the entire app
+        - jumps to the frame of the thumbnail or trajectory point clicked on"""
+        job = self.ps2_window.current_job
+        x, y = self.texture_pos(pos)
+        # If the filmstrip was clicked
+        if y >= self.strip_top:
+            frame = self.filmstrip.frame_at(x, self.texture_size[0])
+        # If the image was clicked, find the nearest point on the trajectory
+        else:
+            frame = nearest_frame(
+                (x / self.image_scale, y / self.image_scale),
+                job.position_data[1],
+                job.position_data[2],
+                job.radius,
+            )
+        # If a frame was found
+        if frame is not None:
+            self.go_to_frame(frame)
+
+    def go_to_frame(self, frame):
+        """takes a frame number
+        - makes it the current frame of the current job"""
+        # Jumping to a frame stops playback
+        self.playback.stop()
+        self.ps2_window.current_job.current_frame = frame
+        self.update_image()
+        self.ps2_window.update_fields()
+
     def update_pos(self, pos, touch_pos=False, plus_succeeding=False):
         """Takes a position and updates the position of the pillar circle
         - if touch_pos is True, then pos is in reference to the entire app!
@@ -505,56 +670,26 @@ class PillarTrackingImage(Image):
             # Change pos to be in reference with the image
             # If the pos is in the image
             if self.pos_in_image(pos):
-                # Correct pos in regards to image widget
-                norm_image_x = (self.width - self.norm_image_size[0]) / 2
-                norm_image_y = (
-                    self.height - self.norm_image_size[1]
-                ) / 2 + self.ps2_window.frame_bar_layout.height
-                x, y = pos[0] - norm_image_x, pos[1] - norm_image_y
-                # Correct pos in regards to texture pixel grid!
-                x, y = int((x / self.norm_image_size[0]) * self.texture_size[0]), int(
-                    (y / self.norm_image_size[1]) * self.texture_size[1]
-                )
-                # Flip y coord!
-                y = int((y - self.texture_size[1]) * -1)
-
+                # Get the pos on the texture pixel grid
+                x, y = self.texture_pos(pos)
+                # If zoomed, correct the coords further
                 if self.zoomed:
                     x, y = x + self.crop_bbox[0], y + self.crop_bbox[1]
+                # If showing a preview, scale back up to the full image
+                else:
+                    x, y = int(x / self.image_scale), int(y / self.image_scale)
                 pos = (x, y)
             # If pos is not in the image
             else:
                 return None
-        # Get the net movement to apply to all the others
-        now_x = self.ps2_window.current_job.position_data[1][
-            self.ps2_window.current_job.current_frame - 1
-        ]
-        now_y = self.ps2_window.current_job.position_data[2][
-            self.ps2_window.current_job.current_frame - 1
-        ]
-        # Update job pos value
-        self.ps2_window.current_job.position_data[1][
-            self.ps2_window.current_job.current_frame - 1
-        ] = pos[0]
-        self.ps2_window.current_job.position_data[2][
-            self.ps2_window.current_job.current_frame - 1
-        ] = pos[1]
-        # If also updating the succeeding jobs
-        if plus_succeeding:
-            new_x, new_y = pos
-            net_x = new_x - now_x
-            net_y = new_y - now_y
-            current_index = self.ps2_window.current_job.current_frame - 1
-            # For all after the current frame
-            for i in range(
-                current_index + 1, len(self.ps2_window.current_job.position_data[1])
-            ):
-                # Apply the net movement
-                self.ps2_window.current_job.position_data[1][i] += net_x
-                self.ps2_window.current_job.position_data[2][i] += net_y
-        # remember that it was updated! (sorry Yiling)
-        self.ps2_window.current_job.updated = True
-        # Update image
-        self.update_image()
+        # Stop re-tracking (the user's change comes first)
+        self.retracker.stop()
+        # Update job pos value (and the succeeding frames if plus_succeeding)
+        self.ps2_window.current_job.update_pos(
+            self.ps2_window.current_job.current_frame,
+            pos,
+            plus_succeeding=plus_succeeding,
+        )
 
     def on_key_down(self, key, modifiers):
         """called when a key is pressed down
@@ -563,8 +698,20 @@ class PillarTrackingImage(Image):
         is_arrow_key = key == "down" or key == "up" or key == "left" or key == "right"
         # If there a current job
         if not self.ps2_window.current_job is None:
+            # If 'ctrl' + 'z' is pressed down
+            if key == "z" and "ctrl" in modifiers and not "shift" in modifiers:
+                # Undo the last position edit (stopping any re-track first)
+                self.retracker.stop()
+                if self.ps2_window.current_job.history.undo() is not None:
+                    self.update_image()
+            # If 'ctrl' + 'y' or 'ctrl' + 'shift' + 'z' is pressed down
+            elif (key == "y" or key == "z") and "ctrl" in modifiers:
+                # Redo the last undone position edit (stopping any re-track first)
+                self.retracker.stop()
+                if self.ps2_window.current_job.history.redo() is not None:
+                    self.update_image()
             # Check if the 'z' key is pressed down
-            if key == "z" and self.zoomed == False:
+            elif key == "z" and self.zoomed == False:
                 # Zoom in
                 self.zoomed = True
                 self.update_image()
@@ -622,6 +769,18 @@ class PillarTrackingImage(Image):
                 elif key == "right":
                     # Change frame +1
                     self.on_right_arrow_press()
+            # If the 'p' key is pressed down
+            elif key == "p":
+                # Toggles playback
+                self.playback.toggle()
+            # If the '-' key is pressed down
+            elif key == "-":
+                # Slows down playback
+                self.playback.change_fps(-FPS_STEP)
+            # If the '=' key is pressed down
+            elif key == "=":
+                # Speeds up playback
+                self.playback.change_fps(FPS_STEP)
         # You have to return this because it is a Kivy method
         return True
 
@@ -663,6 +822,19 @@ class PillarTrackingImage(Image):
                 # Toggles the axis overlay
                 self.axis_on = not self.axis_on
                 self.update_image()
+            # If the 'r' key is released
+            elif key == "r":
+                # Re-tracks the frames after this one (from this position)
+                self.retracker.start()
+            # If the 'w' key is released
+            elif key == "w":
+                # Toggles watching the folder for new frames
+                self.live_tracker.toggle()
+            # If the 'o' key is released
+            elif key == "o":
+                # Toggles the overview
+                self.overview_on = not self.overview_on
+                self.update_image()
             # If the 'f' key is released
             elif key == "f":
                 # Toggles the plus succeeding setting
@@ -671,7 +843,7 @@ class PillarTrackingImage(Image):
         # You have to return this because it is a Kivy method
         return True
 
-    def update_image(self, save_image=False):
+    def update_image(self, save_image=False, preview=None):
         """updates the current image on the screen
         - factors include:
             - current job (and its first image)
@@ -680,26 +852,55 @@ class PillarTrackingImage(Image):
             - centre toggle
             - circle toggle
             - zoom toggle
+            - overview toggle
             - position
-        - if save_image=True the funciton will write the image"""
+        - if save_image=True the funciton will write the image
+        - preview can be an already decoded (preview, scale) of the current frame"""
         # If there is no current job
         if self.ps2_window.current_job is None:
             # Display no texture
             self.texture = None
         else:
-            # Get the current job's first image
-            image_loc = self.ps2_window.current_job.image_locations[
-                self.ps2_window.current_job.current_frame - 1
-            ]
-            self.image = imread(image_loc)
-            # Adjust contrast if turned on
-            self.check_clarity()
-            # Add axis if turned on
-            self.check_axis()
+            # Get the current job's current image
+            frame_index = self.ps2_window.current_job.current_frame - 1
+            # The overview is drawn over the first image
+            if self.overview_on and not self.zoomed:
+                frame_index = 0
+            image_loc = self.ps2_window.current_job.image_locations[frame_index]
+            # Full resolution is only needed for zooming or saving
+            if self.zoomed or save_image:
+                self.image = self.pyramid.full(image_loc)
+                self.image_scale = 1
+            # If the preview has already been decoded (e.g. during playback)
+            elif preview is not None and not self.overview_on:
+                self.image, self.image_scale = preview
+            # Otherwise use a preview sized to fit the widget
+            else:
+                self.image, self.image_scale = self.pyramid.preview(
+                    image_loc, self.preview_size()
+                )
+                # Get the neighbouring frames ready on the worker thread
+                self.pyramid.prefetch(
+                    self.ps2_window.current_job.image_locations[
+                        max(frame_index - 1, 0) : frame_index + 3
+                    ],
+                    self.preview_size(),
+                )
+            # If zoomed in
+            if self.zoomed:
+                # Crop the image (contrast is adjusted on the crop only)
+                self.check_zoom()
+            else:
+                # Copy so the cached image isn't drawn on
+                self.image = self.image.copy()
+                # Adjust contrast if turned on
+                self.check_clarity()
+                # Add axis if turned on
+                self.check_axis()
             # Add circle centre & outside if turned on
             self.draw_point()
-            # Zoom image if turned on
-            self.check_zoom()
+            # Add the trajectory and filmstrip if turned on
+            self.check_overview()
             # If saving the image
             if save_image:
                 # Write the image as a .png
@@ -716,21 +917,15 @@ class PillarTrackingImage(Image):
         - formats the location to be in a subfolder 'captures'
         - formats the file name to include the time
         - saves as the same file type"""
-        # Find indicies for the last slash and the last dot
-        slash_index = max([image_loc.rfind("\\"), image_loc.rfind("/")])
-        dot_index = image_loc.rfind(".")
-        # Get the folder location
-        folder = image_loc[: slash_index + 1]  # 'C:/Desktop/folder/'
+        # Get the folder, file name and extension
+        # e.g. 'C:/Desktop/folder/', 'filename', '.jpg'
+        folder, filename, extension = split_image_location(image_loc)
         # Add the captures subfolder
         new_folder = folder + "captures/"  # 'C:/Desktop/folder/captures/'
-        # Get the file name
-        filename = image_loc[slash_index + 1 : dot_index]  # 'filename'
         # Format the date and time as text
         now = datetime.now()
         date_and_time = str(now.strftime("%d-%m-%y_%H-%M-%S"))
         date_extension = "_" + date_and_time
-        # Get the image extension
-        extension = image_loc[dot_index:]  #'.jpg'
         # Check if the directory exists
         if not os.path.exists(new_folder):
             # If it doesn't exist, create it
@@ -743,13 +938,28 @@ class PillarTrackingImage(Image):
     def draw_point(self):
         """draw the circle on the image
         - but only if they are enabled"""
-        centre_x = self.ps2_window.current_job.position_data[1][
-            self.ps2_window.current_job.current_frame - 1
-        ]
-        centre_y = self.ps2_window.current_job.position_data[2][
-            self.ps2_window.current_job.current_frame - 1
-        ]
+        centre_x = int(
+            self.ps2_window.current_job.position_data[1][
+                self.ps2_window.current_job.current_frame - 1
+            ]
+        )
+        centre_y = int(
+            self.ps2_window.current_job.position_data[2][
+                self.ps2_window.current_job.current_frame - 1
+            ]
+        )
         radius = self.ps2_window.current_job.radius
+        # If zoomed, move the circle onto the crop
+        if self.zoomed:
+            centre_x, centre_y = (
+                centre_x - self.crop_bbox[0],
+                centre_y - self.crop_bbox[1],
+            )
+        # If showing a preview, scale the circle down to fit
+        else:
+            centre_x = int(centre_x * self.image_scale)
+            centre_y = int(centre_y * self.image_scale)
+            radius = max(1, int(radius * self.image_scale))
         # If the x button is not down
         if not self.x_down:
             # If zoomed in the radius is 0
@@ -773,48 +983,86 @@ class PillarTrackingImage(Image):
             self.image = convertScaleAbs(self.image, alpha=alpha, beta=beta)
 
     def check_zoom(self):
-        """adjust the zoom of the image
-        - but only if it is currently enabled"""
+        """crop the full resolution image around the circle
+        - but only if zoom is currently enabled
+        - the contrast is adjusted on the crop only (not the whole image)"""
         # If zoom option is on
         if self.zoomed:
             # Use pos and size for calculations
-            centre_x = self.ps2_window.current_job.position_data[1][
-                self.ps2_window.current_job.current_frame - 1
-            ]
-            centre_y = self.ps2_window.current_job.position_data[2][
-                self.ps2_window.current_job.current_frame - 1
-            ]
+            centre_x = int(
+                self.ps2_window.current_job.position_data[1][
+                    self.ps2_window.current_job.current_frame - 1
+                ]
+            )
+            centre_y = int(
+                self.ps2_window.current_job.position_data[2][
+                    self.ps2_window.current_job.current_frame - 1
+                ]
+            )
             radius = self.ps2_window.current_job.radius
             # Make an extra gap
             extra_room = int(radius * 1.0)
             # Get zoom area
             x1, x2 = centre_x - radius - extra_room, centre_x + radius + extra_room
             y1, y2 = centre_y - radius - extra_room, centre_y + radius + extra_room
-            # Give black border
-            border_size = radius * 2
+            # Get the part of the zoom area which is within the image
+            height, width = self.image.shape[0:2]
+            in_x1, in_x2 = min(max(x1, 0), width), min(max(x2, 0), width)
+            in_y1, in_y2 = min(max(y1, 0), height), min(max(y2, 0), height)
+            # Crop that
+            self.image = self.image[in_y1:in_y2, in_x1:in_x2]
+            # Adjust contrast if turned on
+            self.check_clarity()
+            # Give black border where the zoom area is outside the image
             self.image = copyMakeBorder(
                 self.image,
-                top=border_size,
-                bottom=border_size,
-                left=border_size,
-                right=border_size,
+                top=in_y1 - y1,
+                bottom=y2 - in_y2,
+                left=in_x1 - x1,
+                right=x2 - in_x2,
                 borderType=BORDER_CONSTANT,
                 value=(0, 0, 0),
             )
-            # Crop that
-            self.image = self.image[
-                y1 + border_size : y2 + border_size, x1 + border_size : x2 + border_size
-            ]
             # Save the crop positions for later if needed
             self.crop_bbox = x1, y1, x2, y2
 
+    def check_overview(self):
+        """add the trajectory and the filmstrip
+        - but only if the overview is currently enabled"""
+        # If overview option is on and not zoomed in
+        if self.overview_on and not self.zoomed:
+            job = self.ps2_window.current_job
+            # If the filmstrip is for a different job, frames have been added since
+            # it was made (live tracking) or there is none
+            if (
+                self.filmstrip is None
+                or self.filmstrip.image_locations is not job.image_locations
+                or self.filmstrip.num_frames != len(job.image_locations)
+            ):
+                # Stop making the old one and start making a new one
+                if self.filmstrip is not None:
+                    self.filmstrip.cancel()
+                self.filmstrip = Filmstrip(job.image_locations, self.filmstrip_trigger)
+                self.filmstrip.start()
+            # Draw the whole trajectory
+            draw_trajectory(
+                self.image, job.position_data[1], job.position_data[2], self.image_scale
+            )
+            # Add the filmstrip below the image
+            height, width = self.image.shape[0:2]
+            strip = self.filmstrip.render(width, height / width, job.current_frame)
+            self.strip_top = height
+            self.image = np.vstack((self.image, strip))
+
     def check_axis(self):
         """add the axis overlay
         - but only if it is currently enabled"""
-        # If axis overlay option is on and not zoomed in
-        if self.axis_on and not self.zoomed:
-            # Use the pre calculated overlay size
-            axis_pixel_size = self.ps2_window.current_job.axis_pixel_size
+        # Use the pre calculated overlay size (scaled to the preview)
+        axis_pixel_size = int(
+            self.ps2_window.current_job.axis_pixel_size * self.image_scale
+        )
+        # If axis overlay option is on and not zoomed in (and not too small)
+        if self.axis_on and not self.zoomed and axis_pixel_size > 1:
             # Read the overlay image
             overlay = imread(AXIS_OVERLAY_LOC, 0)
             # Calculate the positions
@@ -868,6 +1116,8 @@ class PillarTrackingImage(Image):
     def on_left_arrow_press(self):
         """called when the left arrow button is pressed or Ctrl + < is pressed
         - changes the current frame by -1"""
+        # Stepping through frames stops playback
+        self.playback.stop()
         # If there are any jobs
         if self.ps2_window.current_job is not None:
             num_frames = len(self.ps2_window.current_job.image_locations)
@@ -887,6 +1137,8 @@ class PillarTrackingImage(Image):
     def on_right_arrow_press(self):
         """called when the right arrow button is pressed or Ctrl + > is pressed
         - changes the current frame by +1"""
+        # Stepping through frames stops playback
+        self.playback.stop()
         # If there are any jobs
         if self.ps2_window.current_job is not None:
             num_frames = len(self.ps2_window.current_job.image_locations)
@@ -0,0 +1,155 @@
+"""
+Module: Re-tracking the pillar from a corrected frame (PS2)
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from pillar_tracker import pillar_tracker_iter
+
+# Kivy imports
+from kivy.clock import Clock
+
+# Import modules for threading
+from threading import Thread, Event
+from queue import Queue, Empty
+
+# How often (in seconds) the re-tracked positions are added to the job
+DRAIN_INTERVAL = 0.1
+
+
+class Retracker:
+    """re-tracks the pillar from the frame after the current frame to the end
+    - the tracker is seeded with the (corrected) position of the current frame
+    - the tracker runs on a background thread (reading grayscale frames at their own
+    bit depth, like the first tracking)
+    - positions are added to the job as they are produced (undone as one edit)
+    - progress is shown in the PS2 frame bar"""
+
+    def __init__(self, image_widget):
+        """init method for Retracker"""
+        # The PS2 image widget
+        self.image_widget = image_widget
+        # Set default states
+        self.running = False
+        self.job = None  # The job being re-tracked
+        self.clock_event = None
+        self.stop_event = Event()
+        self.queue = Queue()
+        # The first frame (number) being re-tracked and how many are done
+        self.first_frame = 0
+        self.num_done = 0
+
+    def start(self):
+        """starts re-tracking the current job after its current frame"""
+        job = self.image_widget.ps2_window.current_job
+        # If there is no job or it is the last frame
+        if job is None or job.current_frame >= len(job.image_locations):
+            return
+        # Only re-track one thing at a time
+        self.stop()
+        self.job = job
+        self.running = True
+        self.first_frame = job.current_frame + 1
+        self.num_done = 0
+        # Seed with the current (corrected) position
+        seed_pos = (
+            int(job.position_data[1][job.current_frame - 1]),
+            int(job.position_data[2][job.current_frame - 1]),
+        )
+        # The tracker looks around the start point the first tracking used (IP2),
+        # even if the first frame has been moved since
+        start_point = (
+            int(job.original_position_data[1][0]),
+            int(job.original_position_data[2][0]),
+        )
+        # Start the tracker thread
+        self.stop_event = Event()
+        self.queue = Queue()
+        Thread(
+            target=self.track,
+            args=(job, start_point, seed_pos, self.stop_event, self.queue),
+            daemon=True,
+        ).start()
+        self.clock_event = Clock.schedule_interval(self.drain, DRAIN_INTERVAL)
+        self.update_status()
+
+    def stop(self):
+        """stops re-tracking (keeping the positions already re-tracked)"""
+        if not self.running:
+            return
+        self.stop_event.set()
+        # Add whatever is ready
+        self.drain()
+        # If it didn't just finish anyway
+        if self.running:
+            self.finish("Re-track stopped")
+
+    def finish(self, text):
+        """takes the text to show in the frame bar
+        - stops checking for new positions"""
+        self.running = False
+        if self.clock_event is not None:
+            self.clock_event.cancel()
+            self.clock_event = None
+        self.job = None
+        self.image_widget.ps2_window.status_label.text = text
+
+    def track(self, job, start_point, seed_pos, stop_event, queue):
+        """runs on the tracker thread
+        - puts each re-tracked (frame, x, y) into the queue
+        - puts None into the queue when finished"""
+        try:
+            for result in pillar_tracker_iter(
+                job.image_locations,
+                start_point,
+                job.radius,
+                self.first_frame,
+                seed_pos,
+            ):
+                if stop_event.is_set():
+                    return
+                queue.put(result)
+        finally:
+            queue.put(None)
+
+    def drain(self, *args):
+        """called by the clock
+        - adds the re-tracked positions which are ready to the job"""
+        if not self.running:
+            return
+        x_vals, y_vals = [], []
+        finished = False
+        while True:
+            try:
+                result = self.queue.get_nowait()
+            except Empty:
+                break
+            # None means the tracker has finished
+            if result is None:
+                finished = True
+                break
+            _, x, y = result
+            x_vals.append(x)
+            y_vals.append(y)
+        # If any positions are ready
+        if x_vals:
+            start = self.first_frame - 1 + self.num_done
+            # Every batch after the first joins the same edit (undone together)
+            self.job.history.track(start, x_vals, y_vals, merge=self.num_done > 0)
+            self.num_done += len(x_vals)
+            # Update the image if this job is showing
+            if self.job is self.image_widget.ps2_window.current_job:
+                self.image_widget.update_image()
+        if finished:
+            self.finish("Re-tracked " + str(self.num_done) + " frames")
+        else:
+            self.update_status()
+
+    def update_status(self):
+        """shows the re-tracking progress in the frame bar"""
+        num_frames = len(self.job.image_locations) - self.first_frame + 1
+        percent = int(100 * self.num_done / max(num_frames, 1))
+        self.image_widget.ps2_window.status_label.text = (
+            "Re-tracking " + str(percent) + "%"
+        )
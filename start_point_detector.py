@@ -4,10 +4,12 @@ Program: Pillar Centroid Tracker
 Author: Haig Bishop (hbi34@uclive.ac.nz)
 """
 
+# Import local modules
+from frame_source import read_gray_frame
+from pillar_tracker import calculate_alpha_beta, gray_image
+
 # Import modules for math and computer vision
 from cv2 import (
-    imread,
-    cvtColor,
     threshold,
     HoughCircles,
     getStructuringElement,
@@ -17,9 +19,7 @@ from cv2 import (
     bitwise_not,
     connectedComponentsWithStats,
     convertScaleAbs,
-    calcHist,
     CC_STAT_AREA,
-    COLOR_BGR2GRAY,
     HOUGH_GRADIENT,
     THRESH_BINARY,
     THRESH_OTSU,
@@ -33,40 +33,6 @@ import numpy as np
 from sklearn.cluster import KMeans
 
 
-def calculate_alpha_beta(image):
-    """Takes an image
-    - returns alpha and beta values to optimally fix contrast/brightness"""
-    # Automatic brightness and contrast optimisation with optional histogram clipping
-    gray = cvtColor(image, COLOR_BGR2GRAY)
-    clip_hist_percent = 1
-    # Calculate grayscale histogram
-    hist = calcHist([gray], [0], None, [256], [0, 256])
-    hist_size = len(hist)
-    # Calculate cumulative distribution from the histogram
-    accumulator = []
-    accumulator.append(float(hist[0]))
-    for index in range(1, hist_size):
-        accumulator.append(accumulator[index - 1] + float(hist[index]))
-    # Locate points to clip
-    maximum = accumulator[-1]
-    clip_hist_percent *= maximum / 100.0
-    clip_hist_percent /= 2.0
-    # Locate left cut
-    minimum_gray = 0
-    while accumulator[minimum_gray] < clip_hist_percent:
-        minimum_gray += 1
-    # Locate right cut
-    maximum_gray = hist_size - 1
-    while (
-        accumulator[maximum_gray] >= (maximum - clip_hist_percent) and maximum_gray > 10
-    ):
-        maximum_gray -= 1
-    # Calculate alpha and beta values
-    alpha = 255 / (maximum_gray - minimum_gray)
-    beta = -minimum_gray * alpha
-    return alpha, beta
-
-
 def only_2_largest(img):
     """Takes a binary image
     - finds all white pixel clusters
@@ -123,8 +89,8 @@ def detect_channel_sides(img):
     - removes all white pixel clusters except 2 largest
     - finds the x coords of those two largest clusters
     - returns the two integers"""
-    # Convert the image to grayscale
-    gray_img = cvtColor(img, COLOR_BGR2GRAY)
+    # Convert the image to grayscale (if not already)
+    gray_img = gray_image(img)
     # Apply a threshold to the image (creates a binary image)
     _, binary_img = threshold(gray_img, 0, 255, THRESH_BINARY + THRESH_OTSU)
     # Create a 3x3 square structuring element
@@ -253,8 +219,8 @@ def bounded_hough_circle(original_image, bbox, min_r, max_r):
     - after Hough returns 1 or more circles, the 'best' one is picked"""
     # Blur the image
     blur_image = GaussianBlur(original_image, (9, 9), 0)
-    # Convert the image to grayscale for processing
-    gray_image = cvtColor(blur_image, COLOR_BGR2GRAY)
+    # Convert the image to grayscale for processing (if not already)
+    gray_blur_image = gray_image(blur_image)
     # Define starting thresholds
     thres_1 = 150
     thres_2 = 120
@@ -270,7 +236,7 @@ def bounded_hough_circle(original_image, bbox, min_r, max_r):
         i += 1
         # Attempt to detect circles in the grayscale image.
         circles = HoughCircles(
-            gray_image,
+            gray_blur_image,
             HOUGH_GRADIENT,
             2,
             min_dist,
@@ -322,9 +288,9 @@ def get_pillar_size_pos_range(sides, image_shape):
 
 def start_point_detector(image_loc, bbox=None):
     """takes an image location, and maybe a bounding box (x, y, x2, y2)"""
-    # Get the original image
-    original_image = imread(image_loc)
-    # auto adjust contrast and brightness
+    # Get the original image (grayscale, at its own bit depth)
+    original_image = read_gray_frame(image_loc)
+    # auto adjust contrast and brightness (this makes it 8-bit)
     alpha, beta = calculate_alpha_beta(original_image)
     original_image = convertScaleAbs(original_image, alpha=alpha, beta=beta)
     # Predict sides of channel
@@ -0,0 +1,189 @@
+"""
+Module: Loading position/force files (.csv/.xml) into columns
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from file_management import detect_encoding, iter_detections
+from binary_format import fresh_binary_location, read_binary_columns
+
+# Import numpy
+import numpy as np
+
+# Import modules for dealing with files
+from collections import OrderedDict
+from itertools import zip_longest
+from array import array
+import csv
+import os
+
+# The number of loaded files kept in memory
+TABLE_CACHE_SIZE = 8
+# Loaded files: file location -> ((modified time, size), table)
+TABLE_CACHE = OrderedDict()
+
+
+class Table:
+    """the columns of a position/force file
+    - a column of numbers is a float64 numpy array
+    - any other column is a numpy array of strings (so the invalid values can be
+    found and shown to the user)
+    - columns are selected by their index in the header"""
+
+    def __init__(self, columns):
+        """init method for Table"""
+        self.columns = columns
+
+    def column(self, index):
+        """takes a column index
+        - returns that column (empty if there is no such column)"""
+        if index is None or not 0 <= index < len(self.columns):
+            return np.array([], dtype=np.float64)
+        return self.columns[index]
+
+    def num_rows(self):
+        """returns the number of rows in the table"""
+        return max((len(column) for column in self.columns), default=0)
+
+
+def typed_column(values):
+    """takes a list of strings
+    - returns a float64 array if they are all numbers
+    - otherwise returns an array of the strings"""
+    try:
+        return np.array(values, dtype=np.float64)
+    except (ValueError, TypeError):
+        return np.array(values, dtype=str)
+
+
+def first_invalid_value(*columns):
+    """takes any number of columns
+    - returns the first value which is not a finite number
+    (float accepts 'nan' and 'inf', but they aren't valid positions/forces)
+    - returns None if they are all finite numbers"""
+    for column in columns:
+        # Columns of numbers are valid if they are all finite
+        if column.dtype == np.float64:
+            not_finite = np.flatnonzero(~np.isfinite(column))
+            if len(not_finite) > 0:
+                return column[not_finite[0]]
+            continue
+        for value in column:
+            try:
+                # Try convert to float
+                if not np.isfinite(float(value)):
+                    return value
+            except ValueError:
+                # Invalid float
+                return value
+    return None
+
+
+def load_table(file_location):
+    """takes the location of a .csv, .xml or .npz file
+    - returns the file's columns as a Table
+    - each file is only read once (unless it is modified)"""
+    # If the file doesn't exist, there are no columns
+    if not os.path.exists(file_location):
+        return Table([])
+    stat = os.stat(file_location)
+    file_key = (stat.st_mtime, stat.st_size)
+    # If this file has already been loaded
+    cached = TABLE_CACHE.get(file_location)
+    if cached is not None and cached[0] == file_key:
+        # Mark it as recently used and return it
+        TABLE_CACHE.move_to_end(file_location)
+        return cached[1]
+    # Otherwise load it (from the binary copy of a .csv if there is one)
+    binary_loc = fresh_binary_location(file_location)
+    if binary_loc is not None:
+        table = Table(read_binary_columns(binary_loc)[1])
+    elif file_location[-4:] == ".csv":
+        table = read_csv_table(file_location)
+    elif file_location[-4:] == ".xml":
+        table = read_xml_table(file_location)
+    else:
+        table = Table([])
+    # Remember it (forgetting the oldest if there are too many)
+    TABLE_CACHE[file_location] = (file_key, table)
+    while len(TABLE_CACHE) > TABLE_CACHE_SIZE:
+        TABLE_CACHE.popitem(last=False)
+    return table
+
+
+def read_csv_table(file_location):
+    """takes the location of a .csv file
+    - reads every row (after the header) once and returns a Table
+    - each row goes straight into the columns (see ColumnBuilder), so the whole
+    file is never held as rows of strings"""
+    encoding = detect_encoding(file_location)
+    builders = []
+    num_rows = 0
+    with open(file_location, newline="", encoding=encoding) as csv_file:
+        reader = csv.reader(csv_file)
+        next(reader, None)  # Skip header row
+        for row in reader:
+            # Skip blank rows
+            if not row:
+                continue
+            # A longer row adds columns (empty in the rows before it)
+            while len(builders) < len(row):
+                builders.append(ColumnBuilder(num_missing=num_rows))
+            # Missing cells are empty
+            for builder, text in zip_longest(builders, row, fillvalue=""):
+                builder.append(text)
+            num_rows += 1
+    return Table([builder.column() for builder in builders])
+
+
+class ColumnBuilder:
+    """builds a column one value (string) at a time
+    - values are kept as floats until one isn't a number
+    - after that they are kept as strings"""
+
+    def __init__(self, num_missing=0):
+        """init method for ColumnBuilder"""
+        # Rows before this column appeared are empty
+        self.values = ["" for _ in range(num_missing)]
+        self.numbers = array("d") if num_missing == 0 else None
+
+    def append(self, text):
+        """takes a string and adds it to the column"""
+        if self.numbers is not None:
+            try:
+                self.numbers.append(float(text))
+                return
+            except ValueError:
+                # Not a number, so keep everything as strings from now on
+                self.values = [repr(number) for number in self.numbers]
+                self.numbers = None
+        self.values.append(text)
+
+    def column(self):
+        """returns the finished column (see typed_column)"""
+        if self.numbers is not None:
+            return np.frombuffer(self.numbers, dtype=np.float64)
+        return typed_column(self.values)
+
+
+def read_xml_table(file_location, names=None):
+    """takes the location of a .xml file (TrackMate format)
+    - streams every 'detection' element once and returns a Table
+    - the columns are in the same order as the header (see file_header)
+    - if names are given only those attributes are read"""
+    builders = OrderedDict()
+    if names is not None:
+        for name in names:
+            builders[name] = ColumnBuilder()
+    num_rows = 0
+    for detection in iter_detections(file_location, names):
+        # The columns are the attributes of the first detection (like the header)
+        # plus any new attributes in later detections (after those)
+        for name in detection:
+            if name not in builders:
+                builders[name] = ColumnBuilder(num_missing=num_rows)
+        for name, builder in builders.items():
+            builder.append(detection.get(name, ""))
+        num_rows += 1
+    return Table([builder.column() for builder in builders.values()])
@@ -0,0 +1,70 @@
+"""
+Module: Checks that force conversion rounds like the original (list based) version
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from force_conversion import force_convert, force_file_blocks, round_values
+
+# Mathematical imports
+import numpy as np
+
+# Import modules for making a stand-in PF1 job
+from types import SimpleNamespace
+
+# A frame rate as typed into PF1, where np.round and round disagree (e.g. 1/40 s)
+TIME_BASE = float("40")
+NUM_FRAMES = 100000
+
+
+def baseline_times(num_frames, time_base):
+    """takes a number of frames and the frame rate
+    - returns the time values exactly as the original version wrote them"""
+    return [round((f - 1) / time_base, 2) for f in range(1, num_frames + 1)]
+
+
+def test_round_values_matches_round():
+    """round_values gives the same floats as Python's round"""
+    rng = np.random.default_rng(0)
+    values = np.concatenate(
+        [np.arange(NUM_FRAMES) / TIME_BASE, rng.normal(0, 50, NUM_FRAMES)]
+    )
+    for places in (1, 2):
+        expected = np.array([round(value, places) for value in values.tolist()])
+        assert round_values(values, places).tobytes() == expected.tobytes()
+
+
+def test_force_convert_times_match_baseline():
+    """the time column of force_convert is the same as the original byte for byte"""
+    frame_nums = list(range(1, NUM_FRAMES + 1))
+    x_vals = [100.0] * NUM_FRAMES
+    y_vals = [100.0] * NUM_FRAMES
+    t_vals = np.arange(NUM_FRAMES) / TIME_BASE
+    results = force_convert(
+        frame_nums, 10.0, 20.0, 5.0, x_vals, y_vals, t_vals, 1.0, 1.5, 0.49
+    )
+    expected = np.array(baseline_times(NUM_FRAMES, TIME_BASE))
+    assert np.array(results[1]).tobytes() == expected.tobytes()
+
+
+def test_force_file_blocks_times_match_baseline():
+    """the time column written a block at a time is the same as the original"""
+    job = SimpleNamespace(
+        pillar_diameter=10.0,
+        pillar_height=20.0,
+        pillar_contact=5.0,
+        pdms_E=1.5,
+        pdms_gama=0.49,
+        pixel_micron_ratio=1.0,
+        time_base=TIME_BASE,
+        filter_type="None",
+        filter_size=5,
+        x_vals=[100.0] * NUM_FRAMES,
+        y_vals=[100.0] * NUM_FRAMES,
+    )
+    expected = np.array(baseline_times(NUM_FRAMES, TIME_BASE))
+    for block_size in (4096, NUM_FRAMES):
+        blocks = force_file_blocks(job, block_size=block_size)
+        t_vals = np.concatenate([columns[1] for columns in blocks])
+        assert t_vals.tobytes() == expected.tobytes()
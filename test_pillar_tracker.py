@@ -0,0 +1,69 @@
+"""
+Module: Checks that deeper (10 and 12-bit) images track like 8-bit images
+Program: Pillar Centroid Tracker
+Author: Haig Bishop (hbi34@uclive.ac.nz)
+"""
+
+# Import local modules
+from pillar_tracker import pillar_tracker
+
+# Mathematical imports
+import numpy as np
+
+# Import modules for computer vision
+from cv2 import circle, imwrite
+
+# The synthetic pillar (its start, radius and movement) and image size
+START_POINT = (100, 100)
+RADIUS = 15
+NUM_FRAMES = 12
+IMAGE_SIZE = 200
+# Gray levels of the 8-bit frames (a dim camera which never reaches 255)
+BACKGROUND = 150
+PILLAR = 20
+
+
+def pillar_frames():
+    """returns 8-bit frames of a dark pillar moving right then down"""
+    frames = []
+    for frame in range(NUM_FRAMES):
+        image = np.full((IMAGE_SIZE, IMAGE_SIZE), BACKGROUND, dtype=np.uint8)
+        centre = (
+            START_POINT[0] + min(frame, NUM_FRAMES // 2),
+            START_POINT[1] + max(frame - NUM_FRAMES // 2, 0),
+        )
+        circle(image, centre, RADIUS, PILLAR, -1)
+        frames.append(image)
+    return frames
+
+
+def write_frames(folder, frames, scale, dtype):
+    """takes a folder, 8-bit frames, a scale and a dtype
+    - saves the scaled frames as PNGs
+    - returns their locations"""
+    image_locs = []
+    for index, frame in enumerate(frames):
+        image_loc = str(folder / ("frame_" + str(index) + ".png"))
+        imwrite(image_loc, (frame.astype(np.uint32) * scale).astype(dtype))
+        image_locs.append(image_loc)
+    return image_locs
+
+
+def test_deep_images_track_like_8_bit(tmp_path):
+    """10-bit and 12-bit frames give the same positions as the 8-bit frames"""
+    frames = pillar_frames()
+    results = {}
+    for name, scale, dtype in (
+        ("8-bit", 1, np.uint8),
+        ("10-bit", 4, np.uint16),
+        ("12-bit", 16, np.uint16),
+    ):
+        folder = tmp_path / name
+        folder.mkdir()
+        image_locs = write_frames(folder, frames, scale, dtype)
+        results[name] = pillar_tracker(image_locs, START_POINT, RADIUS)
+    # The 8-bit pillar must actually move for the comparison to mean anything
+    assert results["8-bit"][1][-1] != START_POINT[0]
+    assert results["8-bit"][2][-1] != START_POINT[1]
+    assert results["10-bit"] == results["8-bit"]
+    assert results["12-bit"] == results["8-bit"]